@@ -0,0 +1,388 @@
+"""
+Offline batch evaluation of the voice pipeline
+
+Runs every recorded utterance under a directory through the agent's own STT,
+LLM (with its tools) and TTS, as configured by .env / the environment, and
+writes what each stage produced next to how long it took. Utterances are
+spread over --processes worker processes; calls to each backend are limited
+across all of them by --stt-concurrency, --llm-concurrency,
+--tts-concurrency and --tool-concurrency, so a large pool does not overrun a
+single GPU server.
+
+    python backend/bench/batch_eval.py questions/ --output eval/prompt-v2
+    python backend/bench/batch_eval.py questions/ --output eval/qwen --processes 16 --llm-concurrency 8
+    python backend/bench/batch_eval.py questions/ --output /tmp/eval --stubs --tool-rate 0.3
+
+Any audio file PyAV can decode is an utterance. Its language is the name of
+the closest parent directory called "en" or "fa", --language otherwise. For
+questions/fa/q01.wav the output holds fa/q01.json (transcript, reply, tool
+calls and result, spoken answer, timings in seconds) and fa/q01.wav (the
+synthesized reply), plus results.jsonl and summary.json for the whole run.
+A tool call is answered the way the agent does it: the tool runs and its
+result is sent back to the LLM for the spoken answer. --stubs runs against
+pipeline_stub_servers.py instead of the configured backends.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import wave
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+import av
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from livekit.agents import llm  # noqa: E402
+
+import pipeline_stub_servers  # noqa: E402
+from bench_codecs import to_frames  # noqa: E402
+from bench_stt_load import percentiles  # noqa: E402
+
+
+AUDIO_SUFFIXES = {".wav", ".flac", ".mp3", ".ogg", ".opus", ".m4a", ".webm"}
+DECODE_SAMPLE_RATE = 16000
+STAGES = ("stt", "llm_ttft", "llm", "tool", "answer_ttft", "answer", "tts_ttfb", "tts", "total")
+
+# Per worker process, set up by init_worker
+_worker: Optional[SimpleNamespace] = None
+
+
+def find_utterances(root: Path, language: str) -> list[tuple[Path, str]]:
+    """Audio files under `root` with the language of their closest en/fa directory"""
+    utterances = []
+    for path in sorted(root.rglob("*")):
+        if path.suffix.lower() not in AUDIO_SUFFIXES or not path.is_file():
+            continue
+        parents = [part for part in path.relative_to(root).parts[:-1] if part in ("en", "fa")]
+        utterances.append((path, parents[-1] if parents else language))
+    return utterances
+
+
+def decode_audio(path: Path) -> np.ndarray:
+    """Mono int16 samples at DECODE_SAMPLE_RATE"""
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=DECODE_SAMPLE_RATE)
+    chunks = []
+    with av.open(str(path)) as container:
+        for frame in container.decode(audio=0):
+            chunks.extend(resampled.to_ndarray().reshape(-1) for resampled in resampler.resample(frame))
+        chunks.extend(resampled.to_ndarray().reshape(-1) for resampled in resampler.resample(None))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+
+
+def write_wav(path: Path, pcm: bytes, sample_rate: int) -> None:
+    with wave.open(str(path), "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+
+
+def init_worker(limits: dict, output: str) -> None:
+    """Build the agent's LLM, STT and TTS factories once per worker process"""
+    global _worker
+    logging.basicConfig(level=logging.CRITICAL)
+    # agent_new reads its configuration when imported, the parent has set it up
+    import agent_new
+
+    proc = SimpleNamespace(userdata={})
+    agent_new.prewarm(proc)
+    _worker = SimpleNamespace(
+        agent=agent_new,
+        proc=proc,
+        limits=limits,
+        output=Path(output),
+        loop=asyncio.new_event_loop(),
+        stt={},
+        tts={},
+    )
+
+
+@contextlib.asynccontextmanager
+async def limit(backend: str):
+    """Hold one of the pool-wide slots of a backend"""
+    semaphore = _worker.limits[backend]
+    await asyncio.to_thread(semaphore.acquire)
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def evaluate_file(path: str, relative: str, language: str) -> dict:
+    """Worker entry point, evaluates one utterance on the worker's event loop"""
+    return _worker.loop.run_until_complete(evaluate(Path(path), Path(relative), language))
+
+
+async def complete(chat_ctx: llm.ChatContext, tools: list, timings: dict, stage: str) -> tuple[str, list]:
+    """Stream one LLM reply, returning its text and native tool calls"""
+    started = time.perf_counter()
+    text, calls = [], []
+    async with limit("llm"):
+        async with _worker.proc.userdata["llm"].chat(chat_ctx=chat_ctx, tools=tools) as stream:
+            async for chunk in stream:
+                if chunk.delta is None:
+                    continue
+                if f"{stage}_ttft" not in timings and (chunk.delta.content or chunk.delta.tool_calls):
+                    timings[f"{stage}_ttft"] = time.perf_counter() - started
+                text.append(chunk.delta.content or "")
+                calls.extend(chunk.delta.tool_calls or [])
+    timings[stage] = time.perf_counter() - started
+    return "".join(text), calls
+
+
+async def run_native_tool(call: llm.FunctionToolCall) -> str:
+    func = _worker.agent.TOOL_REGISTRY.get(call.name)
+    if func is None:
+        return f"Unknown function: {call.name}"
+    result = func(**json.loads(call.arguments or "{}"))
+    if inspect.isawaitable(result):
+        result = await result
+    return str(result)
+
+
+async def synthesize(language: str, texts: list[str], timings: dict) -> tuple[bytes, int]:
+    """Synthesize the spoken parts of the reply one after the other, as the session does"""
+    if language not in _worker.tts:
+        _worker.tts[language] = _worker.proc.userdata["tts_factory"][language]()
+    engine = _worker.tts[language]
+    pcm = bytearray()
+    started = time.perf_counter()
+    for text in texts:
+        async with limit("tts"):
+            async with engine.synthesize(text) as stream:
+                async for audio in stream:
+                    if "tts_ttfb" not in timings:
+                        timings["tts_ttfb"] = time.perf_counter() - started
+                    pcm += audio.frame.data
+    timings["tts"] = time.perf_counter() - started
+    return bytes(pcm), engine.sample_rate
+
+
+async def evaluate(path: Path, relative: Path, language: str) -> dict:
+    agent = _worker.agent
+    target = _worker.output / relative.with_suffix("")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    timings: dict = {}
+    result = {"file": str(relative), "language": language, "status": "ok", "timings": timings}
+    started = time.perf_counter()
+    try:
+        samples = decode_audio(path)
+        result["duration"] = round(len(samples) / DECODE_SAMPLE_RATE, 3)
+
+        if language not in _worker.stt:
+            _worker.stt[language] = _worker.proc.userdata["stt_factory"](language)
+        stage_started = time.perf_counter()
+        async with limit("stt"):
+            event = await _worker.stt[language].recognize(to_frames(samples, DECODE_SAMPLE_RATE, 1), language=language)
+        timings["stt"] = time.perf_counter() - stage_started
+        transcript = event.alternatives[0].text.strip() if event.alternatives else ""
+        result["transcript"] = transcript
+        if not transcript:
+            # The STT gate drops noise and hallucinations, the session would not reply either
+            result["status"] = "no_speech"
+            return result
+
+        prompt = agent.SYSTEM_PROMPT_PERSIAN if language == "fa" else agent.SYSTEM_PROMPT_ENGLISH
+        tools = [agent.search_and_respond]
+        chat_ctx = llm.ChatContext()
+        chat_ctx.add_message(role="system", content=prompt)
+        chat_ctx.add_message(role="user", content=transcript)
+        reply, calls = await complete(chat_ctx, tools, timings, "llm")
+        result["reply"] = reply
+
+        # What the session speaks of a reply that calls a tool is the text before the call
+        spoken = [reply.split("$tool_calls", 1)[0].strip()]
+        tool_result = None
+        stage_started = time.perf_counter()
+        if "$tool_calls" in reply:
+            match = agent.TOOL_CALL_PATTERN.search(reply)
+            try:
+                result["tool_calls"] = json.loads(match.group(1)) if match else None
+            except json.JSONDecodeError:
+                result["tool_calls"] = match.group(1)
+            async with limit("tool"):
+                tool_result = await agent.parse_and_execute_tool_calls(reply)
+            timings["tool"] = time.perf_counter() - stage_started
+            if tool_result:
+                chat_ctx.add_message(role="assistant", content=reply)
+                chat_ctx.add_message(role="user", content=tool_result)
+        elif calls:
+            result["tool_calls"] = [{"function": call.name, "args": json.loads(call.arguments or "{}")} for call in calls]
+            outputs = []
+            async with limit("tool"):
+                for call in calls:
+                    outputs.append(await run_native_tool(call))
+            timings["tool"] = time.perf_counter() - stage_started
+            tool_result = "\n".join(outputs)
+            for call, output in zip(calls, outputs):
+                chat_ctx.items.append(llm.FunctionCall(call_id=call.call_id, name=call.name, arguments=call.arguments))
+                chat_ctx.items.append(llm.FunctionCallOutput(call_id=call.call_id, name=call.name, output=output, is_error=False))
+
+        if tool_result:
+            result["tool_result"] = tool_result
+            answer, _ = await complete(chat_ctx, tools, timings, "answer")
+            result["answer"] = answer
+            spoken.append(answer.split("$tool_calls", 1)[0].strip())
+
+        spoken = [text for text in spoken if text]
+        if spoken:
+            pcm, sample_rate = await synthesize(language, spoken, timings)
+            write_wav(target.with_suffix(".wav"), pcm, sample_rate)
+            result["audio"] = str(relative.with_suffix(".wav"))
+            result["audio_duration"] = round(len(pcm) / 2 / sample_rate, 3)
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        timings["total"] = time.perf_counter() - started
+        for stage, value in timings.items():
+            timings[stage] = round(value, 4)
+        target.with_suffix(".json").write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    return result
+
+
+def summarize(results: list[dict], wall: float, args: argparse.Namespace) -> dict:
+    import prompts
+
+    summary = {
+        "utterances": len(results),
+        "wall": round(wall, 3),
+        "status": {status: sum(r["status"] == status for r in results) for status in ("ok", "no_speech", "error")},
+        "tool_turns": sum("tool_calls" in r for r in results),
+        "llm_model": os.getenv("LLM_MODEL"),
+        # Tells apart runs of different prompts.py revisions
+        "prompt_sha1": {
+            "en": hashlib.sha1(prompts.SYSTEM_PROMPT_ENGLISH.encode()).hexdigest()[:12],
+            "fa": hashlib.sha1(prompts.SYSTEM_PROMPT_PERSIAN.encode()).hexdigest()[:12],
+        },
+        "processes": args.processes,
+        "stages": {},
+    }
+    for stage in STAGES:
+        values = [r["timings"][stage] for r in results if stage in r["timings"]]
+        if values:
+            p50, p95, peak = percentiles(values, (50, 95, 100))
+            summary["stages"][stage] = {"count": len(values), "p50": round(p50, 4), "p95": round(p95, 4), "max": round(peak, 4)}
+    return summary
+
+
+def print_summary(summary: dict) -> None:
+    status = summary["status"]
+    print(
+        f"\n{summary['utterances']} utterances in {summary['wall']:.1f} s: {status['ok']} ok, "
+        f"{status['no_speech']} no speech, {status['error']} failed, {summary['tool_turns']} with tool calls"
+    )
+    print(f"{'stage':>12} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for stage, values in summary["stages"].items():
+        print(
+            f"{stage:>12} {values['count']:>6} {values['p50'] * 1000:>8.0f} "
+            f"{values['p95'] * 1000:>8.0f} {values['max'] * 1000:>8.0f}"
+        )
+
+
+def run(args: argparse.Namespace, utterances: list[tuple[Path, str]]) -> list[dict]:
+    context = multiprocessing.get_context("spawn")
+    limits = {
+        "stt": context.BoundedSemaphore(args.stt_concurrency),
+        "llm": context.BoundedSemaphore(args.llm_concurrency),
+        "tts": context.BoundedSemaphore(args.tts_concurrency),
+        "tool": context.BoundedSemaphore(args.tool_concurrency),
+    }
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=args.processes,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(limits, str(args.output)),
+    ) as pool:
+        futures = {
+            pool.submit(evaluate_file, str(path), str(path.relative_to(args.directory)), language): path
+            for path, language in utterances
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            detail = result.get("error") or result.get("transcript", "")
+            print(
+                f"[{done}/{len(futures)}] {result['file']} {result['status']} "
+                f"{result['timings'].get('total', 0):.2f} s  {detail[:60]}",
+                flush=True,
+            )
+    return sorted(results, key=lambda r: r["file"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", type=Path, help="directory of recorded utterances, searched recursively")
+    parser.add_argument("--output", type=Path, required=True, help="directory the results are written to")
+    parser.add_argument("--language", choices=["en", "fa"], default=os.getenv("LANGUAGE", "en"),
+                        help="language of utterances outside an en/ or fa/ directory")
+    parser.add_argument("--processes", type=int, default=min(8, os.cpu_count() or 1), help="worker processes")
+    parser.add_argument("--stt-concurrency", type=int, default=2, help="transcriptions in flight across all workers")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="LLM completions in flight across all workers")
+    parser.add_argument("--tts-concurrency", type=int, default=2, help="syntheses in flight across all workers")
+    parser.add_argument("--tool-concurrency", type=int, default=2, help="tool calls in flight across all workers")
+    parser.add_argument("--skip-existing", action="store_true", help="keep utterances that already have results")
+    parser.add_argument("--stubs", action="store_true", help="run against pipeline_stub_servers.py")
+    pipeline_stub_servers.add_arguments(parser)
+    args = parser.parse_args()
+
+    utterances = find_utterances(args.directory, args.language)
+    previous = []
+    if args.skip_existing:
+        pending = []
+        for path, language in utterances:
+            existing = (args.output / path.relative_to(args.directory)).with_suffix(".json")
+            if existing.exists():
+                previous.append(json.loads(existing.read_text()))
+            else:
+                pending.append((path, language))
+        utterances = pending
+    if not utterances and not previous:
+        raise SystemExit(f"no utterances to evaluate under {args.directory}")
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    process = None
+    if args.stubs:
+        from bench_e2e_latency import start_stubs, wait_ready
+
+        process, urls = start_stubs(args)
+        asyncio.run(wait_ready(urls))
+        # The spawned workers inherit the environment
+        os.environ.update(urls)
+        os.environ.setdefault("LLM_MODEL", "stub")
+        os.environ.setdefault("KOKORO_DEFAULT_VOICE", "af_heart")
+        os.environ.setdefault("KOKORO_DEFAULT_SPEED", "1.0")
+    try:
+        started = time.perf_counter()
+        results = run(args, utterances) if utterances else []
+        wall = time.perf_counter() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    results = sorted(previous + results, key=lambda r: r["file"])
+    with open(args.output / "results.jsonl", "w") as results_file:
+        for result in results:
+            results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+    summary = summarize(results, wall, args)
+    (args.output / "summary.json").write_text(json.dumps(summary, indent=2))
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
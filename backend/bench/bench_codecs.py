@@ -0,0 +1,107 @@
+"""
+Upload codec benchmark for WhisperEndpointSTT
+
+Reports the bytes each upload codec puts on the wire and the encode cost per
+second of audio. Uses a WAV file when given, otherwise a synthetic
+speech-like signal.
+
+    python backend/bench/bench_codecs.py --duration 10 --sample-rate 48000
+    python backend/bench/bench_codecs.py --wav visitor_question.wav
+"""
+import argparse
+import asyncio
+import sys
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from livekit import rtc  # noqa: E402
+
+from plugins.audio_codecs import UPLOAD_CODECS, iter_encoded  # noqa: E402
+from plugins.audio_utils import PcmAudio  # noqa: E402
+
+
+def synthetic_speech(duration: float, sample_rate: int) -> np.ndarray:
+    """Voiced harmonics with a syllable-rate envelope and a little noise."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 2
+    signal = voiced * envelope + 0.02 * rng.standard_normal(len(t))
+    return (signal / np.abs(signal).max() * 12000).astype(np.int16)
+
+
+def load_wav(path: str) -> tuple[np.ndarray, int, int]:
+    with wave.open(path, "rb") as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise SystemExit("only 16-bit PCM WAV files are supported")
+        samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+        return samples, wav_file.getframerate(), wav_file.getnchannels()
+
+
+def to_frames(samples: np.ndarray, sample_rate: int, num_channels: int) -> list[rtc.AudioFrame]:
+    """Split into 10 ms frames like LiveKit delivers them."""
+    step = sample_rate // 100 * num_channels
+    return [
+        rtc.AudioFrame(
+            data=samples[i:i + step].tobytes(),
+            sample_rate=sample_rate,
+            num_channels=num_channels,
+            samples_per_channel=len(samples[i:i + step]) // num_channels,
+        )
+        for i in range(0, len(samples) - step + 1, step)
+    ]
+
+
+async def measure(audio: PcmAudio, codec_name: str, bitrate: int, repeat: int) -> tuple[int, float, float]:
+    """Return wire bytes, CPU seconds and wall seconds of one encode."""
+    codec = UPLOAD_CODECS[codec_name]
+    cpu = wall = 0.0
+    total = 0
+    for _ in range(repeat):
+        total = 0
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        async for chunk in iter_encoded(audio, codec, bitrate=bitrate):
+            total += len(chunk)
+        cpu += time.process_time() - cpu_start
+        wall += time.perf_counter() - wall_start
+    return total, cpu / repeat, wall / repeat
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wav", help="16-bit PCM WAV file to encode")
+    parser.add_argument("--duration", type=float, default=10.0, help="synthetic audio length in seconds")
+    parser.add_argument("--sample-rate", type=int, default=16000, help="synthetic audio sample rate")
+    parser.add_argument("--bitrate", type=int, default=24000, help="opus bitrate in bits per second")
+    parser.add_argument("--repeat", type=int, default=5, help="encodes per codec")
+    args = parser.parse_args()
+
+    if args.wav:
+        samples, sample_rate, num_channels = load_wav(args.wav)
+    else:
+        samples, sample_rate, num_channels = synthetic_speech(args.duration, args.sample_rate), args.sample_rate, 1
+
+    audio = PcmAudio.from_buffer(to_frames(samples, sample_rate, num_channels))
+    print(f"audio: {audio.duration:.2f}s @ {sample_rate} Hz, {num_channels} ch, {len(audio.chunks)} frames")
+    print(f"{'codec':<6} {'bytes':>10} {'vs wav':>7} {'kbit/s':>8} {'cpu ms/s':>9} {'wall ms/s':>10}")
+
+    wav_bytes = None
+    for codec_name in UPLOAD_CODECS:
+        total, cpu, wall = await measure(audio, codec_name, args.bitrate, args.repeat)
+        wav_bytes = wav_bytes or total
+        print(
+            f"{codec_name:<6} {total:>10} {total / wav_bytes:>7.1%} "
+            f"{total * 8 / audio.duration / 1000:>8.1f} "
+            f"{cpu / audio.duration * 1000:>9.2f} {wall / audio.duration * 1000:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
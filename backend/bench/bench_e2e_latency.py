@@ -0,0 +1,469 @@
+"""
+End-to-end voice-to-voice latency benchmark
+
+Builds the agent's real sessions with agent_new.prewarm and
+agent_new.create_session (VAD wrappers, WhisperEndpointSTT, the
+OpenAI-compatible LLM, Kokoro/Piper behind LanguageSwitchingTTS and the
+`$tool_calls` path) and points them at the stand-ins of
+pipeline_stub_servers.py, started in a separate process. The LiveKit room and
+the Simli avatar are replaced by a scripted microphone, which plays silence
+and utterances in real time, and a speaker that plays the agent's audio in
+real time.
+
+Each turn is measured from the end of the user's speech (the last speech frame
+given to the session, or the moment a text turn is sent) to the first audio
+frame reaching the speaker, and broken down with the session's metrics:
+end of utterance (VAD silence + transcription), STT, LLM time to first token
+and TTS time to first byte. Turns answered through a tool also report the tool
+round trip and the time to the first audio of the answer. Every concurrency
+level starts fresh sessions in this process, as one worker hosting that many rooms.
+
+    python backend/bench/bench_e2e_latency.py --sessions 1,4,8 --turns 5
+    python backend/bench/bench_e2e_latency.py --input text --language fa --tool-rate 0.5
+    python backend/bench/bench_e2e_latency.py --wav question1.wav --wav question2.wav --output turns.json
+
+Other settings come from the environment like for the agent, e.g.
+WHISPER_STREAMING=true or VAD_MIN_SILENCE_DURATION=0.5.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+import aiohttp
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from livekit import rtc  # noqa: E402
+from livekit.agents import AgentSession, metrics  # noqa: E402
+from livekit.agents.voice import io  # noqa: E402
+
+import pipeline_stub_servers  # noqa: E402
+from bench_codecs import load_wav, synthetic_speech, to_frames  # noqa: E402
+from bench_stt_load import monitor_loop_lag, percentiles  # noqa: E402
+from plugins.audio_utils import PcmAudio, resample_audio  # noqa: E402
+from whisper_stub_server import WORDS  # noqa: E402
+
+
+FRAME_DURATION = 0.01
+
+
+@dataclass
+class TurnResult:
+    """Timings of one user turn, in seconds from the end of the user's speech."""
+    session: int
+    kind: str
+    first_audio: Optional[float] = None
+    end_of_utterance: Optional[float] = None
+    transcription: Optional[float] = None
+    stt: Optional[float] = None
+    llm_ttft: Optional[float] = None
+    tts_ttfb: Optional[float] = None
+    tool: Optional[float] = None
+    answer_audio: Optional[float] = None
+    # Wall clock times used while the turn is running
+    ended: float = 0.0
+    tool_started: Optional[float] = None
+    tool_pending: bool = False
+
+
+@dataclass
+class LevelResult:
+    """Turns of all sessions at one concurrency level."""
+    sessions: int
+    turns: list[TurnResult] = field(default_factory=list)
+    timeouts: int = 0
+    loop_lag: list[float] = field(default_factory=list)
+
+
+class ScriptedMicrophone(io.AudioInput):
+    """Microphone stand-in, plays low noise and queued utterances in real time"""
+
+    def __init__(self, sample_rate: int, noise_db: float, seed: int) -> None:
+        super().__init__(label="ScriptedMicrophone")
+        self._sample_rate = sample_rate
+        self._samples_per_frame = int(sample_rate * FRAME_DURATION)
+        self._noise_std = 32768 * 10 ** (noise_db / 20)
+        self._rng = np.random.default_rng(seed)
+        self._queued: deque[rtc.AudioFrame] = deque()
+        self._ended: Optional[asyncio.Future] = None
+        self._next_frame_at: Optional[float] = None
+
+    def say(self, frames: list[rtc.AudioFrame]) -> asyncio.Future:
+        """Queue an utterance, the future resolves with the wall clock time its last frame was played."""
+        self._queued.extend(frames)
+        self._ended = asyncio.get_running_loop().create_future()
+        return self._ended
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        now = time.perf_counter()
+        if self._next_frame_at is None:
+            self._next_frame_at = now
+        await asyncio.sleep(max(0.0, self._next_frame_at - now))
+        self._next_frame_at += FRAME_DURATION
+
+        if self._queued:
+            frame = self._queued.popleft()
+            if not self._queued and self._ended is not None and not self._ended.done():
+                self._ended.set_result(time.time())
+            return frame
+
+        noise = self._rng.normal(0.0, self._noise_std, self._samples_per_frame)
+        return rtc.AudioFrame(
+            data=noise.astype(np.int16).tobytes(),
+            sample_rate=self._sample_rate,
+            num_channels=1,
+            samples_per_channel=self._samples_per_frame,
+        )
+
+
+class PlayoutSpeaker(io.AudioOutput):
+    """Speaker stand-in, plays captured segments in real time and reports when each starts"""
+
+    def __init__(self, on_first_frame: Callable[[float], None]) -> None:
+        super().__init__(label="PlayoutSpeaker", capabilities=io.AudioOutputCapabilities(pause=False))
+        self._on_first_frame = on_first_frame
+        self._started_at: Optional[float] = None
+        self._captured = 0.0
+        self._finish_task: Optional[asyncio.Task] = None
+
+    async def capture_frame(self, frame: rtc.AudioFrame) -> None:
+        await super().capture_frame(frame)
+        if self._started_at is None:
+            self._started_at = time.time()
+            self._captured = 0.0
+            self.on_playback_started(created_at=self._started_at)
+            self._on_first_frame(self._started_at)
+        self._captured += frame.duration
+
+    def flush(self) -> None:
+        super().flush()
+        if self._started_at is None:
+            return
+        remaining = self._started_at + self._captured - time.time()
+        self._finish_task = asyncio.create_task(self._finish_after(remaining, self._captured))
+        self._started_at = None
+
+    async def _finish_after(self, delay: float, position: float) -> None:
+        await asyncio.sleep(max(0.0, delay))
+        self._finish_task = None
+        self.on_playback_finished(playback_position=position, interrupted=False)
+
+    def clear_buffer(self) -> None:
+        if self._finish_task is not None:
+            self._finish_task.cancel()
+            self._finish_task = None
+            self.on_playback_finished(playback_position=0.0, interrupted=True)
+        elif self._started_at is not None:
+            played = min(self._captured, time.time() - self._started_at)
+            self._started_at = None
+            self.on_playback_finished(playback_position=played, interrupted=True)
+
+
+class SessionProbe:
+    """Follows one session's events and assigns them to the running turn"""
+
+    def __init__(self, session: AgentSession) -> None:
+        self.turn: Optional[TurnResult] = None
+        self.state = "initializing"
+        self.state_changed = asyncio.Event()
+        session.on("agent_state_changed", self._on_agent_state_changed)
+        session.on("metrics_collected", self._on_metrics_collected)
+        session.on("conversation_item_added", self._on_conversation_item_added)
+        session.on("function_tools_executed", self._on_function_tools_executed)
+
+    def on_first_frame(self, now: float) -> None:
+        turn = self.turn
+        if turn is None or not turn.ended:
+            return
+        if turn.first_audio is None:
+            turn.first_audio = now - turn.ended
+        # Native tool calls are answered without an acknowledgement spoken first
+        if turn.tool is not None and turn.answer_audio is None:
+            turn.answer_audio = now - turn.ended
+
+    def _on_agent_state_changed(self, event) -> None:
+        self.state = event.new_state
+        self.state_changed.set()
+
+    def _on_metrics_collected(self, event) -> None:
+        turn = self.turn
+        if turn is None:
+            return
+        m = event.metrics
+        # The first of each kind belongs to the reply the user hears first
+        if isinstance(m, metrics.EOUMetrics) and turn.end_of_utterance is None:
+            turn.end_of_utterance = m.end_of_utterance_delay
+            turn.transcription = m.transcription_delay
+        elif isinstance(m, metrics.STTMetrics) and turn.stt is None and not m.streamed:
+            turn.stt = m.duration
+        elif isinstance(m, metrics.LLMMetrics) and turn.llm_ttft is None:
+            turn.llm_ttft = m.ttft
+        elif isinstance(m, metrics.TTSMetrics) and turn.tts_ttfb is None:
+            turn.tts_ttfb = m.ttfb
+
+    def _on_conversation_item_added(self, event) -> None:
+        turn = self.turn
+        if turn is None or not hasattr(event.item, "text_content"):
+            return
+        text = event.item.text_content or ""
+        # The $tool_calls path of agent_new: the tool runs after the acknowledgement
+        # is added, its result comes back as a user message
+        if event.item.role == "assistant" and "$tool_calls" in text:
+            turn.tool_started = event.created_at
+            turn.tool_pending = True
+        elif event.item.role == "user" and turn.tool_pending:
+            turn.tool = event.created_at - turn.tool_started
+            turn.tool_pending = False
+
+    def _on_function_tools_executed(self, event) -> None:
+        turn = self.turn
+        if turn is None or not event.function_calls:
+            return
+        started = min(call.created_at for call in event.function_calls)
+        finished = max((output.created_at for output in event.function_call_outputs), default=started)
+        turn.tool = finished - started
+
+    async def wait_idle(self, settle: float, timeout: float) -> bool:
+        """Wait until the agent has answered and listened for `settle` seconds"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            turn = self.turn
+            answered = turn.first_audio is not None and not turn.tool_pending
+            if answered and self.state == "listening":
+                self.state_changed.clear()
+                try:
+                    await asyncio.wait_for(self.state_changed.wait(), settle)
+                except asyncio.TimeoutError:
+                    return True
+                continue
+            self.state_changed.clear()
+            try:
+                await asyncio.wait_for(self.state_changed.wait(), min(settle, max(0.0, deadline - time.monotonic())))
+            except asyncio.TimeoutError:
+                pass
+        return False
+
+
+def text_turn(language: str, rng: random.Random) -> str:
+    words = WORDS[language]
+    start = rng.randrange(len(words))
+    return " ".join(words[(start + i) % len(words)] for i in range(rng.randint(4, 10)))
+
+
+async def run_session(
+    index: int,
+    agent_new,
+    proc: SimpleNamespace,
+    utterances: list[list[rtc.AudioFrame]],
+    args: argparse.Namespace,
+    result: LevelResult,
+) -> None:
+    rng = random.Random(index)
+    session, assistant = agent_new.create_session(proc, args.language)
+    probe = SessionProbe(session)
+    microphone = ScriptedMicrophone(args.sample_rate, args.noise_db, seed=index)
+    session.input.audio = microphone
+    session.output.audio = PlayoutSpeaker(probe.on_first_frame)
+
+    await session.start(agent=assistant)
+    try:
+        # Let the noise gate learn the floor and stagger the sessions
+        await asyncio.sleep(args.warmup + rng.uniform(0.0, args.think))
+        for turn_index in range(args.turns):
+            kind = args.input if args.input != "both" else ("audio", "text")[turn_index % 2]
+            probe.turn = turn = TurnResult(session=index, kind=kind)
+            if kind == "audio":
+                turn.ended = await microphone.say(rng.choice(utterances))
+            else:
+                turn.ended = time.time()
+                session.generate_reply(user_input=text_turn(args.language, rng))
+
+            if await probe.wait_idle(args.settle, args.timeout):
+                result.turns.append(turn)
+            else:
+                result.timeouts += 1
+            probe.turn = None
+            await asyncio.sleep(rng.uniform(0.0, args.think))
+    finally:
+        await session.aclose()
+
+
+async def run_level(
+    sessions: int,
+    agent_new,
+    proc: SimpleNamespace,
+    utterances: list[list[rtc.AudioFrame]],
+    args: argparse.Namespace,
+) -> LevelResult:
+    result = LevelResult(sessions=sessions)
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(result.loop_lag, stop))
+    try:
+        await asyncio.gather(*(
+            run_session(index, agent_new, proc, utterances, args, result)
+            for index in range(sessions)
+        ))
+    finally:
+        stop.set()
+        await lag_task
+    return result
+
+
+def start_stubs(args: argparse.Namespace) -> tuple[subprocess.Popen, dict[str, str]]:
+    """Run pipeline_stub_servers.py on five free consecutive ports"""
+    while True:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        if port + 4 < 65536 and all(port_free(port + offset) for offset in range(1, 5)):
+            break
+
+    options = [
+        "--stt-delay", args.stt_delay, "--stt-rtf", args.stt_rtf,
+        "--stt-max-concurrency", args.stt_max_concurrency,
+        "--llm-ttft", args.llm_ttft, "--llm-tokens-per-second", args.llm_tokens_per_second,
+        "--tool-rate", args.tool_rate, "--tool-style", args.tool_style,
+        "--tts-ttfb", args.tts_ttfb, "--tts-rtf", args.tts_rtf,
+        "--rag-delay", args.rag_delay, "--jitter", args.jitter, "--seed", args.seed,
+    ]
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).with_name("pipeline_stub_servers.py")), "--port", str(port)]
+        + [str(option) for option in options],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, pipeline_stub_servers.service_urls("127.0.0.1", port)
+
+
+def port_free(port: int) -> bool:
+    with socket.socket() as sock:
+        try:
+            sock.bind(("127.0.0.1", port))
+            return True
+        except OSError:
+            return False
+
+
+async def wait_ready(urls: dict[str, str], timeout: float = 10.0) -> None:
+    bases = [url.split("/", 3)[:3] for url in urls.values()]
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http_session:
+        for base in ("/".join(parts) for parts in bases):
+            while True:
+                try:
+                    async with http_session.get(f"{base}/stats") as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise SystemExit(f"stub server at {base} did not start")
+                await asyncio.sleep(0.1)
+
+
+def load_utterances(args: argparse.Namespace) -> list[list[rtc.AudioFrame]]:
+    """Scripted utterances as 10 ms frames at the room rate, padded with a short lead-in"""
+    if args.wav:
+        signals = []
+        for path in args.wav:
+            samples, sample_rate, num_channels = load_wav(path)
+            audio = PcmAudio.from_arrays([samples], sample_rate, num_channels)
+            signals.append(resample_audio(audio, args.sample_rate).as_array())
+    else:
+        rng = np.random.default_rng(0)
+        durations = rng.uniform(args.min_duration, args.max_duration, size=8)
+        signals = [synthetic_speech(duration, args.sample_rate) for duration in durations]
+    return [to_frames(signal, args.sample_rate, 1) for signal in signals]
+
+
+def print_result(result: LevelResult) -> None:
+    turns = result.turns
+
+    def ms(name: str, points=(50,)) -> list[float]:
+        values = [getattr(turn, name) for turn in turns if getattr(turn, name) is not None]
+        return [value * 1000 for value in percentiles(values, points)]
+
+    p50, p95, p99 = ms("first_audio", (50, 95, 99))
+    lag99 = percentiles(result.loop_lag, (99,))[0] * 1000
+    tool_turns = sum(turn.tool is not None for turn in turns)
+    print(
+        f"{result.sessions:>8} {len(turns):>6} {result.timeouts:>5} "
+        f"{p50:>8.0f} {p95:>8.0f} {p99:>8.0f} "
+        f"{ms('end_of_utterance')[0]:>7.0f} {ms('transcription')[0]:>7.0f} {ms('stt')[0]:>7.0f} "
+        f"{ms('llm_ttft')[0]:>7.0f} {ms('tts_ttfb')[0]:>7.0f} "
+        f"{tool_turns:>5} {ms('tool')[0]:>7.0f} {ms('answer_audio')[0]:>8.0f} {lag99:>6.1f}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="1,4", help="comma separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=4, help="user turns per session")
+    parser.add_argument("--input", choices=["audio", "text", "both"], default="audio")
+    parser.add_argument("--language", choices=["en", "fa"], default="en")
+    parser.add_argument("--wav", action="append", help="16-bit PCM WAV utterance, repeatable; synthetic speech otherwise")
+    parser.add_argument("--min-duration", type=float, default=1.5, help="shortest synthetic utterance in seconds")
+    parser.add_argument("--max-duration", type=float, default=4.0, help="longest synthetic utterance in seconds")
+    parser.add_argument("--sample-rate", type=int, default=48000, help="rate of the simulated room audio")
+    parser.add_argument("--noise-db", type=float, default=-60.0, help="level of the microphone's background noise")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds of noise before the first turn")
+    parser.add_argument("--think", type=float, default=1.0, help="most seconds between two turns")
+    parser.add_argument("--settle", type=float, default=1.5, help="seconds of listening that end a turn")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds before a turn counts as lost")
+    parser.add_argument("--output", help="write every turn's timings to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's logs")
+    pipeline_stub_servers.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    process, urls = start_stubs(args)
+    try:
+        await wait_ready(urls)
+        # agent_new reads its configuration when imported
+        os.environ.update(urls)
+        os.environ.setdefault("LLM_MODEL", "stub")
+        os.environ.setdefault("KOKORO_DEFAULT_VOICE", "af_heart")
+        os.environ.setdefault("KOKORO_DEFAULT_SPEED", "1.0")
+        import agent_new
+
+        proc = SimpleNamespace(userdata={})
+        agent_new.prewarm(proc)
+        utterances = load_utterances(args)
+
+        print(
+            f"{'sessions':>8} {'turns':>6} {'lost':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'eou':>7} {'transcr':>7} {'stt':>7} {'llm':>7} {'tts':>7} "
+            f"{'tools':>5} {'tool':>7} {'answer':>8} {'lag99':>6}"
+        )
+        rows = []
+        for sessions in (int(level) for level in args.sessions.split(",")):
+            result = await run_level(sessions, agent_new, proc, utterances, args)
+            print_result(result)
+            rows.extend(dict(asdict(turn), sessions=sessions) for turn in result.turns)
+    finally:
+        process.terminate()
+        process.wait()
+
+    if args.output:
+        for row in rows:
+            for name in ("ended", "tool_started", "tool_pending"):
+                row.pop(name)
+        Path(args.output).write_text(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
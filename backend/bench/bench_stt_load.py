@@ -0,0 +1,281 @@
+"""
+Concurrent load benchmark for WhisperEndpointSTT
+
+Runs N simulated sessions at once, each with its own WhisperEndpointSTT as in
+the agent, and drives utterances of synthetic speech through
+`_recognize_impl` (one upload per utterance) or `_stream_recognize_impl`
+(frames paced in real time with interim decodes). For every concurrency
+level it reports latency percentiles, requests/s, bytes uploaded and the lag
+of this process's event loop.
+
+Latency is measured from the end of the utterance's audio to its final
+transcript. Without --url a whisper_stub_server.py is started in a separate
+process, so its work does not show up as event-loop lag here.
+
+    python backend/bench/bench_stt_load.py --sessions 1,8,32 --mode both
+    python backend/bench/bench_stt_load.py --sessions 16 --jitter 0.1 --fail-rate 0.02 --codec flac
+    python backend/bench/bench_stt_load.py --url http://gpu-box:8000/ --sessions 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiohttp
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from livekit import rtc  # noqa: E402
+from livekit.agents import stt  # noqa: E402
+
+from bench_codecs import synthetic_speech, to_frames  # noqa: E402
+from plugins.whisper_stt import WhisperEndpointSTT  # noqa: E402
+
+
+@dataclass
+class LevelResult:
+    """Measurements of one mode at one concurrency level."""
+    mode: str
+    sessions: int
+    latencies: list[float] = field(default_factory=list)
+    failures: int = 0
+    wall: float = 0.0
+    requests: int = 0
+    uploaded_bytes: int = 0
+    uploaded_seconds: float = 0.0
+    max_in_flight: int = 0
+    loop_lag: list[float] = field(default_factory=list)
+
+
+def percentiles(values: list[float], points=(50, 95, 99)) -> list[float]:
+    if not values:
+        return [float("nan")] * len(points)
+    return [float(v) for v in np.percentile(values, points)]
+
+
+async def monitor_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.01) -> None:
+    """Record how late the event loop wakes up from a short sleep."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def paced(frames: list[rtc.AudioFrame], speed: float, ended: list[float]) -> AsyncIterator[rtc.AudioFrame]:
+    """Yield frames at `speed` times real time, 0 for as fast as possible."""
+    start = time.perf_counter()
+    position = 0.0
+    for frame in frames:
+        yield frame
+        position += frame.samples_per_channel / frame.sample_rate
+        if speed > 0:
+            await asyncio.sleep(max(0.0, start + position / speed - time.perf_counter()))
+    ended.append(time.perf_counter())
+
+
+async def run_session(
+    whisper_stt: WhisperEndpointSTT,
+    mode: str,
+    utterances: list[list[rtc.AudioFrame]],
+    args: argparse.Namespace,
+    result: LevelResult,
+    rng: random.Random,
+) -> None:
+    for frames in utterances:
+        if mode == "recognize":
+            start = time.perf_counter()
+            event = await whisper_stt._recognize_impl(frames)
+            latency = time.perf_counter() - start
+            text = event.alternatives[0].text if event.alternatives else ""
+        else:
+            ended: list[float] = []
+            text = ""
+            finished = None
+            async for event in whisper_stt._stream_recognize_impl(paced(frames, args.speed, ended)):
+                if event.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
+                    text = event.alternatives[0].text
+                    finished = time.perf_counter()
+            latency = (finished or time.perf_counter()) - ended[0] if ended else 0.0
+
+        if text:
+            result.latencies.append(latency)
+        else:
+            result.failures += 1
+        await asyncio.sleep(rng.uniform(0.0, args.think))
+
+
+async def server_stats(http_session: aiohttp.ClientSession, base: str, reset: bool = False) -> Optional[dict]:
+    """Counters of a whisper_stub_server, None if the endpoint is not one."""
+    try:
+        if reset:
+            async with http_session.post(f"{base}/stats/reset") as response:
+                return await response.json() if response.status == 200 else None
+        async with http_session.get(f"{base}/stats") as response:
+            return await response.json() if response.status == 200 else None
+    except (aiohttp.ClientError, json.JSONDecodeError):
+        return None
+
+
+async def run_level(
+    mode: str,
+    sessions: int,
+    utterances: list[list[rtc.AudioFrame]],
+    args: argparse.Namespace,
+    url: str,
+    base: str,
+) -> LevelResult:
+    result = LevelResult(mode=mode, sessions=sessions)
+    rng = random.Random(sessions)
+    stts = [
+        WhisperEndpointSTT(
+            api_url=url,
+            language="en",
+            upload_codec=args.codec,
+            streaming_chunk_duration=args.chunk_duration,
+            split_long_audio=args.split,
+        )
+        for _ in range(sessions)
+    ]
+
+    async with aiohttp.ClientSession() as http_session:
+        await server_stats(http_session, base, reset=True)
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(monitor_loop_lag(result.loop_lag, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_session(
+                whisper_stt,
+                mode,
+                [rng.choice(utterances) for _ in range(args.utterances)],
+                args,
+                result,
+                random.Random(index),
+            )
+            for index, whisper_stt in enumerate(stts)
+        ))
+        result.wall = time.perf_counter() - start
+        stop.set()
+        await lag_task
+
+        stats = await server_stats(http_session, base)
+        if stats is not None:
+            result.requests = stats["requests"]
+            result.uploaded_bytes = stats["bytes"]
+            result.max_in_flight = stats["max_in_flight"]
+
+    result.uploaded_seconds = sum(s.stats.uploaded_seconds for s in stts)
+    if stats is None:
+        result.requests = sum(s.stats.requests for s in stts)
+    return result
+
+
+def start_stub(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            str(Path(__file__).with_name("whisper_stub_server.py")),
+            "--port", str(port),
+            "--delay", str(args.delay),
+            "--rtf", str(args.rtf),
+            "--jitter", str(args.jitter),
+            "--fail-rate", str(args.fail_rate),
+            "--max-concurrency", str(args.max_concurrency),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(base: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http_session:
+        while time.monotonic() < deadline:
+            if await server_stats(http_session, base) is not None:
+                return
+            await asyncio.sleep(0.1)
+    raise SystemExit(f"stub server at {base} did not start")
+
+
+def print_result(result: LevelResult) -> None:
+    p50, p95, p99 = (value * 1000 for value in percentiles(result.latencies))
+    lag50, lag99 = (value * 1000 for value in percentiles(result.loop_lag, (50, 99)))
+    lag_max = max(result.loop_lag, default=0.0) * 1000
+    print(
+        f"{result.mode:<10} {result.sessions:>8} {len(result.latencies):>6} {result.failures:>5} "
+        f"{p50:>8.0f} {p95:>8.0f} {p99:>8.0f} {result.requests / result.wall:>7.1f} "
+        f"{result.uploaded_bytes / 1e6:>8.2f} {result.uploaded_seconds:>8.1f} {result.max_in_flight:>6} "
+        f"{lag50:>6.1f} {lag99:>6.1f} {lag_max:>7.1f}"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Whisper endpoint to load, defaults to a local stub server")
+    parser.add_argument("--sessions", default="1,4,16", help="comma separated concurrency levels")
+    parser.add_argument("--mode", choices=["recognize", "stream", "both"], default="both")
+    parser.add_argument("--utterances", type=int, default=5, help="utterances per session")
+    parser.add_argument("--min-duration", type=float, default=1.0, help="shortest utterance in seconds")
+    parser.add_argument("--max-duration", type=float, default=6.0, help="longest utterance in seconds")
+    parser.add_argument("--think", type=float, default=0.5, help="most seconds between two utterances")
+    parser.add_argument("--speed", type=float, default=1.0, help="stream pacing vs real time, 0 for unpaced")
+    parser.add_argument("--sample-rate", type=int, default=48000, help="rate of the simulated room audio")
+    parser.add_argument("--codec", default="wav", help="upload codec, one of wav, flac, opus")
+    parser.add_argument("--chunk-duration", type=float, default=1.0, help="seconds between interim decodes")
+    parser.add_argument("--split", action="store_true", help="split long utterances into concurrent pieces")
+    parser.add_argument("--delay", type=float, default=0.1, help="stub: fixed seconds per decode")
+    parser.add_argument("--rtf", type=float, default=0.05, help="stub: decode seconds per second of audio")
+    parser.add_argument("--jitter", type=float, default=0.05, help="stub: random seconds added per decode")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="stub: share of failed decodes")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="stub: decodes run at once")
+    parser.add_argument("--verbose", action="store_true", help="show the plugin's logs, e.g. failed decodes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    # Audio is synthesized once so the measured loop only does the STT work
+    rng = np.random.default_rng(0)
+    durations = rng.uniform(args.min_duration, args.max_duration, size=16)
+    utterances = [
+        to_frames(synthetic_speech(duration, args.sample_rate), args.sample_rate, 1)
+        for duration in durations
+    ]
+
+    process = None
+    if args.url:
+        url = args.url
+        base = url.rstrip("/")
+    else:
+        process, base = start_stub(args)
+        url = f"{base}/transcribe_single/"
+        await wait_ready(base)
+
+    modes = ["recognize", "stream"] if args.mode == "both" else [args.mode]
+    print(
+        f"{'mode':<10} {'sessions':>8} {'ok':>6} {'fail':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'req/s':>7} {'MB up':>8} {'audio s':>8} {'peak':>6} {'lag50':>6} {'lag99':>6} {'lagmax':>7}"
+    )
+    try:
+        for mode in modes:
+            for sessions in (int(level) for level in args.sessions.split(",")):
+                print_result(await run_level(mode, sessions, utterances, args, url, base))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,334 @@
+"""
+Micro-benchmarks of the text and audio hot paths
+
+Each case times one call of a hot path in a loop for --duration seconds and
+reports calls per second, per-call latency percentiles and, in a separate pass
+under tracemalloc, the peak memory one call allocates and the bytes it leaves
+behind. The text cases are fed with realistic LLM token streams in English
+and Persian.
+
+    text_buffer/*     TextBuffer.add_text on one token-sized delta
+    tool_pattern/*    TOOL_CALL_PATTERN.search on a streamed reply
+    tool_parse/*      parse_and_execute_tool_calls on a finished reply
+    wav/*             building the WAV upload of an utterance
+    tts_accumulate/*  collecting a TTS response's chunks, as the chunked streams do
+
+Results can be saved as a baseline and later runs compared with it, so a
+change that slows a path down shows up before it ships:
+
+    python backend/bench/microbench.py --list
+    python backend/bench/microbench.py text_buffer tool_ --duration 2
+    python backend/bench/microbench.py --baseline microbench.json --save
+    python backend/bench/microbench.py --baseline microbench.json --threshold 0.15
+
+Comparing exits with status 1 when a case lost more than --threshold of its
+calls per second. The tool_* cases import agent_new and are skipped when its
+dependencies are missing.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import platform
+import re
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from livekit import rtc  # noqa: E402
+
+from bench_codecs import synthetic_speech, to_frames  # noqa: E402
+from plugins.audio_utils import PcmAudio, iter_wav  # noqa: E402
+from plugins.kokoro_tts import TextBuffer  # noqa: E402
+
+
+REPLIES = {
+    "en": (
+        "Sure, the exhibition hall is on the ground floor, right next to the main entrance. "
+        "Guided tours start every 30 minutes, e.g. at 10:00 and 10:30, and take about an hour. "
+        "You can buy tickets at the front desk; the kiosk by the stairs accepts cards only. "
+        "Is there anything else I can help you with today?"
+    ),
+    "fa": (
+        "حتماً، سالنِ نمایشگاه در طبقه ی همکف و کنارِ ورودیِ اصلی است. "
+        "تورهای راهنما هر ۳۰ دقیقه شروع می شوند، و حدودِ یک ساعت طول می کشند. "
+        "بلیط را می توانید از پیشخوان بخرید؛ دستگاهِ کنارِ پله ها فقط کارت قبول می کند. "
+        "کمکِ دیگری از دستم برمیاد؟"
+    ),
+}
+TOOL_BLOCK = (
+    '\n$tool_calls\n[{"function": "get_weather", "args": {"location": "London"}}]\n$'
+)
+# Word pieces the size of LLM tokens: a leading space, at most 4 letters, punctuation apart
+TOKEN_PATTERN = re.compile(r" ?[^\W\d_]{1,4}| ?\d{1,3}| ?(?:[^\w\s]|_)|\s+")
+
+# Kokoro's rate and a response split like httpx hands it over
+TTS_SAMPLE_RATE = 24000
+TTS_CHUNK_SIZE = 4096
+
+
+def tokenize(text: str) -> list[str]:
+    """Split a reply into LLM-like deltas that join back to the same text."""
+    tokens = TOKEN_PATTERN.findall(text)
+    assert "".join(tokens) == text, "token pattern must cover the whole reply"
+    return tokens
+
+
+@dataclass
+class CaseResult:
+    """Measurements of one case."""
+    name: str
+    calls: int
+    ops_per_second: float
+    p50_us: float
+    p99_us: float
+    peak_bytes: int
+    retained_bytes: float
+
+
+@dataclass
+class Case:
+    """A hot path to time; `setup` returns the call, a function or a coroutine function."""
+    name: str
+    setup: Callable[[], Callable]
+    description: str
+
+
+def text_buffer_case(language: str) -> Callable[[], Callable]:
+    def setup() -> Callable:
+        tokens = tokenize(REPLIES[language] + " ") * 4
+        state = {"buffer": TextBuffer(), "index": 0}
+
+        def add_token() -> list[str]:
+            if state["index"] == len(tokens):
+                state["buffer"] = TextBuffer()
+                state["index"] = 0
+            token = tokens[state["index"]]
+            state["index"] += 1
+            return state["buffer"].add_text(token)
+        return add_token
+    return setup
+
+
+def tool_pattern_case(text: str) -> Callable[[], Callable]:
+    def setup() -> Callable:
+        import agent_new
+
+        # The session checks the reply as it grows, so every prefix is searched
+        tokens = tokenize(text)
+        prefixes = ["".join(tokens[:i + 1]) for i in range(len(tokens))]
+        state = {"index": 0}
+
+        def search():
+            prefix = prefixes[state["index"] % len(prefixes)]
+            state["index"] += 1
+            return agent_new.TOOL_CALL_PATTERN.search(prefix)
+        return search
+    return setup
+
+
+def tool_parse_case(text: str) -> Callable[[], Callable]:
+    def setup() -> Callable:
+        import agent_new
+
+        async def parse():
+            return await agent_new.parse_and_execute_tool_calls(text)
+        return parse
+    return setup
+
+
+def utterance_frames(duration: float, sample_rate: int = 48000) -> list[rtc.AudioFrame]:
+    return to_frames(synthetic_speech(duration, sample_rate), sample_rate, 1)
+
+
+def iter_wav_case(duration: float) -> Callable[[], Callable]:
+    def setup() -> Callable:
+        frames = utterance_frames(duration)
+
+        async def build() -> int:
+            size = 0
+            async for chunk in iter_wav(PcmAudio.from_buffer(frames)):
+                size += len(chunk)
+            return size
+        return build
+    return setup
+
+
+def combined_wav_case(duration: float) -> Callable[[], Callable]:
+    """The merge-then-encode path iter_wav replaced, kept as the reference"""
+    def setup() -> Callable:
+        frames = utterance_frames(duration)
+
+        def build() -> int:
+            return len(rtc.combine_audio_frames(frames).to_wav_bytes())
+        return build
+    return setup
+
+
+def response_chunks(duration: float) -> list[bytes]:
+    pcm = synthetic_speech(duration, TTS_SAMPLE_RATE).tobytes()
+    return [pcm[i:i + TTS_CHUNK_SIZE] for i in range(0, len(pcm), TTS_CHUNK_SIZE)]
+
+
+def accumulate_case(duration: float, method: str) -> Callable[[], Callable]:
+    def setup() -> Callable:
+        chunks = response_chunks(duration)
+
+        def concat() -> int:
+            # What KokoroTTSChunkedStream and PiperTTSChunkedStream do today
+            all_audio_data = b""
+            for chunk in chunks:
+                all_audio_data += chunk
+            return len(all_audio_data)
+
+        def extend() -> int:
+            audio = bytearray()
+            for chunk in chunks:
+                audio += chunk
+            return len(audio)
+
+        def join() -> int:
+            parts = []
+            for chunk in chunks:
+                parts.append(chunk)
+            return len(b"".join(parts))
+
+        return {"concat": concat, "bytearray": extend, "join": join}[method]
+    return setup
+
+
+CASES = [
+    Case("text_buffer/en", text_buffer_case("en"), "TextBuffer.add_text, one English token"),
+    Case("text_buffer/fa", text_buffer_case("fa"), "TextBuffer.add_text, one Persian token"),
+    Case("tool_pattern/en", tool_pattern_case(REPLIES["en"][:120] + TOOL_BLOCK), "TOOL_CALL_PATTERN on each prefix of an English reply with a tool block"),
+    Case("tool_pattern/fa", tool_pattern_case(REPLIES["fa"]), "TOOL_CALL_PATTERN on each prefix of a Persian reply"),
+    Case("tool_parse/call", tool_parse_case(REPLIES["en"][:120] + TOOL_BLOCK), "parse_and_execute_tool_calls running get_weather"),
+    Case("tool_parse/none", tool_parse_case(REPLIES["fa"]), "parse_and_execute_tool_calls on a reply without tools"),
+    Case("wav/iter_wav_5s", iter_wav_case(5.0), "iter_wav over 5 s of 48 kHz frames"),
+    Case("wav/combine_5s", combined_wav_case(5.0), "combine_audio_frames + to_wav_bytes, 5 s at 48 kHz"),
+    Case("tts_accumulate/concat_10s", accumulate_case(10.0, "concat"), "bytes += of a 10 s response"),
+    Case("tts_accumulate/bytearray_10s", accumulate_case(10.0, "bytearray"), "bytearray += of a 10 s response"),
+    Case("tts_accumulate/join_10s", accumulate_case(10.0, "join"), "list append + join of a 10 s response"),
+]
+
+
+async def time_calls(call: Callable, duration: float) -> list[int]:
+    """Nanoseconds of each call, run back to back for `duration` seconds"""
+    is_async = inspect.iscoroutinefunction(call)
+    timings = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter_ns()
+        if is_async:
+            await call()
+        else:
+            call()
+        timings.append(time.perf_counter_ns() - start)
+    return timings
+
+
+async def trace_allocations(call: Callable, calls: int) -> tuple[int, float]:
+    """Largest peak of a single call and bytes left allocated per call"""
+    is_async = inspect.iscoroutinefunction(call)
+    tracemalloc.start()
+    try:
+        start_size, _ = tracemalloc.get_traced_memory()
+        peak = 0
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            if is_async:
+                await call()
+            else:
+                call()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+        end_size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, (end_size - start_size) / calls
+
+
+async def run_case(case: Case, duration: float) -> CaseResult:
+    call = case.setup()
+    await time_calls(call, min(0.2, duration))  # warm caches and compiled patterns
+    timings = await time_calls(call, duration)
+    peak, retained = await trace_allocations(call, min(len(timings), 200))
+    p50, p99 = np.percentile(timings, (50, 99)) / 1000
+    return CaseResult(
+        name=case.name,
+        calls=len(timings),
+        ops_per_second=len(timings) / (sum(timings) / 1e9),
+        p50_us=float(p50),
+        p99_us=float(p99),
+        peak_bytes=peak,
+        retained_bytes=retained,
+    )
+
+
+def compare(result: CaseResult, baseline: Optional[dict], threshold: float) -> tuple[str, bool]:
+    """Change of calls per second against the baseline, and whether it is a regression"""
+    if baseline is None or result.name not in baseline["cases"]:
+        return "", False
+    before = baseline["cases"][result.name]["ops_per_second"]
+    change = result.ops_per_second / before - 1.0
+    regressed = change < -threshold
+    return f"{change:+7.1%}{' SLOWER' if regressed else ''}", regressed
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("filters", nargs="*", help="run only cases whose name contains one of these")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds each case is timed")
+    parser.add_argument("--baseline", help="JSON file to compare with, or to write with --save")
+    parser.add_argument("--save", action="store_true", help="write this run to --baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args()
+
+    cases = [case for case in CASES if not args.filters or any(f in case.name for f in args.filters)]
+    if args.list:
+        for case in cases:
+            print(f"{case.name:<30} {case.description}")
+        return 0
+
+    baseline = None
+    if args.baseline and not args.save and Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text())
+
+    print(f"{'case':<30} {'calls':>9} {'ops/s':>12} {'p50 us':>9} {'p99 us':>9} {'peak KiB':>9} {'kept B':>8}  vs baseline")
+    results = []
+    regressions = 0
+    for case in cases:
+        try:
+            result = await run_case(case, args.duration)
+        except ImportError as e:
+            print(f"{case.name:<30} skipped, {e}")
+            continue
+        change, regressed = compare(result, baseline, args.threshold)
+        regressions += regressed
+        results.append(result)
+        print(
+            f"{result.name:<30} {result.calls:>9} {result.ops_per_second:>12,.0f} {result.p50_us:>9.1f} "
+            f"{result.p99_us:>9.1f} {result.peak_bytes / 1024:>9.1f} {result.retained_bytes:>8.0f}  {change}"
+        )
+
+    if args.save and args.baseline:
+        Path(args.baseline).write_text(json.dumps({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cases": {result.name: asdict(result) for result in results},
+        }, indent=2))
+        print(f"baseline written to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,362 @@
+"""
+Stand-ins for every service the agent calls during a turn
+
+Runs, on consecutive ports from --port:
+
+    +0  Whisper       whisper_stub_server.py, multipart upload to any path
+    +1  LLM           OpenAI-compatible POST /v1/chat/completions, streamed as SSE
+    +2  Kokoro        OpenAI-compatible POST /v1/audio/speech, raw 24 kHz PCM
+    +3  Piper         POST /stream with {"text": ...}, raw 22.05 kHz PCM
+    +4  RAG API       POST /api/chat/ answering {"prompt": ...}
+
+Each stand-in has a time to first byte and a generation speed, so the
+latency of a turn can be measured without the GPU boxes. A share of user
+turns (--tool-rate, decided per text so reruns agree) is answered with a
+`$tool_calls` block as the system prompt asks for, or with a native OpenAI
+tool call (--tool-style native). GET /stats on every port returns its counters.
+
+    python backend/bench/pipeline_stub_servers.py --port 8100 --llm-ttft 0.3 --tool-rate 0.3
+    python backend/bench/pipeline_stub_servers.py --port 8100 --tts-ttfb 0.25 --tts-rtf 0.2
+
+bench_e2e_latency.py starts it on its own; to run the agent against it set
+WHISPER_BASE_URL, LLM_BASE_URL, KOKORO_BASE_URL, PIPER_BASE_URL and RAG_API_URL
+to the printed URLs.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+import zlib
+
+import numpy as np
+from aiohttp import web
+
+import whisper_stub_server
+
+
+logger = logging.getLogger("pipeline-stub-servers")
+
+REPLIES = {
+    "en": (
+        "The exhibition hall is on the ground floor next to the main entrance. "
+        "Guided tours start every thirty minutes and take about an hour. "
+        "You can buy tickets at the front desk or from the kiosk by the stairs. "
+        "The museum shop is open until six in the evening."
+    ),
+    "fa": (
+        "سالن نمایشگاه در طبقه همکف کنار ورودی اصلی است. "
+        "تورهای راهنما هر نیم ساعت شروع می شوند و حدود یک ساعت طول می کشند. "
+        "بلیط را می توانید از پیشخوان یا دستگاه کنار پله ها بخرید. "
+        "فروشگاه موزه تا ساعت شش عصر باز است."
+    ),
+}
+ACKNOWLEDGEMENTS = {
+    "en": "Let me check that for you.",
+    "fa": "اجازه بدید پاسخ این سوال را چک کنم.",
+}
+# Spoken characters per second, sets how long the synthesized audio lasts
+CHARACTERS_PER_SECOND = 15.0
+KOKORO_SAMPLE_RATE = 24000
+PIPER_SAMPLE_RATE = 22050
+AUDIO_CHUNK_DURATION = 0.1
+
+
+def text_language(text: str) -> str:
+    return "fa" if any("؀" <= char <= "ۿ" for char in text) else "en"
+
+
+def new_stats() -> dict:
+    return {"requests": 0, "in_flight": 0, "max_in_flight": 0, "started": time.time()}
+
+
+@web.middleware
+async def count_requests(request: web.Request, handler) -> web.StreamResponse:
+    if request.path.startswith("/stats"):
+        return await handler(request)
+    stats = request.app["stats"]
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        return await handler(request)
+    finally:
+        stats["in_flight"] -= 1
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    return web.json_response(request.app["stats"])
+
+
+async def handle_reset(request: web.Request) -> web.Response:
+    request.app["stats"] = new_stats()
+    return web.json_response(request.app["stats"])
+
+
+def base_app(**settings) -> web.Application:
+    app = web.Application(middlewares=[count_requests])
+    app.update(settings)
+    app["stats"] = new_stats()
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_post("/stats/reset", handle_reset)
+    return app
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def plan_reply(messages: list[dict], tool_rate: float, tool_style: str) -> tuple[str, list[dict]]:
+    """Text and tool calls the stand-in answers the conversation with"""
+    last = messages[-1] if messages else {}
+    user_text = next((message_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+    language = text_language(user_text)
+
+    # A tool result is always answered in words, whichever path delivered it
+    answered_tool = last.get("role") == "tool" or user_text.startswith("search_and_respond returned:")
+    wants_tool = zlib.crc32(user_text.encode()) % 1000 < tool_rate * 1000
+    if answered_tool or not wants_tool:
+        return REPLIES[language], []
+
+    query = " ".join(user_text.split()[:8])
+    if tool_style == "native":
+        return "", [{"name": "search_and_respond", "arguments": json.dumps({"query": query}, ensure_ascii=False)}]
+    block = json.dumps([{"function": "search_and_respond", "args": {"query": query}}], ensure_ascii=False)
+    return f"{ACKNOWLEDGEMENTS[language]}\n$tool_calls\n{block}\n$", []
+
+
+def completion_chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> bytes:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode()
+
+
+async def handle_chat_completions(request: web.Request) -> web.StreamResponse:
+    app = request.app
+    body = await request.json()
+    text, tool_calls = plan_reply(body.get("messages", []), app["tool_rate"], app["tool_style"])
+    model = body.get("model") or "stub"
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    await asyncio.sleep(app["ttft"] + app["rng"].uniform(0.0, app["jitter"]))
+
+    # One token per word, the space is kept so the client can join them as is
+    tokens = [token for token in text.replace("\n", " \n ").split(" ") if token]
+    tokens = [token if token == "\n" else token + " " for token in tokens]
+    await response.write(completion_chunk(completion_id, model, {"role": "assistant", "content": ""}))
+    for index, token in enumerate(tokens):
+        if index:
+            await asyncio.sleep(1.0 / app["tokens_per_second"])
+        await response.write(completion_chunk(completion_id, model, {"content": token}))
+    for index, call in enumerate(tool_calls):
+        await response.write(completion_chunk(completion_id, model, {"tool_calls": [{
+            "index": index,
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": call,
+        }]}))
+
+    finish_reason = "tool_calls" if tool_calls else "stop"
+    await response.write(completion_chunk(completion_id, model, {}, finish_reason))
+    usage = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [],
+        "usage": {"prompt_tokens": 500, "completion_tokens": len(tokens), "total_tokens": 500 + len(tokens)},
+    }
+    await response.write(f"data: {json.dumps(usage)}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def create_llm_app(
+    *,
+    ttft: float = 0.3,
+    tokens_per_second: float = 40.0,
+    jitter: float = 0.0,
+    tool_rate: float = 0.0,
+    tool_style: str = "inline",
+    seed: int = 0,
+) -> web.Application:
+    app = base_app(
+        ttft=ttft,
+        tokens_per_second=tokens_per_second,
+        jitter=jitter,
+        tool_rate=tool_rate,
+        tool_style=tool_style,
+        rng=random.Random(seed),
+    )
+    app.router.add_post("/{tail:.*}", handle_chat_completions)
+    return app
+
+
+def speech_like_pcm(duration: float, sample_rate: int, seed: int) -> bytes:
+    """A voiced tone with a syllable envelope, enough for playback and echo tests"""
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    pitch = 180 + 20 * np.sin(2 * np.pi * (0.5 + seed % 5 * 0.1) * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.3 + 0.7 * np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    return (voiced * envelope * 4000).astype(np.int16).tobytes()
+
+
+async def stream_speech(request: web.Request, text: str, sample_rate: int) -> web.StreamResponse:
+    """Stream audio for `text` after the time to first byte, at the configured real-time factor"""
+    app = request.app
+    duration = max(AUDIO_CHUNK_DURATION, len(text) / CHARACTERS_PER_SECOND)
+    pcm = speech_like_pcm(duration, sample_rate, zlib.crc32(text.encode()))
+    chunk_bytes = int(AUDIO_CHUNK_DURATION * sample_rate) * 2
+
+    response = web.StreamResponse(headers={"Content-Type": "audio/pcm"})
+    await response.prepare(request)
+    await asyncio.sleep(app["ttfb"] + app["rng"].uniform(0.0, app["jitter"]))
+    for offset in range(0, len(pcm), chunk_bytes):
+        if offset:
+            await asyncio.sleep(app["rtf"] * AUDIO_CHUNK_DURATION)
+        await response.write(pcm[offset:offset + chunk_bytes])
+    await response.write_eof()
+    return response
+
+
+async def handle_kokoro_speech(request: web.Request) -> web.StreamResponse:
+    body = await request.json()
+    return await stream_speech(request, body.get("input", ""), KOKORO_SAMPLE_RATE)
+
+
+async def handle_piper_stream(request: web.Request) -> web.StreamResponse:
+    body = await request.json()
+    return await stream_speech(request, body.get("text", ""), PIPER_SAMPLE_RATE)
+
+
+def create_tts_app(
+    kind: str,
+    *,
+    ttfb: float = 0.2,
+    rtf: float = 0.1,
+    jitter: float = 0.0,
+    seed: int = 0,
+) -> web.Application:
+    """Kokoro (kind "kokoro") or Piper (kind "piper") stand-in."""
+    app = base_app(ttfb=ttfb, rtf=rtf, jitter=jitter, rng=random.Random(seed))
+    if kind == "kokoro":
+        app.router.add_post("/{tail:.*}", handle_kokoro_speech)
+    else:
+        app.router.add_post("/stream", handle_piper_stream)
+    return app
+
+
+async def handle_rag(request: web.Request) -> web.Response:
+    app = request.app
+    body = await request.json()
+    await asyncio.sleep(app["delay"] + app["rng"].uniform(0.0, app["jitter"]))
+    query = body.get("query", "")
+    return web.json_response({
+        "prompt": f"Answer '{query}' from these notes: {REPLIES[text_language(query)]}",
+    })
+
+
+def create_rag_app(*, delay: float = 0.4, jitter: float = 0.0, seed: int = 0) -> web.Application:
+    app = base_app(delay=delay, jitter=jitter, rng=random.Random(seed))
+    app.router.add_post("/{tail:.*}", handle_rag)
+    return app
+
+
+def service_urls(host: str, port: int) -> dict[str, str]:
+    """Environment variables pointing the agent at the stand-ins started on `port`"""
+    base = f"http://{host}:{port}"
+    return {
+        "WHISPER_BASE_URL": f"{base}/transcribe_single/",
+        "LLM_BASE_URL": f"http://{host}:{port + 1}/v1",
+        "KOKORO_BASE_URL": f"http://{host}:{port + 2}/v1",
+        "PIPER_BASE_URL": f"http://{host}:{port + 3}",
+        "RAG_API_URL": f"http://{host}:{port + 4}/api/chat/",
+    }
+
+
+def create_apps(args: argparse.Namespace) -> list[web.Application]:
+    """The five stand-ins in port order, configured from the command line."""
+    return [
+        whisper_stub_server.create_app(
+            delay=args.stt_delay,
+            rtf=args.stt_rtf,
+            jitter=args.jitter,
+            max_concurrency=args.stt_max_concurrency,
+            seed=args.seed,
+        ),
+        create_llm_app(
+            ttft=args.llm_ttft,
+            tokens_per_second=args.llm_tokens_per_second,
+            jitter=args.jitter,
+            tool_rate=args.tool_rate,
+            tool_style=args.tool_style,
+            seed=args.seed,
+        ),
+        create_tts_app("kokoro", ttfb=args.tts_ttfb, rtf=args.tts_rtf, jitter=args.jitter, seed=args.seed),
+        create_tts_app("piper", ttfb=args.tts_ttfb, rtf=args.tts_rtf, jitter=args.jitter, seed=args.seed),
+        create_rag_app(delay=args.rag_delay, jitter=args.jitter, seed=args.seed),
+    ]
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Stand-in options, shared with bench_e2e_latency.py which forwards them."""
+    parser.add_argument("--stt-delay", type=float, default=0.1, help="whisper: fixed seconds per decode")
+    parser.add_argument("--stt-rtf", type=float, default=0.05, help="whisper: decode seconds per second of audio")
+    parser.add_argument("--stt-max-concurrency", type=int, default=0, help="whisper: decodes run at once")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="llm: seconds to the first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=40.0, help="llm: streamed words per second")
+    parser.add_argument("--tool-rate", type=float, default=0.0, help="llm: share of user turns answered with a tool call")
+    parser.add_argument("--tool-style", choices=["inline", "native"], default="inline", help="llm: $tool_calls text or OpenAI tool calls")
+    parser.add_argument("--tts-ttfb", type=float, default=0.2, help="kokoro/piper: seconds to the first audio byte")
+    parser.add_argument("--tts-rtf", type=float, default=0.1, help="kokoro/piper: synthesis seconds per second of audio")
+    parser.add_argument("--rag-delay", type=float, default=0.4, help="rag: seconds per query")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform random seconds added to every delay")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+async def serve(args: argparse.Namespace) -> None:
+    runners = []
+    for offset, app in enumerate(create_apps(args)):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, args.host, args.port + offset).start()
+        runners.append(runner)
+    for name, url in service_urls(args.host, args.port).items():
+        print(f"{name}={url}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100, help="first of five consecutive ports")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
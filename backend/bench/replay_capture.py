@@ -0,0 +1,227 @@
+"""
+Replay a captured session against the local stand-ins
+
+Reads a capture written by the agent with SESSION_CAPTURE_DIR set, starts
+pipeline_stub_servers.py and feeds the captured microphone audio through the
+agent's real session (agent_new.create_session) at the original pacing, or
+--speed times faster. The replay is captured as well, and both captures are
+broken into user turns from their metrics: end of speech to the first
+synthesized audio, end of utterance, LLM time to first token and TTS time to
+first byte, side by side per turn.
+
+    python backend/bench/replay_capture.py captures/20250101-101500-booth.cap
+    python backend/bench/replay_capture.py booth.cap --speed 2 --llm-ttft 0.8 --tool-rate 0.3
+    python backend/bench/replay_capture.py booth.cap --summary
+
+Audio is replayed as captured, the stand-ins answer with their own text, so
+the replay reproduces the timing of the traffic, not the conversation.
+--summary only prints the captured turns.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from livekit import rtc  # noqa: E402
+from livekit.agents.voice import io  # noqa: E402
+
+import pipeline_stub_servers  # noqa: E402
+from bench_e2e_latency import PlayoutSpeaker, start_stubs, wait_ready  # noqa: E402
+from bench_stt_load import percentiles  # noqa: E402
+from plugins.session_capture import RECORD_EVENT, capture_audio, read_capture  # noqa: E402
+
+
+FRAME_DURATION = 0.01
+
+
+def capture_turns(path: Path) -> list[dict]:
+    """User turns of a capture, timed from the end of the user's speech"""
+    header, records = read_capture(path)
+    events = sorted((record for record in records if record.kind == RECORD_EVENT), key=lambda record: record.time)
+    turns: list[dict] = []
+    transcript = ""
+    for record in events:
+        event = record.payload
+        turn = turns[-1] if turns else None
+        if event["type"] == "transcript" and event.get("final"):
+            transcript = event["text"]
+        elif event["type"] == "tts_first_audio" and turn and turn["first_audio"] is None:
+            turn["first_audio"] = record.time - turn["at"]
+        elif event["type"] == "metrics":
+            metrics = event["metrics"]
+            # A committed user turn reports how long after the end of speech it was committed
+            if metrics["type"] == "eou_metrics":
+                turns.append({
+                    "at": metrics["timestamp"] - header["started"] - metrics["end_of_utterance_delay"],
+                    "transcript": transcript,
+                    "first_audio": None,
+                    "end_of_utterance": metrics["end_of_utterance_delay"],
+                    "llm_ttft": None,
+                    "tts_ttfb": None,
+                })
+            elif metrics["type"] == "llm_metrics" and turn and turn["llm_ttft"] is None:
+                turn["llm_ttft"] = metrics["ttft"]
+            elif metrics["type"] == "tts_metrics" and turn and turn["tts_ttfb"] is None:
+                turn["tts_ttfb"] = metrics["ttfb"]
+    return turns
+
+
+class CapturedMicrophone(io.AudioInput):
+    """Plays the audio of a capture at its original times divided by `speed`, then silence"""
+
+    def __init__(self, chunks: list, speed: float, tail: float) -> None:
+        super().__init__(label="CapturedMicrophone")
+        self._frames = self._split(chunks)
+        self._speed = speed
+        self._tail = tail
+        self._index = 0
+        self._started: Optional[float] = None
+        self.finished = asyncio.Event()
+
+    @staticmethod
+    def _split(chunks: list) -> list[tuple[float, rtc.AudioFrame]]:
+        frames = []
+        for chunk in chunks:
+            step = int(chunk.sample_rate * FRAME_DURATION) * chunk.num_channels
+            for i, start in enumerate(range(0, len(chunk.samples) - step + 1, step)):
+                frames.append((chunk.time + i * FRAME_DURATION, rtc.AudioFrame(
+                    data=chunk.samples[start:start + step].tobytes(),
+                    sample_rate=chunk.sample_rate,
+                    num_channels=chunk.num_channels,
+                    samples_per_channel=step // chunk.num_channels,
+                )))
+        return frames
+
+    async def __anext__(self) -> rtc.AudioFrame:
+        if self._started is None:
+            self._started = time.perf_counter() - (self._frames[0][0] / self._speed if self._frames and self._speed else 0.0)
+
+        if self._index < len(self._frames):
+            at, frame = self._frames[self._index]
+            self._index += 1
+            if self._speed > 0:
+                await asyncio.sleep(max(0.0, self._started + at / self._speed - time.perf_counter()))
+            return frame
+
+        # Silence after the capture lets the last reply finish
+        if self._index >= len(self._frames) + int(self._tail / FRAME_DURATION):
+            self.finished.set()
+            raise StopAsyncIteration
+        last = self._frames[-1][1] if self._frames else None
+        sample_rate = last.sample_rate if last else 16000
+        self._index += 1
+        await asyncio.sleep(FRAME_DURATION)
+        samples = int(sample_rate * FRAME_DURATION)
+        return rtc.AudioFrame(
+            data=np.zeros(samples, dtype=np.int16).tobytes(),
+            sample_rate=sample_rate,
+            num_channels=1,
+            samples_per_channel=samples,
+        )
+
+
+def ms(value: Optional[float]) -> str:
+    return f"{value * 1000:.0f}" if value is not None else "-"
+
+
+def print_turns(original: list[dict], replayed: Optional[list[dict]]) -> None:
+    if replayed is None:
+        print(f"{'turn':>4} {'at s':>7} {'first ms':>9} {'eou':>6} {'llm':>6} {'tts':>6}  transcript")
+        for index, turn in enumerate(original):
+            print(
+                f"{index:>4} {turn['at']:>7.1f} {ms(turn['first_audio']):>9} {ms(turn['end_of_utterance']):>6} "
+                f"{ms(turn['llm_ttft']):>6} {ms(turn['tts_ttfb']):>6}  {turn['transcript'][:40]}"
+            )
+    else:
+        print(
+            f"{'turn':>4} {'at s':>7} {'first ms':>9} {'replay':>7} {'eou':>6} {'replay':>7} "
+            f"{'llm':>6} {'replay':>7} {'tts':>6} {'replay':>7}  transcript"
+        )
+        empty = {"at": 0.0, "transcript": "", "first_audio": None, "end_of_utterance": None, "llm_ttft": None, "tts_ttfb": None}
+        for index in range(max(len(original), len(replayed))):
+            before = original[index] if index < len(original) else empty
+            after = replayed[index] if index < len(replayed) else empty
+            print(
+                f"{index:>4} {before['at']:>7.1f} {ms(before['first_audio']):>9} {ms(after['first_audio']):>7} "
+                f"{ms(before['end_of_utterance']):>6} {ms(after['end_of_utterance']):>7} "
+                f"{ms(before['llm_ttft']):>6} {ms(after['llm_ttft']):>7} "
+                f"{ms(before['tts_ttfb']):>6} {ms(after['tts_ttfb']):>7}  {before['transcript'][:40]}"
+            )
+
+    for name, turns in (("captured", original), ("replayed", replayed or [])):
+        values = [turn["first_audio"] for turn in turns if turn["first_audio"] is not None]
+        if values:
+            p50, p95, peak = (value * 1000 for value in percentiles(values, (50, 95, 100)))
+            print(f"{name}: {len(turns)} turns, first audio p50 {p50:.0f} ms, p95 {p95:.0f} ms, max {peak:.0f} ms")
+
+
+async def replay(path: Path, header: dict, args: argparse.Namespace) -> Path:
+    """Run the capture through a fresh session and return the capture of the replay"""
+    _, records = read_capture(path)
+    chunks = list(capture_audio(records))
+    if not chunks:
+        raise SystemExit(f"{path} holds no audio")
+
+    process, urls = start_stubs(args)
+    try:
+        await wait_ready(urls)
+        # agent_new reads its configuration when imported
+        os.environ.update(urls)
+        os.environ["SESSION_CAPTURE_DIR"] = args.output_dir
+        os.environ.setdefault("LLM_MODEL", "stub")
+        os.environ.setdefault("KOKORO_DEFAULT_VOICE", "af_heart")
+        os.environ.setdefault("KOKORO_DEFAULT_SPEED", "1.0")
+        import agent_new
+
+        proc = SimpleNamespace(userdata={})
+        agent_new.prewarm(proc)
+        session, assistant = agent_new.create_session(proc, header.get("language", "en"), name=f"replay-{path.stem}")
+        microphone = CapturedMicrophone(chunks, args.speed, args.tail)
+        session.input.audio = microphone
+        session.output.audio = PlayoutSpeaker(lambda now: None)
+
+        await session.start(agent=assistant)
+        await microphone.finished.wait()
+        await session.aclose()
+        return assistant._capture.path
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", type=Path, help="capture file written by the agent")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed vs the original pacing, 0 for unpaced")
+    parser.add_argument("--tail", type=float, default=5.0, help="seconds of silence after the captured audio")
+    parser.add_argument("--output-dir", default=tempfile.gettempdir(), help="where the replay's own capture is written")
+    parser.add_argument("--summary", action="store_true", help="only print the captured turns")
+    parser.add_argument("--verbose", action="store_true", help="show the agent's logs")
+    pipeline_stub_servers.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    header, _ = read_capture(args.capture)
+    original = capture_turns(args.capture)
+    if args.summary:
+        print_turns(original, None)
+        return
+
+    replayed_path = await replay(args.capture, header, args)
+    print(f"replay captured to {replayed_path}")
+    print_turns(original, capture_turns(replayed_path))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+"""
+Stand-in for the Whisper HTTP endpoint
+
+Accepts the same multipart upload as the GPU service (a "file" field and an
+optional "language" field, POSTed to any path) and answers with a transcript
+whose length follows the uploaded duration. Decode time, jitter and failures
+are configurable, so WhisperEndpointSTT can be load tested without the GPU box.
+GET /stats returns the counters since start, POST /stats/reset clears them.
+
+    python backend/bench/whisper_stub_server.py --port 8000 --delay 0.15 --rtf 0.05 --jitter 0.05
+    python backend/bench/whisper_stub_server.py --fail-rate 0.02 --max-concurrency 4
+
+Point the agent or bench_stt_load.py at it with WHISPER_BASE_URL=http://localhost:8000/.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import random
+import struct
+import time
+from typing import Optional
+
+import av
+from aiohttp import web
+
+
+logger = logging.getLogger("whisper-stub-server")
+
+# Words the transcripts are made of, distinct so the transcript gate keeps them
+WORDS = {
+    "en": (
+        "where is the exhibition hall how long does the tour take can I buy "
+        "tickets here which floor has the museum shop what time do you close "
+        "today is there a guided visit in english"
+    ).split(),
+    "fa": (
+        "سالن نمایشگاه کجاست بازدید چقدر طول می کشد آیا می توانم اینجا بلیط "
+        "بخرم فروشگاه موزه در کدام طبقه است امروز چه ساعتی تعطیل می شوید"
+    ).split(),
+}
+WORDS_PER_SECOND = 2.5
+
+
+def wav_duration(header: bytes, num_bytes: int) -> Optional[float]:
+    """Duration of a PCM WAV upload from its header, None for other formats."""
+    if len(header) < 44 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+    num_channels, sample_rate = struct.unpack("<HI", header[22:28])
+    bits = struct.unpack("<H", header[34:36])[0]
+    if not sample_rate or not num_channels or not bits:
+        return None
+    return (num_bytes - 44) / (sample_rate * num_channels * bits // 8)
+
+
+def decoded_duration(data: bytes) -> Optional[float]:
+    """Duration of a compressed upload (FLAC, Ogg Opus), decoded with PyAV."""
+    try:
+        with av.open(io.BytesIO(data)) as container:
+            samples = sum(frame.samples for frame in container.decode(audio=0))
+            return samples / container.streams.audio[0].rate
+    except (av.FFmpegError, IndexError, ZeroDivisionError):
+        return None
+
+
+def transcript(duration: float, language: Optional[str], rng: random.Random) -> dict:
+    """A plausible response for `duration` seconds of speech."""
+    language = language if language in WORDS else "en"
+    words = WORDS[language]
+    count = max(1, round(duration * WORDS_PER_SECOND))
+    start = rng.randrange(len(words))
+    text = " ".join(words[(start + i) % len(words)] for i in range(count))
+    return {
+        "text": text,
+        "language": language,
+        "segments": [{
+            "start": 0.0,
+            "end": round(duration, 3),
+            "text": text,
+            "avg_logprob": -0.2,
+            "no_speech_prob": 0.02,
+        }],
+    }
+
+
+def new_stats() -> dict:
+    return {
+        "requests": 0,
+        "failures": 0,
+        "bytes": 0,
+        "audio_seconds": 0.0,
+        "in_flight": 0,
+        "max_in_flight": 0,
+        "started": time.time(),
+    }
+
+
+async def handle_transcribe(request: web.Request) -> web.Response:
+    app = request.app
+    stats = app["stats"]
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        chunks = []
+        num_bytes = 0
+        language = None
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == "file":
+                while chunk := await part.read_chunk():
+                    chunks.append(chunk)
+                    num_bytes += len(chunk)
+            elif part.name == "language":
+                language = (await part.text()) or None
+        stats["bytes"] += num_bytes
+
+        data = b"".join(chunks)
+        duration = wav_duration(data[:44], num_bytes)
+        if duration is None:
+            duration = await asyncio.get_running_loop().run_in_executor(None, decoded_duration, data)
+        if duration is None:
+            return web.Response(status=400, text="could not decode the uploaded audio")
+        stats["audio_seconds"] += duration
+
+        # A GPU decodes a bounded number of requests at once, the rest queue
+        async with app["decode_slots"]:
+            rng = app["rng"]
+            delay = app["delay"] + app["rtf"] * duration + rng.uniform(0.0, app["jitter"])
+            await asyncio.sleep(delay)
+            if rng.random() < app["fail_rate"]:
+                stats["failures"] += 1
+                return web.Response(status=500, text="simulated decode failure")
+            return web.json_response(transcript(duration, language, rng))
+    finally:
+        stats["in_flight"] -= 1
+
+
+async def handle_stats(request: web.Request) -> web.Response:
+    return web.json_response(request.app["stats"])
+
+
+async def handle_reset(request: web.Request) -> web.Response:
+    request.app["stats"] = new_stats()
+    return web.json_response(request.app["stats"])
+
+
+def create_app(
+    *,
+    delay: float = 0.1,
+    rtf: float = 0.05,
+    jitter: float = 0.0,
+    fail_rate: float = 0.0,
+    max_concurrency: int = 0,
+    seed: int = 0,
+) -> web.Application:
+    """Build the server application, also used by benchmarks to run it in process."""
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app["delay"] = delay
+    app["rtf"] = rtf
+    app["jitter"] = jitter
+    app["fail_rate"] = fail_rate
+    app["decode_slots"] = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+    app["rng"] = random.Random(seed)
+    app["stats"] = new_stats()
+    app.router.add_get("/stats", handle_stats)
+    app.router.add_post("/stats/reset", handle_reset)
+    app.router.add_post("/{tail:.*}", handle_transcribe)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0.1, help="fixed seconds per decode")
+    parser.add_argument("--rtf", type=float, default=0.05, help="decode seconds per second of audio")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform random seconds added per decode")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of decodes answered with 500")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="decodes run at once, 0 for unbounded")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(
+        create_app(
+            delay=args.delay,
+            rtf=args.rtf,
+            jitter=args.jitter,
+            fail_rate=args.fail_rate,
+            max_concurrency=args.max_concurrency,
+            seed=args.seed,
+        ),
+        host=args.host,
+        port=args.port,
+        access_log=None,
+    )
+
+
+if __name__ == "__main__":
+    main()
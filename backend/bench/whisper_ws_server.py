@@ -0,0 +1,173 @@
+"""
+Reference server for the WhisperEndpointSTT WebSocket transport
+
+Implements the protocol of WhisperWebSocketClient: audio of an utterance
+arrives as binary messages while the user speaks, "decode" and "commit"
+decode what was received so far. Without --whisper-url the transcript only
+describes the received audio, which is enough to test the transport. With
+--whisper-url every decode is forwarded to the HTTP Whisper endpoint as WAV,
+so the server can sit in front of the existing service. Decodes of a session
+run one at a time in their own task, so audio keeps being received while one
+is in progress.
+
+    python backend/bench/whisper_ws_server.py --port 8765
+    python backend/bench/whisper_ws_server.py --whisper-url http://localhost:8000/transcribe_single/
+
+Point the agent at it with WHISPER_WS_URL=ws://localhost:8765/ws.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from pathlib import Path
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from plugins.audio_utils import BYTES_PER_SAMPLE, PcmAudio, iter_wav  # noqa: E402
+
+
+logger = logging.getLogger("whisper-ws-server")
+
+
+class Utterance:
+    """Audio received for the utterance in progress."""
+
+    def __init__(self, sample_rate: int, num_channels: int):
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.chunks: list[memoryview] = []
+
+    def snapshot(self) -> "Utterance":
+        """The audio received so far, unaffected by chunks that arrive later."""
+        received = Utterance(self.sample_rate, self.num_channels)
+        received.chunks = list(self.chunks)
+        return received
+
+    def audio(self) -> PcmAudio:
+        return PcmAudio(chunks=list(self.chunks), sample_rate=self.sample_rate, num_channels=self.num_channels)
+
+    @property
+    def duration(self) -> float:
+        num_bytes = sum(chunk.nbytes for chunk in self.chunks)
+        return num_bytes / (BYTES_PER_SAMPLE * self.num_channels * self.sample_rate)
+
+
+async def transcribe(app: web.Application, utterance: Utterance, language: Optional[str]) -> dict:
+    """Decode the audio received so far."""
+    if app["decode_delay"]:
+        await asyncio.sleep(app["decode_delay"])
+
+    whisper_url = app["whisper_url"]
+    if whisper_url is None:
+        return {"text": f"{utterance.duration:.2f} seconds of audio", "language": language}
+
+    data = aiohttp.FormData()
+    data.add_field("file", iter_wav(utterance.audio()), filename="audio.wav", content_type="audio/wav")
+    if language:
+        data.add_field("language", language)
+    async with app["http_session"].post(whisper_url, data=data) as response:
+        if response.status != 200:
+            raise RuntimeError(f"Whisper endpoint returned {response.status}: {await response.text()}")
+        result = await response.json()
+    return result[0] if isinstance(result, list) else result
+
+
+async def handle_ws(request: web.Request) -> web.WebSocketResponse:
+    ws = web.WebSocketResponse(heartbeat=20.0)
+    await ws.prepare(request)
+    logger.info(f"Session connected from {request.remote}")
+
+    # Decodes are answered in order by their own task, the loop below keeps
+    # reading audio meanwhile
+    decodes: asyncio.Queue = asyncio.Queue()
+    decode_task = asyncio.create_task(run_decodes(request.app, ws, decodes))
+
+    utterance: Optional[Utterance] = None
+    try:
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.BINARY:
+                if utterance is not None:
+                    utterance.chunks.append(memoryview(msg.data))
+                continue
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+
+            message = json.loads(msg.data)
+            kind = message.get("type")
+            if kind == "start":
+                # A new start also drops an utterance that was never committed
+                utterance = Utterance(message["sample_rate"], message.get("num_channels", 1))
+            elif kind == "cancel":
+                utterance = None
+            elif kind in ("decode", "commit"):
+                request_id = message.get("id")
+                if utterance is None:
+                    await ws.send_json({"type": "error", "id": request_id, "message": "no utterance started"})
+                    continue
+                decodes.put_nowait((kind, request_id, utterance.snapshot(), message.get("language")))
+                if kind == "commit":
+                    utterance = None
+    finally:
+        decode_task.cancel()
+        await asyncio.gather(decode_task, return_exceptions=True)
+
+    logger.info("Session disconnected")
+    return ws
+
+
+async def run_decodes(app: web.Application, ws: web.WebSocketResponse, decodes: asyncio.Queue) -> None:
+    """Answer the decodes of a session one at a time."""
+    while True:
+        kind, request_id, utterance, language = await decodes.get()
+        try:
+            result = await transcribe(app, utterance, language)
+        except Exception as e:
+            logger.error(f"Decode failed: {e}")
+            await ws.send_json({"type": "error", "id": request_id, "message": str(e)})
+        else:
+            await ws.send_json({**result, "type": "result", "id": request_id})
+        logger.info(f"{kind} {request_id}: {utterance.duration:.2f}s")
+
+
+async def on_startup(app: web.Application) -> None:
+    app["http_session"] = aiohttp.ClientSession()
+
+
+async def on_cleanup(app: web.Application) -> None:
+    await app["http_session"].close()
+
+
+def create_app(*, whisper_url: Optional[str] = None, decode_delay: float = 0.0) -> web.Application:
+    """Build the server application, also run in process by whisper_ws_smoke.py."""
+    app = web.Application()
+    app["whisper_url"] = whisper_url
+    app["decode_delay"] = decode_delay
+    app.router.add_get("/ws", handle_ws)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--whisper-url", help="HTTP Whisper endpoint decodes are forwarded to")
+    parser.add_argument("--decode-delay", type=float, default=0.0, help="seconds added to every decode")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(
+        create_app(whisper_url=args.whisper_url, decode_delay=args.decode_delay),
+        host=args.host,
+        port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
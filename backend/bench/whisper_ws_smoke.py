@@ -0,0 +1,115 @@
+"""
+Smoke test of WhisperWebSocketClient against the reference server
+
+Runs whisper_ws_server.py in process on a free port, without a Whisper
+endpoint behind it, and drives the client through the protocol: start,
+decode while audio is still being sent, commit, cancel, and a decode without
+a started utterance. Decodes are slowed down by --decode-delay, so the run
+also shows that the server keeps reading audio and messages while a decode is
+in progress. Exits with status 1 when a check fails.
+
+    python backend/bench/whisper_ws_smoke.py
+    python backend/bench/whisper_ws_smoke.py --decode-delay 0.5
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from plugins.whisper_ws import WhisperWebSocketClient, WhisperWebSocketError  # noqa: E402
+from whisper_ws_server import create_app  # noqa: E402
+
+
+SAMPLE_RATE = 16000
+
+
+def seconds_of_audio(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16)
+
+
+def decoded_seconds(result: dict) -> float:
+    """Duration the audio-describing transcript reports."""
+    return float(result["text"].split()[0])
+
+
+async def run_checks(url: str, decode_delay: float) -> list[tuple[str, bool, str]]:
+    checks = []
+    client = WhisperWebSocketClient(url, timeout=10.0)
+    try:
+        await client.start(sample_rate=SAMPLE_RATE, num_channels=1)
+        await client.send_audio(seconds_of_audio(1.0))
+        result = await client.decode(language="en")
+        checks.append(("decode", decoded_seconds(result) == 1.0, result["text"]))
+
+        # Audio sent while a decode runs belongs to the next one, not to it
+        interim = asyncio.create_task(client.decode(language="en"))
+        await asyncio.sleep(0)
+        await client.send_audio(seconds_of_audio(1.0))
+        final = await client.commit(language="en")
+        interim = await interim
+        checks.append((
+            "decode during upload",
+            decoded_seconds(interim) == 1.0 and decoded_seconds(final) == 2.0,
+            f"interim {interim['text']}, commit {final['text']}",
+        ))
+
+        # A slow decode must not hold up the messages behind it
+        await client.start(sample_rate=SAMPLE_RATE, num_channels=1)
+        await client.send_audio(seconds_of_audio(0.5))
+        slow = asyncio.create_task(client.decode())
+        await asyncio.sleep(0)
+        await client.cancel()
+        started = time.perf_counter()
+        try:
+            await client.decode()
+            checks.append(("error without start", False, "decode after cancel succeeded"))
+        except WhisperWebSocketError as e:
+            answered = time.perf_counter() - started
+            checks.append((
+                "error without start",
+                "no utterance started" in str(e) and answered < decode_delay / 2,
+                f"'{e}' after {answered:.3f}s with a {decode_delay}s decode in progress",
+            ))
+        result = await slow
+        checks.append(("cancel", decoded_seconds(result) == 0.5, f"decode before cancel: {result['text']}"))
+
+        await client.start(sample_rate=SAMPLE_RATE, num_channels=1)
+        await client.send_audio(seconds_of_audio(0.25))
+        result = await client.commit()
+        checks.append(("start after cancel", decoded_seconds(result) == 0.25, result["text"]))
+    finally:
+        await client.aclose()
+    return checks
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    runner = web.AppRunner(create_app(decode_delay=args.decode_delay))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        checks = await run_checks(f"ws://127.0.0.1:{port}/ws", args.decode_delay)
+    finally:
+        await runner.cleanup()
+
+    for name, passed, detail in checks:
+        print(f"{'ok  ' if passed else 'FAIL'} {name:<22} {detail}")
+    return 0 if all(passed for _, passed, _ in checks) else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decode-delay", type=float, default=0.3, help="seconds added to every decode")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,10 @@ import os
 import json
 import re
 import asyncio
+import inspect
+import time
 from pathlib import Path
+from typing import Optional
 from livekit.api import ChatMessage
 from dotenv import load_dotenv
 
@@ -22,8 +25,15 @@ from livekit.agents import (
 )
 from livekit.plugins import openai, silero, simli
 from plugins.whisper_stt import WhisperEndpointSTT
+from plugins.whisper_batcher import close_batch_dispatchers
+from plugins.whisper_routing import ModelTier
 from plugins.kokoro_tts import KokoroTTS
 from plugins.piper_tts import PiperTTS
+from plugins.tts_cache import TTSAudioCache
+from plugins.language_tts import LanguageSwitchingTTS
+from plugins.noise_gate import AdaptiveVAD, NoiseGateMetrics
+from plugins.echo_suppression import EchoReference, EchoSuppressingVAD
+from plugins.session_capture import CapturingVAD, SessionCapture
 
 from tools import get_weather, search_and_respond
 
@@ -43,6 +53,28 @@ TOOL_REGISTRY = {
 
 # Speech-to-Text (Whisper) Configuration
 WHISPER_BASE_URL = os.getenv("WHISPER_BASE_URL")
+WHISPER_STREAMING = os.getenv("WHISPER_STREAMING", "false").lower() == "true"
+WHISPER_STREAMING_CHUNK_DURATION = os.getenv("WHISPER_STREAMING_CHUNK_DURATION", "1.0")
+WHISPER_STREAMING_BUFFER_DURATION = os.getenv("WHISPER_STREAMING_BUFFER_DURATION", "30.0")
+WHISPER_STREAMING_DROP_POLICY = os.getenv("WHISPER_STREAMING_DROP_POLICY", "drop_oldest")
+WHISPER_UPLOAD_CODEC = os.getenv("WHISPER_UPLOAD_CODEC", "wav")
+WHISPER_UPLOAD_BITRATE = os.getenv("WHISPER_UPLOAD_BITRATE", "24000")
+WHISPER_SAMPLE_RATE = os.getenv("WHISPER_SAMPLE_RATE", "16000")
+WHISPER_TRIM_SILENCE = os.getenv("WHISPER_TRIM_SILENCE", "true").lower() == "true"
+WHISPER_TRIM_GUARD = os.getenv("WHISPER_TRIM_GUARD", "0.15")
+WHISPER_SPECULATIVE = os.getenv("WHISPER_SPECULATIVE", "false").lower() == "true"
+WHISPER_BATCH_URL = os.getenv("WHISPER_BATCH_URL")
+WHISPER_BATCH_MAX_SIZE = os.getenv("WHISPER_BATCH_MAX_SIZE", "8")
+WHISPER_BATCH_MAX_WAIT = os.getenv("WHISPER_BATCH_MAX_WAIT", "0.01")
+WHISPER_WS_URL = os.getenv("WHISPER_WS_URL")
+WHISPER_SPLIT_LONG_AUDIO = os.getenv("WHISPER_SPLIT_LONG_AUDIO", "false").lower() == "true"
+WHISPER_SPLIT_MAX_DURATION = os.getenv("WHISPER_SPLIT_MAX_DURATION", "10.0")
+WHISPER_SPLIT_MAX_PARALLEL = os.getenv("WHISPER_SPLIT_MAX_PARALLEL", "3")
+WHISPER_GATE_TRANSCRIPTS = os.getenv("WHISPER_GATE_TRANSCRIPTS", "true").lower() == "true"
+WHISPER_GATE_THRESHOLD = os.getenv("WHISPER_GATE_THRESHOLD", "0.5")
+WHISPER_LANGUAGE_ID = os.getenv("WHISPER_LANGUAGE_ID", "false").lower() == "true"
+WHISPER_LANGUAGE_ID_DURATION = os.getenv("WHISPER_LANGUAGE_ID_DURATION", "1.5")
+WHISPER_MODEL_TIERS = os.getenv("WHISPER_MODEL_TIERS")
 
 # Large Language Model (LLM) Configuration
 LLM_BASE_URL = os.getenv("LLM_BASE_URL")
@@ -52,8 +84,13 @@ LLM_MODEL = os.getenv("LLM_MODEL")
 KOKORO_BASE_URL = os.getenv("KOKORO_BASE_URL")
 KOKORO_DEFAULT_VOICE = os.getenv("KOKORO_DEFAULT_VOICE")
 KOKORO_DEFAULT_SPEED = os.getenv("KOKORO_DEFAULT_SPEED")
+KOKORO_LOOKAHEAD_SENTENCES = os.getenv("KOKORO_LOOKAHEAD_SENTENCES", "2")
+KOKORO_PAUSES = os.getenv("KOKORO_PAUSES")
 
 PIPER_BASE_URL = os.getenv("PIPER_BASE_URL")
+PIPER_STREAMING = os.getenv("PIPER_STREAMING", "true").lower() == "true"
+
+TTS_CACHE_MAX_MB = os.getenv("TTS_CACHE_MAX_MB", "64")
 
 # Simli Avatar Configuration
 SIMLI_API_KEY = os.getenv("SIMLI_API_KEY")
@@ -64,6 +101,16 @@ VAD_MIN_SPEECH_DURATION = os.getenv("VAD_MIN_SPEECH_DURATION", "0.1")
 VAD_MIN_SILENCE_DURATION = os.getenv("VAD_MIN_SILENCE_DURATION", "0.5")
 VAD_PREFIX_PADDING = os.getenv("VAD_PREFIX_PADDING", "0.2")
 VAD_MAX_BUFFERED_SPEECH = os.getenv("VAD_MAX_BUFFERED_SPEECH", "30.0")
+VAD_NOISE_GATE = os.getenv("VAD_NOISE_GATE", "true").lower() == "true"
+VAD_NOISE_GATE_MAX_THRESHOLD = os.getenv("VAD_NOISE_GATE_MAX_THRESHOLD", "0.8")
+VAD_NOISE_GATE_MIN_SNR = os.getenv("VAD_NOISE_GATE_MIN_SNR", "8.0")
+ECHO_SUPPRESSION = os.getenv("ECHO_SUPPRESSION", "false").lower() == "true"
+ECHO_SUPPRESSION_THRESHOLD = os.getenv("ECHO_SUPPRESSION_THRESHOLD", "0.35")
+ECHO_SUPPRESSION_CHECK_DURATION = os.getenv("ECHO_SUPPRESSION_CHECK_DURATION", "0.5")
+
+# Session capture Configuration
+SESSION_CAPTURE_DIR = os.getenv("SESSION_CAPTURE_DIR")
+SESSION_CAPTURE_SAMPLE_RATE = os.getenv("SESSION_CAPTURE_SAMPLE_RATE", "16000")
 
 TOOL_CALL_PATTERN = re.compile(r'\$tool_calls\s*\n(\[.*?\])\s*\n\$', re.DOTALL)
 
@@ -99,11 +146,11 @@ async def parse_and_execute_tool_calls(content: str):
                     
                     func = TOOL_REGISTRY[function_name]
                     
-                    # Handle async functions
-                    if asyncio.iscoroutinefunction(func):
-                        result = await func(**args)
-                    else:
-                        result = func(**args)
+                    # Handle async functions, @function_tool wrappers return a coroutine
+                    # without being coroutine functions themselves
+                    result = func(**args)
+                    if inspect.isawaitable(result):
+                        result = await result
                     
                     results.append(f"{function_name} returned: {result}")
                 
@@ -118,14 +165,41 @@ async def parse_and_execute_tool_calls(content: str):
 
 
 class Assistant(Agent):
-    def __init__(self, instructions: str, tools: list = None) -> None:
+    def __init__(
+        self,
+        instructions: str,
+        tools: list = None,
+        capture: Optional[SessionCapture] = None,
+        echo_reference: Optional[EchoReference] = None,
+    ) -> None:
         super().__init__(
                 instructions=instructions,
                 tools=tools
         )
+        self._capture = capture
+        self._echo_reference = echo_reference
+
+    def llm_node(self, chat_ctx, tools, model_settings):
+        stream = Agent.default.llm_node(self, chat_ctx, tools, model_settings)
+        # Record when each token arrived
+        return self._capture.tee_llm(stream) if self._capture else stream
+
+    def tts_node(self, text, model_settings):
+        if self._capture is not None:
+            # Record the text sent to synthesis and when its audio came back
+            text = self._capture.tee_tts_text(text)
+        frames = Agent.default.tts_node(self, text, model_settings)
+        if self._capture is not None:
+            frames = self._capture.tee_tts_audio(frames)
+        if self._echo_reference is not None:
+            # Frames leave this node as the audio output pulls them for playback
+            frames = self._echo_reference.tee(frames)
+        return frames
 
     async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage):
-        if len(turn_ctx.items) >= 2 and turn_ctx.items[-1].role == "user":
+        # The context also holds non-message items (handoffs, config updates) without a role
+        last = turn_ctx.items[-1] if turn_ctx.items else None
+        if len(turn_ctx.items) >= 2 and last.type == "message" and last.role == "user":
             new_message.content = [f"{turn_ctx.items[-1].text_content} {' '}{new_message.text_content}"]
             # pop the incomplete message
             turn_ctx.items.pop(-1)
@@ -147,6 +221,8 @@ def prewarm(proc: JobProcess):
         max_buffered_speech=float(VAD_MAX_BUFFERED_SPEECH),
     )
     
+    # Shared by the sessions of this process, fixed phrases like the greeting are synthesized once
+    tts_cache = TTSAudioCache(int(float(TTS_CACHE_MAX_MB) * 1024 * 1024)) if float(TTS_CACHE_MAX_MB) > 0 else None
     proc.userdata["tts_factory"] = {
         "en": lambda: KokoroTTS(
                 base_url=KOKORO_BASE_URL,
@@ -155,24 +231,161 @@ def prewarm(proc: JobProcess):
                 buffer_sentences=True,
                 flush_timeout=1.5,
                 inter_chunk_pause=1,
+                # Pauses are inserted as silence, seconds per punctuation class,
+                # "chunk" in KOKORO_PAUSES overrides inter_chunk_pause
+                pauses=json.loads(KOKORO_PAUSES or "{}"),
+                # Next sentences are synthesized while the current one plays
+                lookahead_sentences=int(KOKORO_LOOKAHEAD_SENTENCES),
+                cache=tts_cache,
             ),
         "fa": lambda: PiperTTS(
                 base_url=PIPER_BASE_URL,
                 sample_rate=22050,
+                streaming=PIPER_STREAMING,
+                cache=tts_cache,
             )
     }
-    proc.userdata["stt_factory"] = lambda lang: WhisperEndpointSTT(
+    proc.userdata["stt_factory"] = lambda lang, vad=None: WhisperEndpointSTT(
             api_url=WHISPER_BASE_URL,
             language=lang,
+            # Streaming mode segments utterances itself and emits interim transcripts
+            vad=(vad or proc.userdata["vad"]) if WHISPER_STREAMING else None,
+            streaming_chunk_duration=float(WHISPER_STREAMING_CHUNK_DURATION),
+            streaming_buffer_duration=float(WHISPER_STREAMING_BUFFER_DURATION),
+            streaming_drop_policy=WHISPER_STREAMING_DROP_POLICY,
+            upload_codec=WHISPER_UPLOAD_CODEC,
+            upload_bitrate=int(WHISPER_UPLOAD_BITRATE),
+            sample_rate=int(WHISPER_SAMPLE_RATE) or None,
+            trim_silence=WHISPER_TRIM_SILENCE,
+            trim_guard=float(WHISPER_TRIM_GUARD),
+            speculative=WHISPER_SPECULATIVE,
+            batch_url=WHISPER_BATCH_URL,
+            batch_max_size=int(WHISPER_BATCH_MAX_SIZE),
+            batch_max_wait=float(WHISPER_BATCH_MAX_WAIT),
+            # Streaming sessions upload audio over a WebSocket while the user speaks
+            ws_url=WHISPER_WS_URL,
+            # Long utterances are cut at pauses and decoded as concurrent pieces
+            split_long_audio=WHISPER_SPLIT_LONG_AUDIO,
+            split_max_duration=float(WHISPER_SPLIT_MAX_DURATION),
+            split_max_parallel=int(WHISPER_SPLIT_MAX_PARALLEL),
+            # Noise and hallucinated transcripts never start an LLM/TTS turn
+            gate_transcripts=WHISPER_GATE_TRANSCRIPTS,
+            gate_threshold=float(WHISPER_GATE_THRESHOLD),
+            # Identify fa/en from the first seconds of speech and switch STT/TTS to it
+            detect_language=WHISPER_LANGUAGE_ID,
+            language_id_duration=float(WHISPER_LANGUAGE_ID_DURATION),
+            # Short or confident utterances stay on the small model, the rest escalate
+            model_tiers=[ModelTier.from_dict(tier) for tier in json.loads(WHISPER_MODEL_TIERS or "[]")],
         )
 
     logger.info("[OK] LLM and VAD prewarmed. STT/TTS will be initialized based on participant language.")
 
 
+def create_session(proc: JobProcess, language: str, name: str = "session") -> tuple[AgentSession, Assistant]:
+    """
+    Build one participant's voice pipeline from the prewarmed process state
+
+    Shared by the entrypoint and bench_e2e_latency.py, which drives the same
+    session through scripted audio instead of a room.
+    """
+    # Track this session's noise floor in front of the shared VAD
+    vad = proc.userdata["vad"]
+    if VAD_NOISE_GATE:
+        vad = AdaptiveVAD(
+            vad,
+            max_activation_threshold=float(VAD_NOISE_GATE_MAX_THRESHOLD),
+            min_snr_db=float(VAD_NOISE_GATE_MIN_SNR),
+        )
+
+        @vad.on("noise_gate_metrics")
+        def _on_noise_gate_metrics(metrics: NoiseGateMetrics):
+            logger.debug(
+                f"Noise floor {metrics.noise_floor_db:.1f} dBFS, activation threshold "
+                f"{metrics.activation_threshold:.2f}, rejected "
+                f"{metrics.rejected_segments}/{metrics.segments} segments"
+            )
+
+    # Drop speech segments that are the avatar's own voice picked up by the mic
+    echo_reference = None
+    if ECHO_SUPPRESSION:
+        echo_reference = EchoReference()
+        vad = EchoSuppressingVAD(
+            vad,
+            echo_reference,
+            threshold=float(ECHO_SUPPRESSION_THRESHOLD),
+            check_duration=float(ECHO_SUPPRESSION_CHECK_DURATION),
+        )
+
+    # Initialize STT and TTS based on participant's language
+    stt = proc.userdata["stt_factory"](language, vad)
+    # The TTS engine can be switched per language without rebuilding the session
+    tts = LanguageSwitchingTTS(proc.userdata["tts_factory"], language=language)
+    
+    logger.info(f"\033[0;34mInitialized agent with language: {language}\033[0m")
+
+    # Record the session for bench/replay_capture.py; only the session's own VAD
+    # stream is wrapped, a streaming STT's VAD sees the same audio again
+    capture = None
+    if SESSION_CAPTURE_DIR:
+        capture = SessionCapture(
+            Path(SESSION_CAPTURE_DIR) / f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.cap",
+            sample_rate=int(SESSION_CAPTURE_SAMPLE_RATE),
+            metadata={"name": name, "language": language},
+        )
+        vad = CapturingVAD(vad, capture)
+
+    session = AgentSession(
+        stt=stt,
+        llm=proc.userdata["llm"],
+        tts=tts,
+        turn_detection="vad",
+        vad=vad,
+        preemptive_generation=False,
+    )
+    if capture is not None:
+        capture.attach(session)
+
+    @session.on("agent_state_changed")
+    def _on_agent_state_changed(event: AgentStateChangedEvent):
+        logger.info(f"Agent state changed: {event.old_state} -> {event.new_state}")
+
+    @session.on("conversation_item_added")
+    def _on_conversation_item_added(event: ConversationItemAddedEvent):
+        if event.item.type != "message":
+            return
+        logger.info(f"\033[38;5;208m{event.item.role} : {event.item.text_content}\033[0m")
+        # Detect and execute tool calls
+        if event.item.role == "assistant" and "$tool_calls" in event.item.text_content:
+            async def handle_tool_call():
+                result = await parse_and_execute_tool_calls(event.item.text_content)
+                if capture is not None:
+                    capture.event("tool_result", text=result)
+                if result:
+                    session.generate_reply(user_input=result)
+            asyncio.create_task(handle_tool_call())
+
+    # Select system prompt based on language
+    system_prompt = SYSTEM_PROMPT_PERSIAN if language == "fa" else SYSTEM_PROMPT_ENGLISH
+    assistant = Assistant(instructions=system_prompt, tools=[search_and_respond], capture=capture, echo_reference=echo_reference)
+
+    @stt.on("language_detected")
+    def _on_language_detected(detected: str):
+        """Follow the spoken language when it differs from the selected one"""
+        if not tts.set_language(detected):
+            return
+        logger.info(f"\033[0;34mSwitched agent language to: {detected}\033[0m")
+        prompt = SYSTEM_PROMPT_PERSIAN if detected == "fa" else SYSTEM_PROMPT_ENGLISH
+        asyncio.create_task(assistant.update_instructions(prompt))
+
+    return session, assistant
+
+
 async def entrypoint(ctx: JobContext):
     ctx.log_context_fields = {
         "room": ctx.room.name,
     }
+    # The batch dispatchers of this job's event loop hold an HTTP session and send tasks
+    ctx.add_shutdown_callback(close_batch_dispatchers)
 
     # Connect to the room first
     await ctx.connect()
@@ -181,6 +394,7 @@ async def entrypoint(ctx: JobContext):
     participant = await ctx.wait_for_participant()
     
     # Extract language from participant metadata
+    language = os.getenv("LANGUAGE", "en")
     try:
         if participant.metadata:
             metadata = json.loads(participant.metadata)
@@ -188,20 +402,7 @@ async def entrypoint(ctx: JobContext):
     except Exception as e:
         logger.warning(f"Failed to parse participant metadata, using default language: {e}")
     
-    # Initialize STT and TTS based on participant's language
-    stt = ctx.proc.userdata["stt_factory"](language)
-    tts = ctx.proc.userdata["tts_factory"].get(language, ctx.proc.userdata["tts_factory"]["en"])()
-    
-    logger.info(f"\033[0;34mInitialized agent with language: {language}\033[0m")
-
-    session = AgentSession(
-        stt=stt,
-        llm=ctx.proc.userdata["llm"],
-        tts=tts,
-        turn_detection="vad",
-        vad=ctx.proc.userdata["vad"],
-        preemptive_generation=False,
-    )
+    session, assistant = create_session(ctx.proc, language, name=ctx.room.name)
 
     @ctx.room.on("participant_connected")
     def on_participant_connected(participant):
@@ -247,25 +448,6 @@ async def entrypoint(ctx: JobContext):
         except Exception as e:
             logger.error(f"Error handling data message: {e}", exc_info=True)
 
-    @session.on("agent_state_changed")
-    def _on_agent_state_changed(event: AgentStateChangedEvent):
-        logger.info(f"Agent state changed: {event.old_state} -> {event.new_state}")
-
-    @session.on("conversation_item_added")
-    def _on_conversation_item_added(event: ConversationItemAddedEvent):
-        logger.info(f"\033[38;5;208m{event.item.role} : {event.item.text_content}\033[0m")
-        # Detect and execute tool calls
-        if event.item.role == "assistant" and "$tool_calls" in event.item.text_content:
-            async def handle_tool_call():
-                result = await parse_and_execute_tool_calls(event.item.text_content)
-                if result:
-                    session.generate_reply(user_input=result)
-            asyncio.create_task(handle_tool_call())
-
-    # Select system prompt based on language
-    system_prompt = SYSTEM_PROMPT_PERSIAN if language == "fa" else SYSTEM_PROMPT_ENGLISH
-    assistant = Assistant(instructions=system_prompt, tools=[search_and_respond])
-  
     simli_avatar = simli.AvatarSession(
                 simli_config=simli.SimliConfig(
                     api_key=SIMLI_API_KEY,
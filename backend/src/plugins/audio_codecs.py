@@ -0,0 +1,160 @@
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional, Union
+
+import av
+import numpy as np
+
+from .audio_utils import BYTES_PER_SAMPLE, PcmAudio, iter_wav
+
+
+# Seconds of audio handed to the encoder thread per executor call
+ENCODE_BLOCK_DURATION = 0.5
+
+# Sample rates libopus accepts natively, anything else is resampled to 48 kHz
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+@dataclass(frozen=True)
+class UploadCodec:
+    """Container, codec and multipart metadata of an upload format."""
+    name: str
+    filename: str
+    content_type: str
+    container: Optional[str] = None
+    codec: Optional[str] = None
+
+
+UPLOAD_CODECS = {
+    "wav": UploadCodec(name="wav", filename="audio.wav", content_type="audio/wav"),
+    "flac": UploadCodec(
+        name="flac",
+        filename="audio.flac",
+        content_type="audio/flac",
+        container="flac",
+        codec="flac",
+    ),
+    "opus": UploadCodec(
+        name="opus",
+        filename="audio.ogg",
+        content_type="audio/ogg",
+        container="ogg",
+        codec="libopus",
+    ),
+}
+
+
+def get_upload_codec(name: str) -> UploadCodec:
+    """Look up an upload codec by name."""
+    try:
+        return UPLOAD_CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown upload codec '{name}', expected one of {', '.join(UPLOAD_CODECS)}"
+        ) from None
+
+
+class _ChunkSink:
+    """Write-only file object collecting what the muxer produces."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> list[bytes]:
+        parts, self._parts = self._parts, []
+        return parts
+
+
+class AudioEncoder:
+    """
+    Incremental FLAC/Opus encoder for 16-bit PCM
+
+    Each call returns the bytes the muxer produced so far, which lets the
+    upload start before the whole utterance is encoded. The sink is not
+    seekable, so the container is written strictly front to back.
+    """
+
+    def __init__(
+        self,
+        codec: UploadCodec,
+        *,
+        sample_rate: int,
+        num_channels: int,
+        bitrate: int = 24000,
+    ):
+        if codec.container is None:
+            raise ValueError(f"Codec '{codec.name}' does not need an encoder")
+
+        self._sample_rate = sample_rate
+        self._num_channels = num_channels
+        self._layout = "mono" if num_channels == 1 else "stereo"
+        self._sink = _ChunkSink()
+        self._container = av.open(self._sink, mode="w", format=codec.container)
+
+        rate = sample_rate
+        if codec.codec == "libopus" and rate not in OPUS_SAMPLE_RATES:
+            rate = 48000
+        self._stream = self._container.add_stream(codec.codec, rate=rate, layout=self._layout)
+        if codec.codec == "libopus":
+            self._stream.bit_rate = bitrate
+
+    def encode(self, pcm: Union[bytes, memoryview]) -> list[bytes]:
+        """Encode a block of interleaved PCM and return the produced bytes."""
+        samples = np.frombuffer(pcm, dtype=np.int16).reshape(1, -1)
+        frame = av.AudioFrame.from_ndarray(samples, format="s16", layout=self._layout)
+        frame.sample_rate = self._sample_rate
+        for packet in self._stream.encode(frame):
+            self._container.mux(packet)
+        return self._sink.drain()
+
+    def finish(self) -> list[bytes]:
+        """Flush the encoder, close the container and return the remaining bytes."""
+        for packet in self._stream.encode(None):
+            self._container.mux(packet)
+        self._container.close()
+        return self._sink.drain()
+
+
+async def iter_encoded(
+    audio: PcmAudio,
+    codec: UploadCodec,
+    *,
+    bitrate: int = 24000,
+) -> AsyncIterator[Union[bytes, memoryview]]:
+    """
+    Yield the upload body of `audio` in the given codec
+
+    WAV is streamed from the frame buffers directly. Compressed codecs are
+    encoded block by block in the default executor so the event loop never
+    runs the encoder.
+    """
+    if codec.container is None:
+        async for chunk in iter_wav(audio):
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    encoder = await loop.run_in_executor(
+        None,
+        lambda: AudioEncoder(
+            codec,
+            sample_rate=audio.sample_rate,
+            num_channels=audio.num_channels,
+            bitrate=bitrate,
+        ),
+    )
+
+    block_size = int(ENCODE_BLOCK_DURATION * audio.sample_rate) * audio.num_channels * BYTES_PER_SAMPLE
+    for chunk in audio.chunks:
+        for offset in range(0, chunk.nbytes, block_size):
+            for part in await loop.run_in_executor(
+                None, encoder.encode, chunk[offset:offset + block_size]
+            ):
+                yield part
+
+    for part in await loop.run_in_executor(None, encoder.finish):
+        yield part
@@ -0,0 +1,528 @@
+import math
+import struct
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, Optional, Union
+
+import numpy as np
+from livekit import rtc
+from livekit.agents.utils import AudioBuffer
+
+
+# Largest slice handed to the transport at once, keeps its write buffer bounded
+UPLOAD_CHUNK_SIZE = 32 * 1024
+
+BYTES_PER_SAMPLE = 2  # 16-bit PCM
+
+# Resampling filter: zero crossings per side, Kaiser beta and passband rolloff
+RESAMPLE_ZERO_CROSSINGS = 8
+RESAMPLE_KAISER_BETA = 6.0
+RESAMPLE_ROLLOFF = 0.94
+
+# Input samples processed per vectorized step, bounds the gather matrix
+RESAMPLE_BLOCK_SIZE = 4096
+
+# Bytes of PCM merged into one block when a whole utterance is processed, so
+# the work is not done per 10 ms frame and never on a copy of all of it
+PROCESS_BLOCK_SIZE = 64 * 1024
+
+# Level of a full-scale 16-bit sample, used to express RMS in dBFS
+FULL_SCALE_DB = 20 * math.log10(32768)
+
+
+@dataclass
+class PcmAudio:
+    """16-bit PCM audio kept as views over the original frame buffers."""
+    chunks: list[memoryview]
+    sample_rate: int
+    num_channels: int
+
+    @classmethod
+    def from_buffer(cls, buffer: AudioBuffer) -> "PcmAudio":
+        """Wrap an AudioBuffer without copying its samples."""
+        frames = [buffer] if isinstance(buffer, rtc.AudioFrame) else list(buffer)
+        if not frames:
+            raise ValueError("cannot create PcmAudio from an empty buffer")
+
+        sample_rate = frames[0].sample_rate
+        num_channels = frames[0].num_channels
+        chunks = []
+        for frame in frames:
+            if frame.sample_rate != sample_rate or frame.num_channels != num_channels:
+                raise ValueError("all frames of a buffer must share sample rate and channels")
+            chunks.append(memoryview(frame.data).cast("B"))
+
+        return cls(chunks=chunks, sample_rate=sample_rate, num_channels=num_channels)
+
+    @classmethod
+    def from_arrays(cls, arrays: list[np.ndarray], sample_rate: int, num_channels: int = 1) -> "PcmAudio":
+        """Wrap contiguous int16 arrays without copying them."""
+        chunks = [memoryview(array).cast("B") for array in arrays if len(array)]
+        return cls(chunks=chunks, sample_rate=sample_rate, num_channels=num_channels)
+
+    def as_array(self) -> np.ndarray:
+        """Return the samples as one int16 array, copying only if there are several chunks."""
+        if len(self.chunks) == 1:
+            return np.frombuffer(self.chunks[0], dtype=np.int16)
+        if not self.chunks:
+            return np.zeros(0, dtype=np.int16)
+        return np.concatenate([np.frombuffer(chunk, dtype=np.int16) for chunk in self.chunks])
+
+    def blocks(self, max_bytes: int = PROCESS_BLOCK_SIZE) -> Iterator[np.ndarray]:
+        """Yield the samples as int16 arrays, consecutive small chunks merged up to `max_bytes`."""
+        pending = []
+        size = 0
+        for chunk in self.chunks:
+            if pending and size + chunk.nbytes > max_bytes:
+                yield _merge_chunks(pending)
+                pending, size = [], 0
+            pending.append(chunk)
+            size += chunk.nbytes
+        if pending:
+            yield _merge_chunks(pending)
+
+    def head(self, duration: float) -> "PcmAudio":
+        """Return the first `duration` seconds as views over the same chunks."""
+        remaining = int(duration * self.sample_rate) * self.num_channels * BYTES_PER_SAMPLE
+        chunks = []
+        for chunk in self.chunks:
+            if remaining <= 0:
+                break
+            chunks.append(chunk[:remaining])
+            remaining -= chunk.nbytes
+        return PcmAudio(chunks=chunks, sample_rate=self.sample_rate, num_channels=self.num_channels)
+
+    def slice(self, start: int, end: int) -> "PcmAudio":
+        """Return the samples per channel from `start` to `end` as views over the same chunks."""
+        frame_size = self.num_channels * BYTES_PER_SAMPLE
+        start, end = start * frame_size, end * frame_size
+        chunks = []
+        offset = 0
+        for chunk in self.chunks:
+            if offset >= end:
+                break
+            if offset + chunk.nbytes > start:
+                chunks.append(chunk[max(0, start - offset):end - offset])
+            offset += chunk.nbytes
+        return PcmAudio(chunks=chunks, sample_rate=self.sample_rate, num_channels=self.num_channels)
+
+    @property
+    def num_bytes(self) -> int:
+        return sum(chunk.nbytes for chunk in self.chunks)
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds."""
+        return self.num_bytes / (BYTES_PER_SAMPLE * self.num_channels * self.sample_rate)
+
+
+def _merge_chunks(chunks: list[memoryview]) -> np.ndarray:
+    if len(chunks) == 1:
+        return np.frombuffer(chunks[0], dtype=np.int16)
+    return np.frombuffer(b"".join(chunks), dtype=np.int16)
+
+
+def wav_header(sample_rate: int, num_channels: int, data_size: int) -> bytes:
+    """Build the 44-byte header of a 16-bit PCM WAV file."""
+    byte_rate = sample_rate * num_channels * BYTES_PER_SAMPLE
+    block_align = num_channels * BYTES_PER_SAMPLE
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,  # fmt chunk size
+        1,  # PCM
+        num_channels,
+        sample_rate,
+        byte_rate,
+        block_align,
+        BYTES_PER_SAMPLE * 8,
+        b"data",
+        data_size,
+    )
+
+
+async def iter_wav(audio: PcmAudio) -> AsyncIterator[Union[bytes, memoryview]]:
+    """
+    Yield a WAV file as the header followed by slices of the original buffers
+
+    The samples are never copied, so the allocations per upload do not depend on
+    the length of the audio.
+    """
+    yield wav_header(audio.sample_rate, audio.num_channels, audio.num_bytes)
+    for chunk in audio.chunks:
+        for offset in range(0, chunk.nbytes, UPLOAD_CHUNK_SIZE):
+            yield chunk[offset:offset + UPLOAD_CHUNK_SIZE]
+
+
+@lru_cache(maxsize=None)
+def _polyphase_filter(up: int, down: int) -> np.ndarray:
+    """
+    Design the anti-aliasing filter for an up/down ratio, split into phases
+
+    Returns an (up, taps_per_phase) array where row p holds the taps applied
+    to the input history for outputs of phase p.
+    """
+    width = max(up, down)
+    half_length = RESAMPLE_ZERO_CROSSINGS * width
+    n = np.arange(-half_length, half_length + 1)
+    cutoff = RESAMPLE_ROLLOFF / width
+    taps = cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), RESAMPLE_KAISER_BETA) * up
+
+    taps_per_phase = math.ceil(len(taps) / up)
+    padded = np.zeros(taps_per_phase * up)
+    padded[:len(taps)] = taps
+    return padded.reshape(taps_per_phase, up).T.astype(np.float32).copy()
+
+
+def downmix(samples: np.ndarray, num_channels: int) -> np.ndarray:
+    """Average interleaved channels into a float32 mono signal."""
+    if num_channels == 1:
+        return samples.astype(np.float32)
+    return samples.reshape(-1, num_channels).mean(axis=1, dtype=np.float32)
+
+
+class PolyphaseResampler:
+    """
+    Streaming downmix and rational-ratio resampler for 16-bit PCM
+
+    The filter for each sample rate pair is designed once per process. The
+    resampler keeps the input history between pushes, so frames can be fed as
+    they arrive and the output matches resampling the merged buffer.
+    """
+
+    def __init__(self, input_rate: int, output_rate: int, num_channels: int = 1):
+        divisor = math.gcd(input_rate, output_rate)
+        self._up = output_rate // divisor
+        self._down = input_rate // divisor
+        self._num_channels = num_channels
+        self._filter = _polyphase_filter(self._up, self._down)
+        self._taps_per_phase = self._filter.shape[1]
+        self._tap_offsets = np.arange(self._taps_per_phase)
+        self._history = np.zeros(self._taps_per_phase - 1, dtype=np.float32)
+        self._input_count = 0  # input samples consumed so far
+        self._output_count = 0  # output samples produced so far
+
+    def push(self, pcm: Union[bytes, memoryview, np.ndarray]) -> np.ndarray:
+        """Resample a block of interleaved PCM and return the new mono int16 output."""
+        samples = pcm if isinstance(pcm, np.ndarray) else np.frombuffer(pcm, dtype=np.int16)
+        mono = downmix(samples, self._num_channels)
+
+        outputs = [
+            self._process(mono[start:start + RESAMPLE_BLOCK_SIZE])
+            for start in range(0, len(mono), RESAMPLE_BLOCK_SIZE)
+        ]
+        if not outputs:
+            return np.zeros(0, dtype=np.int16)
+        return np.concatenate(outputs) if len(outputs) > 1 else outputs[0]
+
+    def flush(self) -> np.ndarray:
+        """Push enough silence to drain the filter delay."""
+        delay = (self._taps_per_phase - 1) // 2
+        return self._process(np.zeros(delay, dtype=np.float32))
+
+    def _process(self, block: np.ndarray) -> np.ndarray:
+        extended = np.concatenate((self._history, block))
+        base = self._input_count - len(self._history)
+        self._input_count += len(block)
+
+        last_output = ((self._input_count - 1) * self._up + self._up - 1) // self._down
+        positions = np.arange(self._output_count, last_output + 1, dtype=np.int64) * self._down
+        self._output_count = last_output + 1
+
+        phases = positions % self._up
+        indices = (positions // self._up - base)[:, None] - self._tap_offsets
+        resampled = np.einsum("ij,ij->i", extended[indices], self._filter[phases])
+
+        self._history = extended[len(extended) - len(self._history):]
+        return np.clip(np.rint(resampled), -32768, 32767).astype(np.int16)
+
+
+def resample_audio(audio: PcmAudio, sample_rate: int) -> PcmAudio:
+    """Downmix to mono and resample, returning `audio` itself if nothing changes."""
+    if audio.sample_rate == sample_rate and audio.num_channels == 1:
+        return audio
+
+    # The output stays in one array per block, it is never merged
+    resampler = PolyphaseResampler(audio.sample_rate, sample_rate, audio.num_channels)
+    arrays = [resampler.push(block) for block in audio.blocks()]
+    arrays.append(resampler.flush())
+    return PcmAudio.from_arrays(arrays, sample_rate)
+
+
+def window_energy_db(samples: np.ndarray, window: int) -> np.ndarray:
+    """RMS level in dBFS of consecutive non-overlapping windows, the tail is ignored."""
+    count = len(samples) // window
+    blocks = samples[:count * window].reshape(count, window).astype(np.float32)
+    power = np.einsum("ij,ij->i", blocks, blocks) / window
+    return 10 * np.log10(power + 1e-9) - FULL_SCALE_DB
+
+
+def audio_energy_db(audio: PcmAudio, window: int) -> np.ndarray:
+    """
+    window_energy_db of the mono signal of `audio`, computed block by block
+
+    The audio is never merged as a whole, a window that straddles two blocks
+    is put together from their samples.
+    """
+    levels = []
+    carry = np.zeros(0, dtype=np.float32)
+    for block in audio.blocks():
+        mono = downmix(block, audio.num_channels)
+        if len(carry):
+            needed = window - len(carry)
+            carry = np.concatenate((carry, mono[:needed]))
+            mono = mono[needed:]
+            if len(carry) < window:
+                continue
+            levels.append(window_energy_db(carry, window))
+        levels.append(window_energy_db(mono, window))
+        carry = mono[len(mono) - len(mono) % window:]
+    if not levels:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(levels)
+
+
+def find_split_points(
+    samples: np.ndarray,
+    sample_rate: int,
+    *,
+    max_piece: float,
+    min_piece: float,
+    window: float = 0.02,
+    smoothing: float = 0.2,
+) -> list[int]:
+    """
+    Choose where to cut long mono audio so that no piece exceeds `max_piece` seconds
+
+    Each cut is placed at the quietest point between `min_piece` and
+    `max_piece` seconds after the previous one. Levels are averaged over
+    `smoothing` seconds so cuts land in pauses rather than in short dips
+    inside a word.
+
+    Returns:
+        Sample indices of the cuts in increasing order, empty if no cut is needed
+    """
+    window_size = max(1, int(window * sample_rate))
+    if len(samples) <= int(max_piece * sample_rate):
+        return []
+
+    levels = window_energy_db(samples, window_size)
+    span = max(1, int(smoothing / window))
+    smoothed = np.convolve(levels, np.ones(span) / span, mode="same")
+
+    min_windows = max(1, int(min_piece / window))
+    max_windows = max(min_windows + 1, int(max_piece / window))
+    cuts = []
+    start = 0
+    while len(levels) - start > max_windows:
+        candidates = smoothed[start + min_windows:start + max_windows]
+        start += min_windows + int(np.argmin(candidates))
+        cuts.append(start * window_size)
+    return cuts
+
+
+class SilenceTrimmer:
+    """
+    Cuts leading and trailing silence down to a guard interval
+
+    A window counts as speech when its level is above `threshold_db` and within
+    `dynamic_range_db` of the loudest window, so quiet speakers in a quiet room
+    and loud speakers over hall noise are both trimmed sensibly.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold_db: float = -45.0,
+        dynamic_range_db: float = 35.0,
+        guard: float = 0.15,
+        window: float = 0.02,
+    ):
+        self.threshold_db = threshold_db
+        self.dynamic_range_db = dynamic_range_db
+        self.guard = guard
+        self.window = window
+
+    def _speech_windows(self, audio: PcmAudio) -> tuple[np.ndarray, int]:
+        """Indices of the windows of `audio` that count as speech, and the window size in samples."""
+        window = max(1, int(self.window * audio.sample_rate))
+        levels = audio_energy_db(audio, window)
+        if not len(levels):
+            return np.zeros(0, dtype=np.int64), window
+        threshold = max(self.threshold_db, levels.max() - self.dynamic_range_db)
+        return np.flatnonzero(levels >= threshold), window
+
+    def speech_bounds(self, audio: PcmAudio) -> Optional[tuple[int, int]]:
+        """
+        Find the range of samples per channel to keep
+
+        Returns:
+            (start, end) sample indices including the guard, or None if the
+            audio contains no speech at all
+        """
+        length = audio.num_bytes // (BYTES_PER_SAMPLE * audio.num_channels)
+        active, window = self._speech_windows(audio)
+        if length < window:
+            return 0, length
+        if not len(active):
+            return None
+
+        guard = int(self.guard * audio.sample_rate)
+        start = max(0, int(active[0]) * window - guard)
+        end = min(length, (int(active[-1]) + 1) * window + guard)
+        return start, end
+
+    def voiced_duration(self, audio: PcmAudio) -> float:
+        """Seconds of `audio` in windows that count as speech, pauses within it excluded."""
+        active, window = self._speech_windows(audio)
+        return len(active) * window / audio.sample_rate
+
+    def trim(self, audio: PcmAudio) -> PcmAudio:
+        """Return `audio` without the silence around the speech as views over its chunks, empty if it is all silence."""
+        bounds = self.speech_bounds(audio)
+        if bounds is None:
+            return PcmAudio(chunks=[], sample_rate=audio.sample_rate, num_channels=audio.num_channels)
+
+        start, end = bounds
+        if start == 0 and end * audio.num_channels * BYTES_PER_SAMPLE == audio.num_bytes:
+            return audio
+        return audio.slice(start, end)
+
+
+class PcmRingBuffer:
+    """
+    Preallocated int16 ring buffer holding at most `max_duration` seconds
+
+    Every sample is stored twice, one capacity apart, so any window of the
+    buffered audio is a contiguous view and never needs to be copied. When the
+    buffer is full, `drop_policy` decides whether the oldest audio is
+    overwritten ("drop_oldest") or new audio is discarded ("drop_newest").
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        max_duration: float,
+        *,
+        num_channels: int = 1,
+        drop_policy: str = "drop_oldest",
+    ):
+        if drop_policy not in ("drop_oldest", "drop_newest"):
+            raise ValueError(f"Unknown drop policy '{drop_policy}'")
+
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.drop_policy = drop_policy
+        self._capacity = int(max_duration * sample_rate) * num_channels
+        self._data = np.zeros(2 * self._capacity, dtype=np.int16)
+        self._start = 0  # position of the oldest sample, always below capacity
+        self._size = 0
+        self.total_samples = 0  # samples written since creation, including dropped ones
+        self.dropped_samples = 0
+
+    @property
+    def duration(self) -> float:
+        """Seconds of audio currently buffered."""
+        return self._size / (self.sample_rate * self.num_channels)
+
+    @property
+    def full(self) -> bool:
+        return self._size == self._capacity
+
+    @property
+    def remaining(self) -> float:
+        """Seconds of audio that can be written before the drop policy applies."""
+        return (self._capacity - self._size) / (self.sample_rate * self.num_channels)
+
+    def write(self, samples: np.ndarray) -> None:
+        """Append interleaved samples, applying the drop policy when full."""
+        if self.drop_policy == "drop_newest":
+            accepted = samples[:self._capacity - self._size]
+        else:
+            accepted = samples[-self._capacity:] if len(samples) > self._capacity else samples
+
+        self.total_samples += len(samples)
+        self.dropped_samples += len(samples) - len(accepted)
+        if not len(accepted):
+            return
+
+        position = (self._start + self._size) % self._capacity
+        first = min(len(accepted), self._capacity - position)
+        self._store(position, accepted[:first])
+        self._store(0, accepted[first:])
+
+        overflow = self._size + len(accepted) - self._capacity
+        if overflow > 0:
+            # Only reachable with drop_oldest, the oldest samples were overwritten
+            self._start = (self._start + overflow) % self._capacity
+            self._size = self._capacity
+            self.dropped_samples += overflow
+        else:
+            self._size += len(accepted)
+
+    def _store(self, position: int, samples: np.ndarray) -> None:
+        end = position + len(samples)
+        self._data[position:end] = samples
+        self._data[position + self._capacity:end + self._capacity] = samples
+
+    def view(self, duration: Optional[float] = None) -> np.ndarray:
+        """
+        Return the newest `duration` seconds, or everything, as a contiguous view
+
+        The view stays valid until the buffer is full and overwrites its oldest
+        samples, take a copy before writing more if that can happen.
+        """
+        size = self._size
+        if duration is not None:
+            size = min(size, int(duration * self.sample_rate) * self.num_channels)
+        end = self._start + self._size
+        return self._data[end - size:end]
+
+
+class PcmByteBuffer:
+    """
+    Growing buffer for PCM bytes received in arbitrary chunks
+
+    The storage is preallocated and doubled when full, so appending a chunk
+    copies only that chunk instead of everything received so far as
+    `bytes +=` does. `take()` hands out the whole samples written since the
+    previous call, a chunk that ends inside a sample keeps its last byte
+    until the rest of the sample arrives.
+    """
+
+    def __init__(self, capacity: int = 64 * 1024, *, num_channels: int = 1):
+        self._data = bytearray(max(capacity, 1))
+        self._size = 0
+        self._taken = 0
+        self._frame_size = BYTES_PER_SAMPLE * num_channels
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def usable(self) -> int:
+        """Bytes of the whole samples written so far."""
+        return self._size - self._size % self._frame_size
+
+    def write(self, data: Union[bytes, memoryview]) -> None:
+        end = self._size + len(data)
+        if end > len(self._data):
+            grown = bytearray(max(end, 2 * len(self._data)))
+            grown[:self._size] = memoryview(self._data)[:self._size]
+            self._data = grown
+        self._data[self._size:end] = data
+        self._size = end
+
+    def take(self) -> bytes:
+        """Whole samples written since the previous call."""
+        end = self.usable
+        chunk = bytes(memoryview(self._data)[self._taken:end])
+        self._taken = end
+        return chunk
+
+    def getvalue(self) -> bytes:
+        """All whole samples written so far."""
+        return bytes(memoryview(self._data)[:self.usable])
@@ -0,0 +1,293 @@
+import asyncio
+import dataclasses
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterable, Optional, Union
+
+import numpy as np
+from livekit import rtc
+from livekit.agents import utils, vad
+
+from .audio_utils import FULL_SCALE_DB, PcmAudio, PcmRingBuffer, PolyphaseResampler, resample_audio
+
+
+logger = logging.getLogger("echo-suppression")
+
+# Rate at which agent and mic audio are compared, speech energy is below 4 kHz
+REFERENCE_RATE = 8000
+
+# Reference windows quieter than this are pauses and never match
+REFERENCE_FLOOR_DB = -50.0
+
+
+@dataclass
+class EchoSuppressionStats:
+    """Decisions of the echo suppressor since the VAD wrapper was created."""
+    segments: int = 0
+    checked_segments: int = 0  # segments that started while the agent was audible
+    suppressed_segments: int = 0  # never reported, so never sent to STT
+    released_late: int = 0  # started as echo, released when the user spoke over it
+    last_score: float = 0.0
+    last_delay: float = 0.0
+
+
+def echo_score(mic: np.ndarray, reference: np.ndarray) -> tuple[float, int]:
+    """
+    Peak normalized cross-correlation of `mic` against every offset of `reference`
+
+    Both signals are mono at the same rate. The correlation of all offsets is
+    computed at once in the frequency domain, and each offset is normalized by
+    the energy of the reference window it covers. A pre-emphasis filter
+    flattens the speech spectrum first so the peak is sharp.
+
+    Returns:
+        The score between 0 and 1 and the offset in samples where it was found
+    """
+    size = len(mic)
+    if size == 0 or len(reference) < size:
+        return 0.0, 0
+
+    x = mic.astype(np.float32)
+    x[1:] -= 0.97 * mic[:-1]
+    x -= x.mean()
+    r = reference.astype(np.float32)
+    r[1:] -= 0.97 * reference[:-1]
+
+    mic_energy = float(np.dot(x, x))
+    if mic_energy <= 0.0:
+        return 0.0, 0
+
+    fft_size = 1 << (len(r) + size - 1).bit_length()
+    spectrum = np.fft.rfft(r, fft_size) * np.conj(np.fft.rfft(x, fft_size))
+    correlation = np.fft.irfft(spectrum, fft_size)[:len(r) - size + 1]
+
+    cumulative = np.concatenate(([0.0], np.cumsum(np.square(r, dtype=np.float64))))
+    window_energy = cumulative[size:] - cumulative[:-size]
+    floor = size * 10 ** ((REFERENCE_FLOOR_DB + FULL_SCALE_DB) / 10)
+    valid = window_energy > floor
+
+    scores = np.zeros(len(correlation))
+    scores[valid] = np.abs(correlation[valid]) / np.sqrt(window_energy[valid] * mic_energy)
+    offset = int(np.argmax(scores))
+    return float(min(scores[offset], 1.0)), offset
+
+
+class EchoReference:
+    """
+    Recent audio of the agent's own voice, the signal the microphone may pick up
+
+    Fed from the playback side with `tee` on the frames leaving the agent's
+    tts_node, which the audio output pulls as it plays them, so synthesis
+    running ahead (lookahead, cached phrases, streamed replies) does not run
+    ahead of the reference. Audio is kept at REFERENCE_RATE for `duration`
+    seconds, which must cover the output buffering and the acoustic delay.
+    Frames are assumed to play back to back, so the reference knows until when
+    the agent may be audible.
+    """
+
+    def __init__(self, *, duration: float = 5.0, hold: float = 1.0):
+        """
+        Initialize the echo reference.
+
+        Args:
+            duration: Seconds of agent audio kept for the delay search
+            hold: Seconds after the estimated end of playback the agent still counts as audible
+        """
+        self._ring = PcmRingBuffer(REFERENCE_RATE, duration)
+        self._resamplers: dict[tuple[int, int], PolyphaseResampler] = {}
+        self._hold = hold
+        self._audible_until = 0.0
+
+    async def tee(self, frames: AsyncIterable[rtc.AudioFrame]) -> AsyncIterable[rtc.AudioFrame]:
+        """Pass the frames of a tts_node through, adding each one as it is handed to playback."""
+        async for frame in frames:
+            self.push(frame.data, frame.sample_rate, frame.num_channels)
+            yield frame
+
+    def push(self, pcm: Union[bytes, memoryview], sample_rate: int, num_channels: int = 1) -> None:
+        """Add a chunk of int16 PCM the agent is about to play."""
+        pcm = memoryview(pcm).cast("B")
+        usable = len(pcm) - len(pcm) % (2 * num_channels)
+        if usable <= 0:
+            return
+        samples = np.frombuffer(pcm, dtype=np.int16, count=usable // 2)
+
+        resampler = self._resamplers.get((sample_rate, num_channels))
+        if resampler is None:
+            resampler = PolyphaseResampler(sample_rate, REFERENCE_RATE, num_channels)
+            self._resamplers[(sample_rate, num_channels)] = resampler
+        self._ring.write(resampler.push(samples))
+
+        now = time.monotonic()
+        duration = usable / (2 * num_channels * sample_rate)
+        self._audible_until = max(self._audible_until, now) + duration
+
+    def audible(self) -> bool:
+        """Whether agent audio may still be coming out of the speakers."""
+        return time.monotonic() < self._audible_until + self._hold
+
+    async def match(self, frames: list[rtc.AudioFrame]) -> tuple[float, float]:
+        """
+        Compare mic frames with the reference
+
+        The correlation runs in the default executor on a copy of the
+        reference, pushes continue meanwhile.
+
+        Returns:
+            The echo score and the delay in seconds between the matching
+            reference audio and the newest reference sample
+        """
+        if not frames:
+            return 0.0, 0.0
+        mic = resample_audio(PcmAudio.from_buffer(frames), REFERENCE_RATE).as_array()
+        reference = self._ring.view().copy()
+        score, offset = await asyncio.get_running_loop().run_in_executor(None, echo_score, mic, reference)
+        return score, (len(reference) - offset - len(mic)) / REFERENCE_RATE
+
+
+class EchoSuppressingVAD(vad.VAD):
+    """
+    Wraps a VAD and drops speech segments that are the agent's own voice
+
+    While the agent may be audible, START_OF_SPEECH is held until
+    `check_duration` seconds of the segment are available and compared with
+    the EchoReference. A segment that matches is not reported, and while it
+    lasts its INFERENCE_DONE events carry no speech, so it neither interrupts
+    the agent nor reaches the STT. Later windows of the segment are checked
+    again; when one no longer matches, the user is talking over the agent and
+    the segment is reported from that window on.
+    """
+
+    def __init__(
+        self,
+        wrapped: vad.VAD,
+        reference: EchoReference,
+        *,
+        threshold: float = 0.35,
+        check_duration: float = 0.5,
+    ) -> None:
+        """
+        Initialize the echo suppressing VAD wrapper.
+
+        Args:
+            wrapped: VAD deciding speech on each inference window
+            reference: Agent audio of the same session, fed by EchoReference.tee
+            threshold: Echo score at which a window is the agent's voice
+            check_duration: Seconds of a segment compared at once
+        """
+        super().__init__(capabilities=wrapped.capabilities)
+        self._wrapped = wrapped
+        self._reference = reference
+        self._threshold = threshold
+        self._check_duration = check_duration
+        self.stats = EchoSuppressionStats()
+        self._label = wrapped._label
+
+    @property
+    def model(self) -> str:
+        return self._wrapped.model
+
+    @property
+    def provider(self) -> str:
+        return self._wrapped.provider
+
+    @property
+    def reference(self) -> EchoReference:
+        return self._reference
+
+    def stream(self) -> "EchoSuppressingVADStream":
+        return EchoSuppressingVADStream(self, self._wrapped.stream())
+
+
+class EchoSuppressingVADStream(vad.VADStream):
+    """Stream of EchoSuppressingVAD, forwards audio to the wrapped stream and gates its events."""
+
+    def __init__(self, echo_vad: EchoSuppressingVAD, wrapped: vad.VADStream) -> None:
+        self._echo_vad = echo_vad
+        self._wrapped = wrapped
+        self._pending_start: Optional[vad.VADEvent] = None
+        self._pending_frames: list[rtc.AudioFrame] = []
+        self._suppressing = False
+        super().__init__(echo_vad)
+
+    async def _main_task(self) -> None:
+        forward_task = asyncio.create_task(self._forward_input())
+        try:
+            async for event in self._wrapped:
+                for gated in await self._gate(event):
+                    self._event_ch.send_nowait(gated)
+        finally:
+            await utils.aio.cancel_and_wait(forward_task)
+            await self._wrapped.aclose()
+
+    async def _forward_input(self) -> None:
+        async for frame in self._input_ch:
+            if isinstance(frame, self._FlushSentinel):
+                self._wrapped.flush()
+                continue
+            self._wrapped.push_frame(frame)
+        self._wrapped.end_input()
+
+    async def _gate(self, event: vad.VADEvent) -> list[vad.VADEvent]:
+        """Hold START_OF_SPEECH until the segment is known not to be echo"""
+        stats = self._echo_vad.stats
+
+        if event.type == vad.VADEventType.START_OF_SPEECH:
+            stats.segments += 1
+            if not self._echo_vad.reference.audible():
+                return [event]
+            stats.checked_segments += 1
+            self._pending_start = event
+            self._pending_frames = list(event.frames)
+            self._suppressing = False
+            return await self._check(final=False)
+
+        if self._pending_start is None:
+            return [event]
+
+        if event.type == vad.VADEventType.INFERENCE_DONE:
+            self._pending_frames.extend(event.frames)
+            released = await self._check(final=False)
+            if released:
+                return released + [event]
+            # Held speech must not interrupt the agent
+            return [dataclasses.replace(event, speaking=False, speech_duration=0.0, probability=0.0)]
+
+        # END_OF_SPEECH of a held segment, decide on whatever audio is left
+        released = await self._check(final=True) if self._pending_frames else []
+        if released:
+            return released + [event]
+        if self._suppressing:
+            stats.suppressed_segments += 1
+            logger.debug(
+                f"Suppressed {event.speech_duration:.2f}s of speech matching the agent's voice "
+                f"(score {stats.last_score:.2f}, delay {stats.last_delay:.2f}s)"
+            )
+        self._pending_start = None
+        self._pending_frames = []
+        self._suppressing = False
+        return []
+
+    async def _check(self, *, final: bool) -> list[vad.VADEvent]:
+        """Compare the held window with the reference, release the start if it is not echo"""
+        held = sum(frame.samples_per_channel / frame.sample_rate for frame in self._pending_frames)
+        if held < self._echo_vad._check_duration and not final:
+            return []
+
+        stats = self._echo_vad.stats
+        score, delay = await self._echo_vad.reference.match(self._pending_frames)
+        stats.last_score = score
+        stats.last_delay = delay
+        if score >= self._echo_vad._threshold:
+            self._suppressing = True
+            self._pending_frames = []
+            return []
+
+        if self._suppressing:
+            stats.released_late += 1
+        start = dataclasses.replace(self._pending_start, frames=self._pending_frames)
+        self._pending_start = None
+        self._pending_frames = []
+        self._suppressing = False
+        return [start]
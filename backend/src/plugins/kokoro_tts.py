@@ -1,6 +1,8 @@
 import asyncio
+import collections
 import logging
 import re
+import time
 from dataclasses import dataclass
 from typing import Optional, AsyncIterator, Literal
 
@@ -17,6 +19,8 @@ from livekit.agents.utils import is_given
 import httpx
 import openai
 
+from .tts_cache import TTSAudioCache
+
 
 logger = logging.getLogger("kokoro-tts")
 
@@ -27,6 +31,27 @@ TTS_CHANNELS = 1
 # Type definitions
 TTSVoices = Literal["echo", "af_heart", "af_bella", "af_sky"]
 
+# Pauses travel through the text as markers (private use characters around
+# the pause class) and are rendered as silence instead of being synthesized
+PAUSE_MARKER_PATTERN = re.compile("\uE000(\\w+)\uE001")
+
+# Text pieces between pause markers that are not worth a synthesis request
+SILENT_TEXT = ['.', ',', '!', '?', ';', ':', '\n', '\r\n']
+
+
+def pause_marker(kind: str) -> str:
+    """Marker for a pause of class `kind`, see PauseDurations."""
+    return f"\uE000{kind}\uE001"
+
+
+@dataclass
+class PauseDurations:
+    """Seconds of silence rendered for each class of pause marker."""
+    comma: float = 0.2  # ,
+    clause: float = 0.3  # ; and :
+    ellipsis: float = 0.5  # ... and the spoken forms of e.g., i.e., etc.
+    chunk: float = 0.4  # between the sentences/phrases TextBuffer releases
+
 class TextBuffer:
     """Buffers text chunks and releases complete sentences/phrases for more natural TTS."""
     
@@ -71,15 +96,14 @@ class TextBuffer:
         # Add slight pauses after certain punctuation for more natural flow
         text = re.sub(r'([.!?])\s+', r'\1 ', text)  # Normalize spacing
         
-        # Add pauses after commas for more natural speech rhythm
-        # Using ellipsis (...) which TTS engines interpret as pauses (~1.5 seconds)
-        text = re.sub(r',\s*', '... ', text)  # Replace comma with ellipsis for pause
-        text = re.sub(r'([;:])\s*', r'\1 ', text)  # Ensure space after semicolons/colons
+        # Pauses after commas and clauses are marked per chunk, see _optimize_chunk_for_speech.
+        # A delta can end right after the punctuation, so only existing spacing is normalized
+        text = re.sub(r'([;:])\s+', r'\1 ', text)  # Normalize space after semicolons/colons
         
         # Convert some written forms to spoken forms
-        text = re.sub(r'\be\.g\.\s*', 'for example... ', text, flags=re.IGNORECASE)
-        text = re.sub(r'\bi\.e\.\s*', 'that is... ', text, flags=re.IGNORECASE)
-        text = re.sub(r'\betc\.\s*', 'and so on... ', text, flags=re.IGNORECASE)
+        text = re.sub(r'\be\.g\.\s*', 'for example' + pause_marker("ellipsis") + ' ', text, flags=re.IGNORECASE)
+        text = re.sub(r'\bi\.e\.\s*', 'that is' + pause_marker("ellipsis") + ' ', text, flags=re.IGNORECASE)
+        text = re.sub(r'\betc\.\s*', 'and so on' + pause_marker("ellipsis") + ' ', text, flags=re.IGNORECASE)
         text = re.sub(r'\bvs\.\s*', 'versus ', text, flags=re.IGNORECASE)
         
         # Handle numbers and abbreviations more naturally
@@ -97,8 +121,12 @@ class TextBuffer:
         # Ensure proper spacing and punctuation
         chunk = re.sub(r'\s+', ' ', chunk)  # Normalize whitespace
         
-        # Ensure ellipsis (pause markers) have proper spacing
-        chunk = re.sub(r'\.{3,}\s*', '... ', chunk)  # Normalize ellipsis spacing
+        # Pauses for more natural speech rhythm, rendered as silence so the TTS
+        # server never synthesizes them. Only punctuation followed by a space
+        # pauses, "1,000" and "10:30" are read as they are.
+        chunk = re.sub(r',\s+', ',' + pause_marker("comma") + ' ', chunk)
+        chunk = re.sub(r'([;:])\s+', r'\1' + pause_marker("clause") + ' ', chunk)
+        chunk = re.sub(r'(?:\.{3,}|\u2026)\s*', pause_marker("ellipsis") + ' ', chunk).strip()
             
         return chunk
     
@@ -176,7 +204,7 @@ class TextBuffer:
     def flush(self) -> Optional[str]:
         """Flush remaining buffer content."""
         if self._buffer.strip():
-            content = self._buffer.strip()
+            content = self._optimize_chunk_for_speech(self._buffer)
             self._buffer = ""
             return content
         return None
@@ -206,7 +234,11 @@ class KokoroTTS(tts.TTS):
         client: Optional[openai.AsyncClient] = None,
         buffer_sentences: bool = True,
         flush_timeout: float = 1.5,
-        inter_chunk_pause: float = 1.5,  # Pause between TTS chunks in seconds
+        inter_chunk_pause: Optional[float] = None,  # Pause between TTS chunks in seconds, pauses["chunk"]
+        pauses: Optional[dict[str, float]] = None,  # seconds per pause class, see PauseDurations
+        lookahead_sentences: int = 2,  # sentences synthesized while the current one plays
+        max_queued_sentences: int = 8,  # sentences waiting for synthesis before async producers wait
+        cache: Optional[TTSAudioCache] = None,  # audio of phrases synthesized before
     ) -> None:
         super().__init__(
             capabilities=tts.TTSCapabilities(streaming=True),
@@ -222,7 +254,11 @@ class KokoroTTS(tts.TTS):
         self._text_buffer = TextBuffer(flush_timeout=flush_timeout) if buffer_sentences else None
         self._buffer_lock = asyncio.Lock() if buffer_sentences else None
         self._flush_task = None
-        self._inter_chunk_pause = inter_chunk_pause
+        chunk_pause = {"chunk": inter_chunk_pause} if inter_chunk_pause is not None else {}
+        self._pauses = PauseDurations(**{**chunk_pause, **(pauses or {})})
+        self._lookahead_sentences = max(0, lookahead_sentences)
+        self._max_queued_sentences = max(1, max_queued_sentences)
+        self._cache = cache
 
     def _create_client(self, base_url: str, api_key: str) -> openai.AsyncClient:
         """Create and configure OpenAI client."""
@@ -354,7 +390,7 @@ class KokoroTTS(tts.TTS):
     async def aclose(self):
         """Clean up resources"""
         if self._client:
-            await self._client.aclose()
+            await self._client.close()
 
 
 class KokoroTTSStreamingInterface:
@@ -443,17 +479,34 @@ class KokoroTTSStreamingInterface:
 
 
 class KokoroTTSBufferedStreamingInterface:
-    """Buffered streaming interface for Kokoro TTS that accumulates text into sentences."""
+    """
+    Buffered streaming interface for Kokoro TTS that accumulates text into sentences.
+
+    While a sentence plays, up to `lookahead_sentences` of the next ones are
+    already being synthesized, each by its own KokoroTTSChunkedStream, and are
+    played in order. The sentence queue holds at most `max_queued_sentences`:
+    apush_text waits for room and the timeout flush is held back until there
+    is some. push_text cannot wait, sentences it queues while the queue is
+    full are kept in order behind it.
+    Closing the stream never waits for room, so an interrupt cannot hang on
+    a queue nobody drains.
+    """
     
     def __init__(self, tts_impl: KokoroTTS, conn_options: APIConnectOptions):
         self._tts_impl = tts_impl
         self._conn_options = conn_options
         self._text_buffer = TextBuffer(flush_timeout=1.5)
-        self._sentence_queue = asyncio.Queue()
+        self._sentence_queue = asyncio.Queue(maxsize=tts_impl._max_queued_sentences)
+        self._overflow = collections.deque()  # queued by push_text while the queue was full
+        self._room = asyncio.Event()  # set while the queue can take a sentence
+        self._room.set()
         self._closed = False
         self._flush_task = None
         self._current_stream = None
-        self._last_chunk_time = 0.0  # Track timing for inter-chunk pauses
+        self._lookahead = collections.deque()  # started streams of the next sentences
+        self._ended = False  # the end-of-stream marker was dequeued
+        self._last_audio = None  # last audio yielded, the chunk pause follows it
+        self._pause_frames = collections.deque()  # silence yielded before the next sentence
         self._end_of_stream_marker = object()  # Sentinel value to signal end of stream
         self._last_activity_time = 0.0  # Track last text push or flush activity
 
@@ -467,13 +520,7 @@ class KokoroTTSBufferedStreamingInterface:
         """Exit the streaming context."""
         self._closed = True
         
-        # Flush any remaining text (tool calls are already filtered in push_text)
-        remaining = self._text_buffer.flush()
-        if remaining:
-            logger.info(f"[FLUSH] Flushing remaining text on exit: '{remaining[:50]}...'")
-            await self._sentence_queue.put(remaining)
-        
-        # Cancel flush task
+        # Cancel flush task first, so it cannot queue text after the end marker
         if self._flush_task:
             self._flush_task.cancel()
             try:
@@ -481,10 +528,87 @@ class KokoroTTSBufferedStreamingInterface:
             except asyncio.CancelledError:
                 pass
         
+        # Flush any remaining text (tool calls are already filtered in push_text),
+        # an interrupted stream drops it
+        remaining = self._text_buffer.flush()
+        if remaining and exc_type is None:
+            logger.info(f"[FLUSH] Flushing remaining text on exit: '{remaining[:50]}...'")
+            self._put_sentence(remaining)
+        
         # Signal end of stream (the monitor task may have already done this)
-        await self._sentence_queue.put(self._end_of_stream_marker)
+        self._put_sentence(self._end_of_stream_marker)
         logger.info("[STREAM] TTS stream marked complete, closing...")
 
+        if exc_type is not None:
+            # Interrupted, drop the sentences synthesized ahead
+            await self.aclose()
+
+    async def aclose(self):
+        """Stop the current and the lookahead syntheses."""
+        streams = [self._current_stream, *self._lookahead] if self._current_stream else list(self._lookahead)
+        self._current_stream = None
+        self._lookahead.clear()
+        for stream in streams:
+            await stream.aclose()
+
+    def _put_sentence(self, sentence):
+        """Queue a sentence or the end marker without waiting, behind those kept while the queue was full."""
+        if self._overflow or self._sentence_queue.full():
+            self._overflow.append(sentence)
+        else:
+            self._sentence_queue.put_nowait(sentence)
+        if self._overflow or self._sentence_queue.full():
+            self._room.clear()
+
+    def _sentence_taken(self):
+        """Move sentences kept while the queue was full into the room a dequeued one left."""
+        while self._overflow and not self._sentence_queue.full():
+            self._sentence_queue.put_nowait(self._overflow.popleft())
+        if not self._overflow and not self._sentence_queue.full():
+            self._room.set()
+
+    def _start_stream(self, sentence: str) -> "KokoroTTSChunkedStream":
+        # The stream requests the audio as soon as it is created
+        return KokoroTTSChunkedStream(
+            tts=self._tts_impl,
+            input_text=sentence,
+            conn_options=self._conn_options,
+        )
+
+    def _fill_lookahead(self):
+        """Start synthesizing queued sentences until the lookahead is full."""
+        while not self._ended and len(self._lookahead) < self._tts_impl._lookahead_sentences:
+            try:
+                sentence = self._sentence_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            self._sentence_taken()
+            if sentence is self._end_of_stream_marker:
+                self._ended = True
+                return
+            self._lookahead.append(self._start_stream(sentence))
+
+    def _play_next(self, stream: "KokoroTTSChunkedStream"):
+        """
+        Make `stream` current, after the chunk pause when a sentence played before
+
+        The pause trails the previous sentence as frames of its own, so the
+        next stream's time to first audio is measured on speech.
+        """
+        self._current_stream = stream
+        duration = self._tts_impl._pauses.chunk
+        if self._last_audio is None or duration <= 0:
+            return
+        samples_per_frame = TTS_SAMPLE_RATE // 10
+        remaining = int(duration * TTS_SAMPLE_RATE)
+        while remaining > 0:
+            samples = min(samples_per_frame, remaining)
+            remaining -= samples
+            frame = rtc.AudioFrame(bytes(samples * TTS_CHANNELS * 2), TTS_SAMPLE_RATE, TTS_CHANNELS, samples)
+            self._pause_frames.append(
+                tts.SynthesizedAudio(frame=frame, request_id=self._last_audio.request_id, segment_id=self._last_audio.segment_id)
+            )
+
     def __aiter__(self):
         """Return self as async iterator."""
         return self
@@ -494,43 +618,45 @@ class KokoroTTSBufferedStreamingInterface:
         import time
         
         while True:
+            if self._pause_frames:
+                return self._pause_frames.popleft()
+
             # If we have a current stream, try to get the next item from it
             if self._current_stream is not None:
+                # Upcoming sentences synthesize while this one plays
+                self._fill_lookahead()
                 try:
                     result = await self._current_stream.__anext__()
+                    self._last_audio = result
                     return result
                 except StopAsyncIteration:
-                    # Mark the time when this chunk finished
-                    self._last_chunk_time = time.time()
                     self._current_stream = None
                     # Continue to check for more sentences
             
-            # Check if we need to add a pause between chunks
-            current_time = time.time()
-            if (self._last_chunk_time > 0 and 
-                current_time - self._last_chunk_time < self._tts_impl._inter_chunk_pause):
-                # Add natural pause between chunks
-                pause_needed = self._tts_impl._inter_chunk_pause - (current_time - self._last_chunk_time)
-                # logger.info(f"?? Adding {pause_needed:.1f}s pause between TTS chunks")
-                await asyncio.sleep(pause_needed)
+            # Continue with the next sentence synthesized ahead, in order
+            self._fill_lookahead()
+            if self._lookahead:
+                self._play_next(self._lookahead.popleft())
+                continue
+            if self._ended:
+                logger.info("[STREAM] End-of-stream marker received, stopping iteration")
+                raise StopAsyncIteration
             
             # Wait for a complete sentence to be available
             # Use shorter timeout when closed to exit faster
             timeout = 0.5 if self._closed else 2.0
             try:
                 sentence = await asyncio.wait_for(self._sentence_queue.get(), timeout=timeout)
+                self._sentence_taken()
                 
                 # Check for end-of-stream marker
                 if sentence is self._end_of_stream_marker:
+                    self._ended = True
                     logger.info("[STREAM] End-of-stream marker received, stopping iteration")
                     raise StopAsyncIteration
                 
                 # Create a new stream for this sentence
-                self._current_stream = KokoroTTSChunkedStream(
-                    tts=self._tts_impl,
-                    input_text=sentence,
-                    conn_options=self._conn_options,
-                )
+                self._play_next(self._start_stream(sentence))
                 # Continue to the next iteration to get audio from this stream
                 
             except asyncio.TimeoutError:
@@ -548,11 +674,13 @@ class KokoroTTSBufferedStreamingInterface:
         while not self._closed:
             await asyncio.sleep(0.1)  # Check every 100ms
             
-            if self._text_buffer.should_flush():
+            # While the sentence queue is full the tail waits in the text buffer,
+            # flushing it later keeps it behind the sentences push_text queues meanwhile
+            if self._room.is_set() and self._text_buffer.should_flush():
                 remaining = self._text_buffer.flush()
                 if remaining:
                     logger.info(f"? Timeout flush: '{remaining[:50]}...'")
-                    await self._sentence_queue.put(remaining)
+                    self._put_sentence(remaining)
                     self._last_activity_time = time.time()
             
             # Auto-complete stream if:
@@ -566,7 +694,7 @@ class KokoroTTSBufferedStreamingInterface:
                 self._last_activity_time > 0 and 
                 (current_time - self._last_activity_time) > 2.0):
                 logger.info("[STREAM] No new text for 2s after last activity, auto-completing stream")
-                await self._sentence_queue.put(self._end_of_stream_marker)
+                self._put_sentence(self._end_of_stream_marker)
                 break  # Exit the monitor task
 
     def push_text(self, text: str):
@@ -584,10 +712,10 @@ class KokoroTTSBufferedStreamingInterface:
                 remaining = self._text_buffer.flush()
                 if remaining and not ("```tool_calls" in remaining or '"function"' in remaining):
                     logger.info(f"[FLUSH] Flushing remaining text before tool call: '{remaining[:50]}...'")
-                    self._sentence_queue.put_nowait(remaining)
+                    self._put_sentence(remaining)
             
             # Signal stream completion immediately
-            self._sentence_queue.put_nowait(self._end_of_stream_marker)
+            self._put_sentence(self._end_of_stream_marker)
             return
         
         # Update activity timestamp for normal text
@@ -598,10 +726,11 @@ class KokoroTTSBufferedStreamingInterface:
         
         # Queue each complete sentence for TTS
         for sentence in complete_sentences:
-            self._sentence_queue.put_nowait(sentence)
+            self._put_sentence(sentence)
 
     async def apush_text(self, text: str):
-        """Async push text to the buffer."""
+        """Async push text to the buffer, waiting while the sentence queue is full."""
+        await self._room.wait()
         self.push_text(text)
 
     def clear_buffer(self):
@@ -658,10 +787,13 @@ class KokoroTTSChunkedStream(tts.ChunkedStream):
         if self._audio_generated:
             return
 
-        stripped_text = self.input_text.strip()
+        # Pause markers are rendered locally, the check is on what is left to say
+        stripped_text = PAUSE_MARKER_PATTERN.sub("", self.input_text).strip()
         
-        # Skip synthesis for empty text, punctuation-only, OR tool calls JSON
-        if not stripped_text or stripped_text in ['.', ',', '!', '?', ';', ':', '\n', '\r\n']:
+        # Skip synthesis for empty text, punctuation-only, OR tool calls JSON.
+        # A chunk holding only pauses (e.g. "...") still plays them.
+        has_pauses = PAUSE_MARKER_PATTERN.search(self.input_text) is not None
+        if (not stripped_text or stripped_text in SILENT_TEXT) and not has_pauses:
             logger.info(f"[SKIP] Skipping synthesis for punctuation/empty text: '{self.input_text}'")
             self._audio_generated = True
             return
@@ -685,28 +817,28 @@ class KokoroTTSChunkedStream(tts.ChunkedStream):
             )
             emitter_initialized = True
 
-            # Create streaming request
-            oai_stream = self._tts._client.audio.speech.with_streaming_response.create(
-                input=self.input_text,
-                model=self._tts._opts.model,
-                voice=self._tts._opts.voice,
-                response_format="pcm",
-                speed=self._tts._opts.speed,
-                timeout=httpx.Timeout(30, connect=self._conn_options.timeout),
-            )
-
-            all_audio_data = b""
-            async with oai_stream as stream:
-                async for data in stream.iter_bytes():
-                    all_audio_data += data
+            # The split keeps the marker classes at the odd indices: text between
+            # pauses is synthesized, pauses become zero PCM of their configured length.
+            # Pauses ahead of the first speech are dropped, the chunk pause already
+            # precedes it and TTFB is measured on speech, unless there is no speech.
+            received = 0
+            leading_pause = 0.0
+            for index, part in enumerate(PAUSE_MARKER_PATTERN.split(self.input_text)):
+                if index % 2:
+                    duration = getattr(self._tts._pauses, part, 0.0)
+                    if received:
+                        received += self._push_silence(output_emitter, duration)
+                    else:
+                        leading_pause += duration
+                elif part.strip() and part.strip() not in SILENT_TEXT:
+                    received += await self._synthesize(part.strip(), output_emitter)
+            if not received:
+                received = self._push_silence(output_emitter, leading_pause)
             
-            if len(all_audio_data) == 0:
+            if received == 0:
                 logger.warning("No audio data received from Kokoro TTS server")
                 return
             
-            # Push the complete audio data as bytes
-            output_emitter.push(all_audio_data)
-            
             # Flush the emitter to indicate completion
             output_emitter.flush()
             
@@ -732,4 +864,72 @@ class KokoroTTSChunkedStream(tts.ChunkedStream):
                 try:
                     output_emitter.end_input()
                 except Exception as e:
-                    logger.error(f"Error ending output emitter: {e}")
\ No newline at end of file
+                    logger.error(f"Error ending output emitter: {e}")
+
+    async def _synthesize(self, text: str, output_emitter: tts.AudioEmitter) -> int:
+        """Emit the PCM of `text`, from the cache if it was synthesized before, returning the bytes emitted."""
+        cache = self._tts._cache
+        if cache is None:
+            return await self._request(text, output_emitter)
+
+        opts = self._tts._opts
+        key = cache.key(text, voice=opts.voice, speed=opts.speed, model=opts.model, sample_rate=TTS_SAMPLE_RATE)
+        pcm = await cache.acquire(key)
+        if pcm is not None:
+            logger.debug(f"Kokoro cache hit for '{text[:30]}'")
+            output_emitter.push(pcm)
+            return len(pcm)
+
+        recorded = bytearray()
+        try:
+            received = await self._request(text, output_emitter, recorded)
+        except BaseException:
+            cache.release(key, None)
+            raise
+        cache.release(key, bytes(recorded))
+        return received
+
+    async def _request(self, text: str, output_emitter: tts.AudioEmitter, recorded: Optional[bytearray] = None) -> int:
+        """Request `text` from Kokoro and emit its PCM as it arrives, returning the bytes emitted."""
+        oai_stream = self._tts._client.audio.speech.with_streaming_response.create(
+            input=text,
+            model=self._tts._opts.model,
+            voice=self._tts._opts.voice,
+            response_format="pcm",
+            speed=self._tts._opts.speed,
+            timeout=httpx.Timeout(30, connect=self._conn_options.timeout),
+        )
+
+        # Forward the PCM as it streams in, the emitter's TTSMetrics.ttfb then
+        # measures the time to the first audio instead of the whole sentence.
+        # Chunks can end inside a sample, its first byte waits for the next chunk.
+        started = time.perf_counter()
+        received = 0
+        pending = b""
+        async with oai_stream as stream:
+            async for data in stream.iter_bytes():
+                if not data:
+                    continue
+                if pending:
+                    data = pending + data
+                usable = len(data) - len(data) % (2 * TTS_CHANNELS)
+                pending = data[usable:]
+                if not usable:
+                    continue
+                if not received:
+                    logger.debug(f"Kokoro first audio after {time.perf_counter() - started:.3f}s")
+                received += usable
+                output_emitter.push(data[:usable])
+                if recorded is not None:
+                    recorded += data[:usable]
+
+        if pending:
+            logger.warning(f"Dropped {len(pending)} trailing byte(s) of a partial sample from Kokoro TTS")
+        return received
+
+    def _push_silence(self, output_emitter: tts.AudioEmitter, duration: float) -> int:
+        """Emit `duration` seconds of zero PCM, returning the bytes emitted."""
+        size = int(duration * TTS_SAMPLE_RATE) * TTS_CHANNELS * 2
+        if size > 0:
+            output_emitter.push(bytes(size))
+        return max(size, 0)
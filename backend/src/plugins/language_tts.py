@@ -0,0 +1,107 @@
+import logging
+from typing import Any, Callable, Optional
+
+from livekit.agents import (
+    APIConnectOptions,
+    tts,
+)
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS
+
+
+logger = logging.getLogger("language-tts")
+
+
+class LanguageSwitchingTTS(tts.TTS):
+    """
+    TTS that delegates to one engine per language and can switch at runtime
+
+    Engines are created on first use from `factories` and kept for the rest
+    of the session, so switching back and forth does not reconnect. A switch
+    applies to the next synthesis, audio already being spoken is not cut.
+    Engines without native streaming are wrapped in a StreamAdapter.
+    """
+
+    def __init__(
+        self,
+        factories: dict[str, Callable[[], tts.TTS]],
+        *,
+        language: str,
+        default_language: str = "en",
+    ) -> None:
+        """
+        Initialize the language switching TTS.
+
+        Args:
+            factories: TTS factory per language code
+            language: Language to speak initially
+            default_language: Language used for codes without a factory
+        """
+        self._factories = factories
+        self._default_language = default_language
+        self._instances: dict[str, tts.TTS] = {}
+        self._adapters: dict[str, tts.StreamAdapter] = {}
+        self._language = self._supported(language)
+
+        # Frames carry their own rate and are resampled by the session when it differs
+        initial = self._engine(self._language)
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=True),
+            sample_rate=initial.sample_rate,
+            num_channels=initial.num_channels,
+        )
+
+    @property
+    def language(self) -> str:
+        return self._language
+
+    def set_language(self, language: str) -> bool:
+        """Speak `language` from the next synthesis on, returns whether it changed."""
+        language = self._supported(language)
+        if language == self._language:
+            return False
+
+        logger.info(f"Switching TTS from '{self._language}' to '{language}'")
+        self._language = language
+        self._engine(language)
+        return True
+
+    def synthesize(
+        self,
+        text: str,
+        *,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> tts.ChunkedStream:
+        return self._engine(self._language).synthesize(text, conn_options=conn_options)
+
+    def stream(self, *, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS):
+        engine = self._engine(self._language)
+        if engine.capabilities.streaming:
+            return engine.stream(conn_options=conn_options)
+
+        adapter = self._adapters.get(self._language)
+        if adapter is None:
+            adapter = tts.StreamAdapter(tts=engine)
+            self._adapters[self._language] = adapter
+        return adapter.stream(conn_options=conn_options)
+
+    def _supported(self, language: Optional[str]) -> str:
+        return language if language in self._factories else self._default_language
+
+    def _engine(self, language: str) -> tts.TTS:
+        engine = self._instances.get(language)
+        if engine is None:
+            engine = self._factories[language]()
+            engine.on("metrics_collected", self._on_metrics_collected)
+            self._instances[language] = engine
+        return engine
+
+    def _on_metrics_collected(self, *args: Any, **kwargs: Any) -> None:
+        self.emit("metrics_collected", *args, **kwargs)
+
+    async def aclose(self):
+        """Clean up every engine created during the session"""
+        for adapter in self._adapters.values():
+            await adapter.aclose()
+        for engine in self._instances.values():
+            engine.off("metrics_collected", self._on_metrics_collected)
+            await engine.aclose()
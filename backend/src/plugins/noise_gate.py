@@ -0,0 +1,275 @@
+import asyncio
+import dataclasses
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from livekit import rtc
+from livekit.agents import utils, vad
+
+from .audio_utils import window_energy_db
+
+
+logger = logging.getLogger("noise-gate")
+
+# Window of the energy estimator in seconds
+LEVEL_WINDOW = 0.01
+
+# Below this floor the room is quiet and the base activation threshold applies
+QUIET_FLOOR_DB = -60.0
+
+
+@dataclass
+class NoiseGateStats:
+    """Decisions of the noise gate since the VAD wrapper was created."""
+    segments: int = 0
+    rejected_segments: int = 0  # speech segments never reported, so never sent to STT
+    threshold_updates: int = 0
+    noise_floor_db: float = QUIET_FLOOR_DB
+    activation_threshold: float = 0.0
+
+
+@dataclass
+class NoiseGateMetrics:
+    """Snapshot emitted as "noise_gate_metrics" by AdaptiveVAD."""
+    timestamp: float
+    noise_floor_db: float
+    activation_threshold: float
+    segments: int
+    rejected_segments: int
+
+
+def frame_levels_db(frame: rtc.AudioFrame, window: float = LEVEL_WINDOW) -> np.ndarray:
+    """RMS level in dBFS of the consecutive windows of a frame, mixed down to mono."""
+    samples = np.frombuffer(frame.data, dtype=np.int16)
+    if frame.num_channels > 1:
+        samples = samples.reshape(-1, frame.num_channels).mean(axis=1)
+    size = max(1, min(len(samples), int(window * frame.sample_rate)))
+    if not len(samples):
+        return np.full(1, -120.0, dtype=np.float32)
+    return window_energy_db(samples, size)
+
+
+class NoiseFloorTracker:
+    """
+    Follows the background level of a session as a low percentile of recent windows
+
+    The window levels of the last `history` seconds are kept and the floor is
+    their `percentile`. Speech has gaps between words and phrases, so even
+    seconds of talking leave enough quiet windows to hold the floor, while
+    hall chatter that fills the whole history raises it. A quieter room
+    lowers it as soon as a tenth of the history is quiet. The percentile is
+    recomputed once per `update_interval` seconds of audio, not per frame.
+    """
+
+    def __init__(
+        self,
+        *,
+        history: float = 5.0,
+        percentile: float = 10.0,
+        window: float = LEVEL_WINDOW,
+        update_interval: float = 0.1,
+        initial_db: float = QUIET_FLOOR_DB,
+    ):
+        self.percentile = percentile
+        self.floor_db = initial_db
+        self._levels = np.full(max(1, int(history / window)), initial_db, dtype=np.float32)
+        self._next = 0
+        self._count = 0
+        self._update_windows = max(1, int(update_interval / window))
+        self._since_update = 0  # windows added since the floor was computed
+
+    def update(self, levels_db: np.ndarray) -> float:
+        """Add the window levels of new audio to the history and return the floor."""
+        size = len(self._levels)
+        levels = levels_db[-size:]
+        first = min(len(levels), size - self._next)
+        self._levels[self._next:self._next + first] = levels[:first]
+        self._levels[:len(levels) - first] = levels[first:]
+        self._next = (self._next + len(levels)) % size
+        self._count = min(self._count + len(levels), size)
+
+        self._since_update += len(levels_db)
+        if self._since_update >= self._update_windows:
+            self._since_update = 0
+            self.floor_db = float(np.percentile(self._levels[:self._count], self.percentile))
+        return self.floor_db
+
+
+class AdaptiveVAD(vad.VAD):
+    """
+    Wraps a VAD with a per-session noise floor that gates speech segments
+
+    Two decisions follow the floor. The activation threshold of the wrapped
+    stream rises from its base value at `QUIET_FLOOR_DB` up to
+    `max_activation_threshold` at `loud_floor_db`. And a segment is only
+    reported once some of its audio is `min_snr_db` above the floor; segments
+    that end before that are dropped with their END_OF_SPEECH, so they never
+    reach the STT, and their INFERENCE_DONE events carry no speech while the
+    start is held, so they do not interrupt the agent either. Decisions are
+    exported as "noise_gate_metrics" events.
+    """
+
+    def __init__(
+        self,
+        wrapped: vad.VAD,
+        *,
+        max_activation_threshold: float = 0.8,
+        loud_floor_db: float = -30.0,
+        min_snr_db: float = 8.0,
+        metrics_interval: float = 5.0,
+    ) -> None:
+        """
+        Initialize the adaptive VAD wrapper.
+
+        Args:
+            wrapped: VAD deciding speech on each inference window
+            max_activation_threshold: Activation threshold at a loud floor
+            loud_floor_db: Floor in dBFS at which the threshold is highest
+            min_snr_db: Level above the floor a segment needs to be reported
+            metrics_interval: Seconds of audio between two metrics events
+        """
+        super().__init__(capabilities=wrapped.capabilities)
+        self._wrapped = wrapped
+        self._max_activation_threshold = max_activation_threshold
+        self._loud_floor_db = loud_floor_db
+        self._min_snr_db = min_snr_db
+        self._metrics_interval = metrics_interval
+        self.stats = NoiseGateStats()
+        self._label = wrapped._label
+
+    @property
+    def model(self) -> str:
+        return self._wrapped.model
+
+    @property
+    def provider(self) -> str:
+        return self._wrapped.provider
+
+    def stream(self) -> "AdaptiveVADStream":
+        return AdaptiveVADStream(self, self._wrapped.stream())
+
+    def activation_threshold(self, base: float, floor_db: float) -> float:
+        """Activation threshold for a noise floor, rising linearly above a quiet room."""
+        loudness = (floor_db - QUIET_FLOOR_DB) / (self._loud_floor_db - QUIET_FLOOR_DB)
+        loudness = min(max(loudness, 0.0), 1.0)
+        return base + loudness * max(self._max_activation_threshold - base, 0.0)
+
+
+class AdaptiveVADStream(vad.VADStream):
+    """Stream of AdaptiveVAD, forwards audio to the wrapped stream and gates its events."""
+
+    def __init__(self, adaptive_vad: AdaptiveVAD, wrapped: vad.VADStream) -> None:
+        self._adaptive_vad = adaptive_vad
+        self._wrapped = wrapped
+        self._tracker = NoiseFloorTracker()
+
+        # Silero streams share the options object of their VAD, which is loaded
+        # once per worker; a copy keeps the raised threshold to this session
+        opts = getattr(wrapped, "_opts", None)
+        if dataclasses.is_dataclass(opts):
+            wrapped._opts = dataclasses.replace(opts)
+        self._base_threshold = getattr(opts, "activation_threshold", 0.5)
+        self._threshold = self._base_threshold
+        adaptive_vad.stats.activation_threshold = self._threshold
+
+        self._pending_start: Optional[vad.VADEvent] = None
+        self._pending_frames: list[rtc.AudioFrame] = []
+        self._since_metrics = 0.0
+        super().__init__(adaptive_vad)
+
+    async def _main_task(self) -> None:
+        forward_task = asyncio.create_task(self._forward_input())
+        try:
+            async for event in self._wrapped:
+                for gated in self._gate(event):
+                    self._event_ch.send_nowait(gated)
+        finally:
+            await utils.aio.cancel_and_wait(forward_task)
+            await self._wrapped.aclose()
+
+    async def _forward_input(self) -> None:
+        async for frame in self._input_ch:
+            if isinstance(frame, self._FlushSentinel):
+                self._wrapped.flush()
+                continue
+            self._observe(frame)
+            self._wrapped.push_frame(frame)
+        self._wrapped.end_input()
+
+    def _observe(self, frame: rtc.AudioFrame) -> None:
+        """Update the noise floor and the activation threshold with an input frame"""
+        duration = frame.samples_per_channel / frame.sample_rate
+        floor_db = self._tracker.update(frame_levels_db(frame))
+        stats = self._adaptive_vad.stats
+        stats.noise_floor_db = floor_db
+
+        threshold = self._adaptive_vad.activation_threshold(self._base_threshold, floor_db)
+        # Small moves are not worth touching the wrapped stream for
+        if abs(threshold - self._threshold) >= 0.02 and hasattr(self._wrapped, "update_options"):
+            self._threshold = threshold
+            self._wrapped.update_options(
+                activation_threshold=threshold,
+                deactivation_threshold=max(threshold - 0.15, 0.01),
+            )
+            stats.activation_threshold = threshold
+            stats.threshold_updates += 1
+
+        self._since_metrics += duration
+        if self._since_metrics >= self._adaptive_vad._metrics_interval:
+            self._since_metrics = 0.0
+            self._adaptive_vad.emit("noise_gate_metrics", NoiseGateMetrics(
+                timestamp=time.time(),
+                noise_floor_db=floor_db,
+                activation_threshold=self._threshold,
+                segments=stats.segments,
+                rejected_segments=stats.rejected_segments,
+            ))
+
+    def _loud_enough(self, frames: list[rtc.AudioFrame]) -> bool:
+        if not frames:
+            return False
+        level = max(float(frame_levels_db(frame).max()) for frame in frames)
+        return level >= self._tracker.floor_db + self._adaptive_vad._min_snr_db
+
+    def _gate(self, event: vad.VADEvent) -> list[vad.VADEvent]:
+        """Hold START_OF_SPEECH until the segment rises above the floor"""
+        stats = self._adaptive_vad.stats
+
+        if event.type == vad.VADEventType.START_OF_SPEECH:
+            stats.segments += 1
+            self._pending_start = event
+            self._pending_frames = list(event.frames)
+            if self._loud_enough(event.frames):
+                return [self._release_start()]
+            return []
+
+        if event.type == vad.VADEventType.INFERENCE_DONE:
+            if self._pending_start is None:
+                return [event]
+            if self._loud_enough(event.frames):
+                return [self._release_start(), event]
+            self._pending_frames.extend(event.frames)
+            # Held speech must not interrupt the agent
+            return [dataclasses.replace(event, speaking=False, speech_duration=0.0, probability=0.0)]
+
+        # END_OF_SPEECH of a segment that never rose above the floor
+        if self._pending_start is not None:
+            self._pending_start = None
+            self._pending_frames = []
+            stats.rejected_segments += 1
+            logger.debug(
+                f"Rejected {event.speech_duration:.2f}s of speech at noise floor "
+                f"{self._tracker.floor_db:.1f} dBFS"
+            )
+            return []
+        return [event]
+
+    def _release_start(self) -> vad.VADEvent:
+        """START_OF_SPEECH carrying all audio held since the wrapped VAD reported it"""
+        start = dataclasses.replace(self._pending_start, frames=self._pending_frames)
+        self._pending_start = None
+        self._pending_frames = []
+        return start
@@ -1,4 +1,6 @@
 import logging
+import time
+from typing import Optional
 
 from livekit.agents import (
     APIConnectOptions,
@@ -11,6 +13,9 @@ from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS
 import httpx
 import httpcore
 
+from .audio_utils import PcmByteBuffer
+from .tts_cache import TTSAudioCache
+
 
 logger = logging.getLogger("piper-tts")
 
@@ -21,6 +26,9 @@ TTS_CHANNELS = 1
 
 PIPER_BASE_URL = "http://192.168.101.58:8002"
 
+# Rough speaking time per character, sizes the response buffer up front
+SECONDS_PER_CHARACTER = 0.08
+
 class PiperTTS(tts.TTS):
     
     def __init__(
@@ -28,6 +36,8 @@ class PiperTTS(tts.TTS):
         *,
         base_url: str = PIPER_BASE_URL,
         sample_rate: int = TTS_SAMPLE_RATE,
+        streaming: bool = True,
+        cache: Optional[TTSAudioCache] = None,
     ) -> None:
         """
         Initialize Piper TTS.
@@ -35,6 +45,9 @@ class PiperTTS(tts.TTS):
         Args:
             base_url: Base URL for the Piper TTS API
             sample_rate: Audio sample rate
+            streaming: Emit audio as the server streams it, otherwise only once
+                the whole response has been received
+            cache: Audio of phrases synthesized before, shared with other sessions
         """
         super().__init__(
             capabilities=tts.TTSCapabilities(streaming=False),
@@ -45,6 +58,8 @@ class PiperTTS(tts.TTS):
         self._base_url = base_url
         self._client = self._create_client()
         self._sample_rate = sample_rate
+        self._streaming = streaming
+        self._cache = cache
 
     def _create_client(self) -> httpx.AsyncClient:
         """Create HTTP client with appropriate timeouts."""
@@ -95,6 +110,8 @@ class PiperTTSChunkedStream(tts.ChunkedStream):
         """
         request_id = utils.shortuuid()
         emitter_initialized = False
+        cache = self._tts._cache
+        cache_key = None  # set while this stream synthesizes the phrase for the cache
         
         try:
             # Always initialize output emitter first
@@ -131,7 +148,29 @@ class PiperTTSChunkedStream(tts.ChunkedStream):
                 output_emitter.flush()
                 return
 
-            all_audio_data = b""
+            if cache is not None:
+                key = cache.key(
+                    stripped_text,
+                    voice=None,
+                    speed=None,
+                    model=f"piper:{self._tts._base_url}",
+                    sample_rate=self._tts._sample_rate,
+                )
+                cached = await cache.acquire(key)
+                if cached is not None:
+                    logger.debug(f"Piper cache hit for '{stripped_text[:30]}'")
+                    self._emit(output_emitter, cached)
+                    output_emitter.flush()
+                    return
+                cache_key = key
+
+            # Sized for the expected reply, grows by doubling when it runs longer
+            audio = PcmByteBuffer(
+                int(len(stripped_text) * SECONDS_PER_CHARACTER * self._tts._sample_rate) * 2,
+                num_channels=TTS_CHANNELS,
+            )
+            started = time.perf_counter()
+            complete = True
             
             request_payload = {"text": stripped_text}  # Use truncated text
             
@@ -153,19 +192,22 @@ class PiperTTSChunkedStream(tts.ChunkedStream):
                         body=error_text,
                     )
                 
-                # Collect all audio data first (more reliable than incremental streaming)
-                # This matches the API's approach of pre-generating all chunks
+                # Streaming emits the whole samples of each chunk as it arrives, so
+                # the avatar starts speaking with the first chunk. Otherwise all audio
+                # is collected first and emitted at once.
                 try:
-                    chunk_count = 0
                     async for data_chunk in response.aiter_bytes():
-                        if data_chunk:
-                            all_audio_data += data_chunk
-                            chunk_count += 1
+                        if not data_chunk:
+                            continue
+                        audio.write(data_chunk)
+                        if self._tts._streaming:
+                            self._emit(output_emitter, audio.take())
                 except (httpcore.RemoteProtocolError, httpx.RemoteProtocolError) as e:
                     # Handle incomplete chunked reads
-                    if len(all_audio_data) > 0:
+                    if len(audio) > 0:
+                        complete = False
                         logger.warning(
-                            f"Connection closed early after receiving {len(all_audio_data)} bytes. "
+                            f"Connection closed early after receiving {len(audio)} bytes. "
                             f"Using partial audio data. Error: {e}"
                         )
                         # Continue with partial data - better than nothing
@@ -180,7 +222,7 @@ class PiperTTSChunkedStream(tts.ChunkedStream):
                         )
             
             # Check if we got any audio data
-            if len(all_audio_data) == 0:
+            if audio.usable == 0:
                 error_msg = f"No audio data received from Piper TTS server for text: '{self.input_text[:100]}...'"
                 logger.error(error_msg)
                 raise APIStatusError(
@@ -190,7 +232,15 @@ class PiperTTSChunkedStream(tts.ChunkedStream):
                     body=None,
                 )
             
-            output_emitter.push(all_audio_data)
+            # Whatever streaming has not emitted yet, all of it when not streaming
+            self._emit(output_emitter, audio.take())
+            if cache_key is not None:
+                # Partial audio is played once but never kept
+                cache.release(cache_key, audio.getvalue() if complete else None)
+                cache_key = None
+            logger.debug(
+                f"Piper synthesized {audio.usable} bytes in {time.perf_counter() - started:.3f}s"
+            )
             
             # Flush the emitter to indicate completion
             output_emitter.flush()
@@ -208,9 +258,16 @@ class PiperTTSChunkedStream(tts.ChunkedStream):
             logger.error(f"Piper TTS synthesis failed: {e}", exc_info=True)
             raise RuntimeError(f"Piper TTS synthesis failed: {str(e)}")
         finally:
+            if cache_key is not None:
+                # Failed or interrupted, waiting requests synthesize the phrase themselves
+                cache.release(cache_key, None)
             if emitter_initialized:
                 try:
                     output_emitter.end_input()
                 except Exception as e:
                     logger.error(f"Error ending output emitter: {e}")
 
+    def _emit(self, output_emitter: tts.AudioEmitter, pcm: bytes) -> None:
+        if not pcm:
+            return
+        output_emitter.push(pcm)
@@ -0,0 +1,323 @@
+import asyncio
+import json
+import logging
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterable, BinaryIO, Iterator, Optional, Union
+
+import numpy as np
+from livekit import rtc
+from livekit.agents import utils, vad
+
+from .audio_utils import PolyphaseResampler
+
+
+logger = logging.getLogger("session-capture")
+
+# File layout: MAGIC, a length-prefixed JSON header, records, and on a clean
+# close an index record followed by FOOTER_FORMAT. A record is RECORD_FORMAT
+# (kind, seconds since the session started, payload size) and its payload.
+MAGIC = b"AVCAP\x01"
+RECORD_FORMAT = struct.Struct("<BdI")
+AUDIO_FORMAT = struct.Struct("<IH")  # sample rate, channels, then int16 PCM
+INDEX_ENTRY_FORMAT = struct.Struct("<dQ")  # time and file offset of an audio record
+FOOTER_FORMAT = struct.Struct("<Q8s")
+FOOTER_MAGIC = b"AVCAPEND"
+
+RECORD_AUDIO = 1
+RECORD_EVENT = 2
+RECORD_INDEX = 3
+
+# Inbound audio is written in chunks of about this many seconds
+AUDIO_CHUNK_DURATION = 0.5
+
+
+@dataclass
+class CaptureRecord:
+    """One record of a capture file."""
+    kind: int
+    time: float
+    payload: Union[bytes, dict]
+    offset: int = 0
+
+
+@dataclass
+class CaptureAudio:
+    """A chunk of inbound audio read back from a capture file."""
+    time: float
+    sample_rate: int
+    num_channels: int
+    samples: np.ndarray
+
+
+class SessionCapture:
+    """
+    Records one session to a compact binary log for replay
+
+    Inbound audio is kept as raw int16 chunks, optionally resampled to
+    `sample_rate`, and indexed by time when the capture is closed. Everything
+    else (VAD decisions, transcripts, LLM token timing, tool calls, TTS text,
+    metrics) is written as small JSON events. Writes go through a buffered
+    file, so a record costs a memory copy on the event loop.
+    """
+
+    def __init__(self, path: Union[str, Path], *, sample_rate: int = 16000, metadata: Optional[dict] = None):
+        """
+        Open a capture file.
+
+        Args:
+            path: File to write, its directory is created if needed
+            sample_rate: Rate inbound audio is stored at, 0 keeps the room's rate
+            metadata: Extra fields of the file header, e.g. room and language
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file: Optional[BinaryIO] = open(self.path, "wb", buffering=1 << 16)
+        self._sample_rate = sample_rate
+        self._started = time.monotonic()
+        self._index: list[tuple[float, int]] = []
+        self._resamplers: dict[tuple[int, int], PolyphaseResampler] = {}
+
+        self._audio = bytearray()
+        self._audio_time = 0.0
+        self._audio_format: Optional[tuple[int, int]] = None
+        self._audio_owner: Optional[object] = None
+
+        header = json.dumps({"started": time.time(), "sample_rate": sample_rate, **(metadata or {})}).encode()
+        self._file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def now(self) -> float:
+        """Seconds since the capture started."""
+        return time.monotonic() - self._started
+
+    def claim_audio(self, owner: object) -> bool:
+        """
+        Whether `owner` is the stream that records audio
+
+        The session runs more than one VAD stream over the same input, the
+        first one to ask records until it releases the claim.
+        """
+        if self._audio_owner is None:
+            self._audio_owner = owner
+        return self._audio_owner is owner
+
+    def release_audio(self, owner: object) -> None:
+        if self._audio_owner is owner:
+            self._audio_owner = None
+
+    def audio(self, frame: rtc.AudioFrame) -> None:
+        """Add an inbound audio frame."""
+        if self._file is None:
+            return
+        num_channels = frame.num_channels
+        samples = np.frombuffer(frame.data, dtype=np.int16)
+        sample_rate = frame.sample_rate
+        if self._sample_rate and (sample_rate != self._sample_rate or num_channels != 1):
+            key = (sample_rate, num_channels)
+            if key not in self._resamplers:
+                self._resamplers[key] = PolyphaseResampler(sample_rate, self._sample_rate, num_channels)
+            samples = self._resamplers[key].push(samples)
+            sample_rate, num_channels = self._sample_rate, 1
+
+        if self._audio_format != (sample_rate, num_channels):
+            self._flush_audio()
+            self._audio_format = (sample_rate, num_channels)
+        if not self._audio:
+            self._audio_time = self.now() - frame.duration
+        self._audio += samples.tobytes()
+        if len(self._audio) >= AUDIO_CHUNK_DURATION * sample_rate * num_channels * 2:
+            self._flush_audio()
+
+    def event(self, event_type: str, **fields: Any) -> None:
+        """Add a JSON event, fields must be serializable."""
+        if self._file is None:
+            return
+        payload = json.dumps({"type": event_type, **fields}, ensure_ascii=False, default=str).encode()
+        self._write(RECORD_EVENT, self.now(), payload)
+
+    def close(self) -> None:
+        """Write the pending audio and the index; the file is readable without them too."""
+        if self._file is None:
+            return
+        self._flush_audio()
+        index = b"".join(INDEX_ENTRY_FORMAT.pack(t, offset) for t, offset in self._index)
+        index_offset = self._write(RECORD_INDEX, self.now(), index)
+        self._file.write(FOOTER_FORMAT.pack(index_offset, FOOTER_MAGIC))
+        self._file.close()
+        self._file = None
+        logger.info(f"Session captured to {self.path}")
+
+    def _flush_audio(self) -> None:
+        if not self._audio:
+            return
+        sample_rate, num_channels = self._audio_format
+        offset = self._write(RECORD_AUDIO, self._audio_time, AUDIO_FORMAT.pack(sample_rate, num_channels) + self._audio)
+        self._index.append((self._audio_time, offset))
+        self._audio = bytearray()
+
+    def _write(self, kind: int, at: float, payload: Union[bytes, bytearray]) -> int:
+        offset = self._file.tell()
+        self._file.write(RECORD_FORMAT.pack(kind, at, len(payload)))
+        self._file.write(payload)
+        return offset
+
+    def attach(self, session) -> None:
+        """Record the events of an AgentSession and close with it."""
+        @session.on("user_input_transcribed")
+        def _on_transcribed(event):
+            self.event("transcript", text=event.transcript, final=event.is_final, language=event.language)
+
+        @session.on("agent_state_changed")
+        def _on_agent_state(event):
+            self.event("agent_state", state=event.new_state)
+
+        @session.on("conversation_item_added")
+        def _on_item(event):
+            if event.item.type == "message":
+                self.event("message", role=event.item.role, text=event.item.text_content)
+
+        @session.on("function_tools_executed")
+        def _on_tools(event):
+            self.event(
+                "tools_executed",
+                calls=[{"name": call.name, "arguments": call.arguments} for call in event.function_calls],
+                outputs=[output.output for output in event.function_call_outputs],
+            )
+
+        @session.on("metrics_collected")
+        def _on_metrics(event):
+            self.event("metrics", metrics=event.metrics.model_dump(exclude={"metadata"}))
+
+        @session.on("close")
+        def _on_close(event):
+            self.close()
+
+    async def tee_llm(self, stream: AsyncIterable[Any]) -> AsyncIterable[Any]:
+        """Pass an llm_node stream through, recording when each delta arrived."""
+        self.event("llm_start")
+        async for chunk in stream:
+            delta = getattr(chunk, "delta", None)
+            if isinstance(chunk, str):
+                self.event("llm_delta", text=chunk)
+            elif delta is not None:
+                tool_calls = [call.name for call in (delta.tool_calls or [])]
+                if delta.content or tool_calls:
+                    self.event("llm_delta", text=delta.content or "", tool_calls=tool_calls)
+            yield chunk
+        self.event("llm_end")
+
+    async def tee_tts_text(self, text: AsyncIterable[str]) -> AsyncIterable[str]:
+        """Pass the text of a tts_node through, recording what is sent to synthesis."""
+        async for delta in text:
+            self.event("tts_text", text=delta)
+            yield delta
+
+    async def tee_tts_audio(self, frames: AsyncIterable[rtc.AudioFrame]) -> AsyncIterable[rtc.AudioFrame]:
+        """Pass synthesized frames through, recording the first frame and the total duration."""
+        duration = 0.0
+        async for frame in frames:
+            if not duration:
+                self.event("tts_first_audio")
+            duration += frame.duration
+            yield frame
+        self.event("tts_end", duration=round(duration, 3))
+
+
+def read_capture(path: Union[str, Path]) -> tuple[dict, Iterator[CaptureRecord]]:
+    """
+    Open a capture file
+
+    Returns:
+        The header and an iterator over the records in write order. Audio
+        records carry the time of their first sample, so they may be written
+        after events that happened later.
+    """
+    data = Path(path).read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session capture")
+    header_size = struct.unpack_from("<I", data, len(MAGIC))[0]
+    start = len(MAGIC) + 4
+    header = json.loads(data[start:start + header_size])
+
+    def records() -> Iterator[CaptureRecord]:
+        offset = start + header_size
+        while offset + RECORD_FORMAT.size <= len(data):
+            kind, at, size = RECORD_FORMAT.unpack_from(data, offset)
+            body = offset + RECORD_FORMAT.size
+            if kind == RECORD_INDEX or body + size > len(data):
+                # The index ends a complete file, a short record ends an interrupted one
+                return
+            payload = data[body:body + size]
+            yield CaptureRecord(kind, at, json.loads(payload) if kind == RECORD_EVENT else payload, offset)
+            offset = body + size
+
+    return header, records()
+
+
+def capture_audio(records: Iterator[CaptureRecord]) -> Iterator[CaptureAudio]:
+    """Decode the audio records of a capture."""
+    for record in records:
+        if record.kind != RECORD_AUDIO:
+            continue
+        sample_rate, num_channels = AUDIO_FORMAT.unpack_from(record.payload)
+        samples = np.frombuffer(record.payload, dtype=np.int16, offset=AUDIO_FORMAT.size)
+        yield CaptureAudio(record.time, sample_rate, num_channels, samples)
+
+
+class CapturingVAD(vad.VAD):
+    """Wraps a VAD and records the audio it is given and the speech boundaries it reports"""
+
+    def __init__(self, wrapped: vad.VAD, capture: SessionCapture) -> None:
+        super().__init__(capabilities=wrapped.capabilities)
+        self._wrapped = wrapped
+        self._capture = capture
+        self._label = wrapped._label
+
+    @property
+    def model(self) -> str:
+        return self._wrapped.model
+
+    @property
+    def provider(self) -> str:
+        return self._wrapped.provider
+
+    def stream(self) -> "CapturingVADStream":
+        return CapturingVADStream(self, self._wrapped.stream())
+
+
+class CapturingVADStream(vad.VADStream):
+    """Stream of CapturingVAD, forwards audio and events unchanged."""
+
+    def __init__(self, capturing_vad: CapturingVAD, wrapped: vad.VADStream) -> None:
+        self._capture = capturing_vad._capture
+        self._wrapped = wrapped
+        super().__init__(capturing_vad)
+
+    async def _main_task(self) -> None:
+        forward_task = asyncio.create_task(self._forward_input())
+        try:
+            async for event in self._wrapped:
+                if event.type != vad.VADEventType.INFERENCE_DONE and self._capture.claim_audio(self):
+                    self._capture.event(
+                        "vad",
+                        speech=event.type == vad.VADEventType.START_OF_SPEECH,
+                        speech_duration=round(event.speech_duration, 3),
+                        silence_duration=round(event.silence_duration, 3),
+                    )
+                self._event_ch.send_nowait(event)
+        finally:
+            self._capture.release_audio(self)
+            await utils.aio.cancel_and_wait(forward_task)
+            await self._wrapped.aclose()
+
+    async def _forward_input(self) -> None:
+        async for frame in self._input_ch:
+            if isinstance(frame, self._FlushSentinel):
+                self._wrapped.flush()
+                continue
+            if self._capture.claim_audio(self):
+                self._capture.audio(frame)
+            self._wrapped.push_frame(frame)
+        self._wrapped.end_input()
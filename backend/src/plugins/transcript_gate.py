@@ -0,0 +1,238 @@
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+# Whole-transcript outputs Whisper is known to produce on noise and silence
+HALLUCINATION_PHRASES = {
+    "en": {
+        "thank you",
+        "thank you very much",
+        "thanks",
+        "thanks for watching",
+        "thank you for watching",
+        "thank you so much for watching",
+        "please subscribe",
+        "subscribe to my channel",
+        "like and subscribe",
+        "you",
+        "oh",
+        "uh",
+        "um",
+        "hmm",
+        "the end",
+        "subtitles by the amara org community",
+    },
+    "fa": {
+        "ممنون",
+        "خیلی ممنون",
+        "متشکرم",
+        "زیرنویس",
+        "زیرنویس توسط",
+        "لطفا سابسکرایب کنید",
+        "کانال ما را سابسکرایب کنید",
+        "با تشکر از تماشای شما",
+        "ممنون که تماشا کردید",
+        "ادامه دارد",
+    },
+}
+
+# Contribution of each finding to the score, a transcript is dropped at `threshold`.
+# Real visitors say the known phrases too, and short answers in long segments,
+# so "phrase" and the character-rate findings need a second finding.
+GATE_WEIGHTS = {
+    "phrase": 0.3,
+    "repetition": 0.6,
+    "too_dense": 0.3,
+    "too_sparse": 0.3,
+    "no_speech": 0.6,
+    "low_logprob": 0.4,
+    "confident": -0.4,
+}
+
+_punctuation_pattern = re.compile(r"[^\w\s']+")
+_whitespace_pattern = re.compile(r"\s+")
+
+# Arabic code points that Persian text may use instead of the Persian letters
+_persian_letters = str.maketrans({"ي": "ی", "ى": "ی", "ك": "ک", "ة": "ه", "‌": " "})
+
+
+@dataclass
+class TranscriptGateStats:
+    """Counters of the transcripts checked and why they were dropped."""
+    checked: int = 0
+    dropped: int = 0
+    reasons: dict[str, int] = field(default_factory=dict)
+
+
+def normalize_transcript(text: str) -> str:
+    """Lowercase, unify Persian letters and remove punctuation for phrase matching."""
+    text = text.translate(_persian_letters).lower()
+    text = _punctuation_pattern.sub(" ", text)
+    return _whitespace_pattern.sub(" ", text).strip()
+
+
+def _max_repeats(words: list[str], max_ngram: int = 3) -> int:
+    """Longest run of the same word n-gram repeated back to back."""
+    longest = 1
+    for size in range(1, max_ngram + 1):
+        for start in range(size):
+            run = 1
+            previous = None
+            for index in range(start, len(words) - size + 1, size):
+                ngram = tuple(words[index:index + size])
+                run = run + 1 if ngram == previous else 1
+                previous = ngram
+                longest = max(longest, run)
+    return longest
+
+
+class TranscriptGate:
+    """
+    Scores final transcripts and flags the ones that are likely noise
+
+    Findings add up to a score: a transcript made only of a known
+    hallucination phrase, words or n-grams repeated back to back, a text far
+    too long or too short for the speech in the audio, and, when the endpoint
+    returns segments, a high no_speech_prob or a low avg_logprob. The rates
+    use the voiced seconds of the audio when they are known, the whole
+    duration otherwise. A known phrase or an odd rate alone stays below the
+    threshold and segments that are confidently speech lower the score, so a
+    visitor who really says "thank you", or a short "yes", still gets an answer:
+
+    >>> TranscriptGate().check("ممنون", duration=0.8, language="fa") is None
+    True
+    >>> TranscriptGate().check("بله", duration=3.0, language="fa") is None
+    True
+    >>> TranscriptGate().check("ممنون", duration=0.8, language="fa", voiced_duration=0.1)
+    ['phrase', 'too_dense']
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: float = 0.5,
+        max_chars_per_second: float = 30.0,
+        min_chars_per_second: float = 1.5,
+        sparse_min_duration: float = 3.0,
+        max_repeats: int = 4,
+        min_unique_ratio: float = 0.35,
+        no_speech_threshold: float = 0.6,
+        logprob_threshold: float = -1.0,
+        phrases: Optional[dict[str, set[str]]] = None,
+    ):
+        """
+        Initialize the transcript gate.
+
+        Args:
+            threshold: Score at which a transcript is dropped
+            max_chars_per_second: Denser text than this is not speech in the audio
+            min_chars_per_second: Sparser text than this means most audio was noise
+            sparse_min_duration: Shortest audio the sparseness check applies to
+            max_repeats: Back to back repetitions of an n-gram considered a loop
+            min_unique_ratio: Share of distinct words below which text is a loop
+            no_speech_threshold: Mean no_speech_prob above which segments are noise
+            logprob_threshold: Mean avg_logprob below which segments are guesses
+            phrases: Hallucination phrases per language, defaults to HALLUCINATION_PHRASES
+        """
+        self.threshold = threshold
+        self.max_chars_per_second = max_chars_per_second
+        self.min_chars_per_second = min_chars_per_second
+        self.sparse_min_duration = sparse_min_duration
+        self.max_repeats = max_repeats
+        self.min_unique_ratio = min_unique_ratio
+        self.no_speech_threshold = no_speech_threshold
+        self.logprob_threshold = logprob_threshold
+        self._phrases = {
+            language: {normalize_transcript(phrase) for phrase in language_phrases}
+            for language, language_phrases in (phrases or HALLUCINATION_PHRASES).items()
+        }
+        self.stats = TranscriptGateStats()
+
+    def findings(
+        self,
+        text: str,
+        *,
+        duration: float,
+        language: Optional[str] = None,
+        segments: Optional[list] = None,
+        voiced_duration: Optional[float] = None,
+    ) -> list[str]:
+        """Return the findings for a transcript, see GATE_WEIGHTS for their names."""
+        normalized = normalize_transcript(text)
+        words = normalized.split()
+        found = []
+
+        phrases = self._phrases.get(language) if language else None
+        if phrases is None:
+            phrases = set().union(*self._phrases.values())
+        if normalized in phrases:
+            found.append("phrase")
+
+        if len(words) >= self.max_repeats and (
+            _max_repeats(words) >= self.max_repeats
+            or len(set(words)) / len(words) < self.min_unique_ratio
+        ):
+            found.append("repetition")
+
+        chars = len(normalized.replace(" ", ""))
+        speech = voiced_duration if voiced_duration is not None else duration
+        if speech <= 0 < chars:
+            found.append("too_dense")
+        elif speech > 0:
+            if chars / speech > self.max_chars_per_second:
+                found.append("too_dense")
+            elif speech >= self.sparse_min_duration and chars / speech < self.min_chars_per_second:
+                found.append("too_sparse")
+
+        no_speech = [s["no_speech_prob"] for s in segments or [] if "no_speech_prob" in s]
+        logprobs = [s["avg_logprob"] for s in segments or [] if "avg_logprob" in s]
+        if no_speech and sum(no_speech) / len(no_speech) >= self.no_speech_threshold:
+            found.append("no_speech")
+        if logprobs and sum(logprobs) / len(logprobs) <= self.logprob_threshold:
+            found.append("low_logprob")
+        if (
+            no_speech
+            and logprobs
+            and max(no_speech) < 0.2
+            and min(logprobs) > self.logprob_threshold / 2
+        ):
+            found.append("confident")
+
+        return found
+
+    def check(
+        self,
+        text: str,
+        *,
+        duration: float,
+        language: Optional[str] = None,
+        segments: Optional[list] = None,
+        voiced_duration: Optional[float] = None,
+        interim: bool = False,
+    ) -> Optional[list[str]]:
+        """
+        Decide whether a transcript should reach the conversation
+
+        Args:
+            voiced_duration: Seconds of the audio that hold speech, if known
+            interim: An interim transcript, checked without counting it in stats
+
+        Returns:
+            None if the transcript is kept, otherwise the findings that dropped it
+        """
+        found = self.findings(
+            text, duration=duration, language=language, segments=segments, voiced_duration=voiced_duration
+        )
+        dropped = sum(GATE_WEIGHTS[name] for name in found) >= self.threshold
+        if interim:
+            return found if dropped else None
+
+        self.stats.checked += 1
+        if not dropped:
+            return None
+
+        self.stats.dropped += 1
+        for name in found:
+            self.stats.reasons[name] = self.stats.reasons.get(name, 0) + 1
+        return found
@@ -0,0 +1,114 @@
+import asyncio
+import collections
+import logging
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional
+
+
+logger = logging.getLogger("tts-cache")
+
+# Arabic code points LLMs mix into Persian text, mapped to the Persian letters
+PERSIAN_FORMS = str.maketrans({"ي": "ی", "ك": "ک", "ى": "ی"})
+
+
+def normalize_text(text: str) -> str:
+    """Text as it is looked up: NFC, Persian letter forms and single spaces."""
+    text = unicodedata.normalize("NFC", text).translate(PERSIAN_FORMS)
+    return " ".join(text.split())
+
+
+@dataclass
+class TTSCacheStats:
+    """Lookups of a TTSAudioCache since it was created."""
+    hits: int = 0
+    joined: int = 0  # served by an identical request that was already in flight
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+class TTSAudioCache:
+    """
+    Synthesized PCM of recent phrases, shared by the TTS engines of a process
+
+    Entries are kept in least recently used order within `max_bytes`. A
+    phrase longer than `max_entry_bytes` is synthesized as usual but not
+    kept, so one long answer does not push out the fixed phrases.
+
+    Identical requests are collapsed: the first caller of `acquire` for a key
+    synthesizes it and hands the audio to `release`, callers arriving in the
+    meantime wait for that audio instead of requesting it again.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, *, max_entry_bytes: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Total PCM bytes kept
+            max_entry_bytes: Largest phrase kept, a sixteenth of max_bytes by default
+        """
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 16
+        self._entries: collections.OrderedDict[tuple, bytes] = collections.OrderedDict()
+        self._flights: dict[tuple, asyncio.Future] = {}
+        self.stats = TTSCacheStats()
+
+    @staticmethod
+    def key(text: str, *, voice: Optional[str], speed: Optional[float], model: str, sample_rate: int) -> tuple:
+        return (normalize_text(text), voice or "", float(speed or 1.0), model, sample_rate)
+
+    async def acquire(self, key: tuple) -> Optional[bytes]:
+        """
+        Cached PCM for `key`, waiting for an identical request in flight
+
+        Returns None when the caller has to synthesize the phrase itself, it
+        must then call `release` with the audio, or None if synthesis failed.
+        """
+        joined = False
+        while True:
+            pcm = self._entries.get(key)
+            if pcm is not None:
+                self._entries.move_to_end(key)
+                if not joined:
+                    self.stats.hits += 1
+                return pcm
+
+            flight = self._flights.get(key)
+            if flight is None:
+                self._flights[key] = asyncio.get_running_loop().create_future()
+                self.stats.misses += 1
+                return None
+
+            if not joined:
+                joined = True
+                self.stats.joined += 1
+            # A failed or interrupted request wakes us with None, then one of
+            # the waiters requests the phrase itself
+            pcm = await asyncio.shield(flight)
+            if pcm is not None:
+                return pcm
+
+    def release(self, key: tuple, pcm: Optional[bytes]) -> None:
+        """Store the audio of an acquired key and hand it to the waiting requests."""
+        flight = self._flights.pop(key, None)
+        if pcm:
+            self._store(key, pcm)
+        if flight is not None and not flight.done():
+            flight.set_result(pcm or None)
+
+    def _store(self, key: tuple, pcm: bytes) -> None:
+        if len(pcm) > self._max_entry_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.stats.bytes -= len(previous)
+        self._entries[key] = pcm
+        self.stats.bytes += len(pcm)
+        while self.stats.bytes > self._max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.stats.bytes -= len(evicted)
+            self.stats.evictions += 1
+        self.stats.entries = len(self._entries)
@@ -0,0 +1,216 @@
+import asyncio
+import dataclasses
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+import aiohttp
+
+from .audio_codecs import UPLOAD_CODECS, UploadCodec, iter_encoded
+from .audio_utils import PcmAudio
+
+
+logger = logging.getLogger("whisper-batcher")
+
+# Codec each batch endpoint fell back to after rejecting the configured one,
+# kept for the process so later dispatchers of the endpoint start with it
+_fallback_codecs: dict[str, UploadCodec] = {}
+
+
+class WhisperBatchError(Exception):
+    """Raised to every caller of a batch the endpoint did not answer properly."""
+
+
+@dataclass
+class BatchStats:
+    """Counters describing how utterances were grouped into requests."""
+    batches: int = 0
+    utterances: int = 0
+    max_batch_size: int = 0
+    failed_batches: int = 0
+
+
+@dataclass
+class _PendingUtterance:
+    audio: PcmAudio
+    codec: UploadCodec
+    bitrate: int
+    language: Optional[str]
+    future: asyncio.Future = field(repr=False)
+
+
+class WhisperBatchDispatcher:
+    """
+    Groups utterances from concurrent sessions into batched Whisper requests
+
+    The first utterance of a batch waits at most `max_wait` seconds for
+    others to join, and a full batch is sent right away. Every utterance is
+    sent as its own `file` field with a matching `language` field, and the
+    endpoint answers with a list holding one result per file, in order. An
+    endpoint that rejects a compressed codec with 415 gets the batch again as
+    WAV, and WAV from then on.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        max_batch_size: int = 8,
+        max_wait: float = 0.01,
+        timeout: float = 30.0,
+    ):
+        self._url = url
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._timeout = timeout
+        self._pending: list[_PendingUtterance] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._loop = asyncio.get_running_loop()
+        self.stats = BatchStats()
+
+    async def transcribe(
+        self,
+        audio: PcmAudio,
+        *,
+        codec: UploadCodec,
+        bitrate: int,
+        language: Optional[str],
+    ) -> dict:
+        """Queue an utterance for the next batch and wait for its own result."""
+        loop = asyncio.get_running_loop()
+        pending = _PendingUtterance(
+            audio=audio,
+            codec=_fallback_codecs.get(self._url, codec),
+            bitrate=bitrate,
+            language=language,
+            future=loop.create_future(),
+        )
+        self._pending.append(pending)
+
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_wait, self._flush)
+
+        return await pending.future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        # Callers that gave up while waiting are not sent
+        batch = [pending for pending in self._pending if not pending.future.done()]
+        self._pending = []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[_PendingUtterance]) -> None:
+        self.stats.batches += 1
+        self.stats.utterances += len(batch)
+        self.stats.max_batch_size = max(self.stats.max_batch_size, len(batch))
+
+        try:
+            results = await self._post(batch)
+        except Exception as e:
+            self.stats.failed_batches += 1
+            logger.error(f"Batched Whisper request of {len(batch)} utterances failed: {e}")
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(WhisperBatchError(str(e)))
+            return
+
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    async def _post(self, batch: list[_PendingUtterance]) -> list:
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession()
+
+        data = aiohttp.FormData()
+        for pending in batch:
+            data.add_field(
+                "file",
+                iter_encoded(pending.audio, pending.codec, bitrate=pending.bitrate),
+                filename=pending.codec.filename,
+                content_type=pending.codec.content_type,
+            )
+            data.add_field("language", pending.language or "")
+
+        async with self._http_session.post(
+            self._url,
+            data=data,
+            timeout=aiohttp.ClientTimeout(total=self._timeout),
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                rejected = {pending.codec.name for pending in batch if pending.codec.container is not None}
+                if response.status != 415 or not rejected:
+                    raise WhisperBatchError(f"status {response.status}: {error_text}")
+                results = None
+            else:
+                results = await response.json()
+
+        if results is None:
+            logger.warning(
+                f"Whisper batch endpoint {self._url} does not accept {', '.join(sorted(rejected))}, "
+                "falling back to wav"
+            )
+            wav = _fallback_codecs[self._url] = UPLOAD_CODECS["wav"]
+            return await self._post([dataclasses.replace(pending, codec=wav) for pending in batch])
+
+        if not isinstance(results, list) or len(results) != len(batch):
+            raise WhisperBatchError(
+                f"expected a list of {len(batch)} results, got {type(results).__name__}"
+            )
+        return results
+
+    async def aclose(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for pending in self._pending:
+            if not pending.future.done():
+                pending.future.set_exception(WhisperBatchError("dispatcher closed"))
+        self._pending = []
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+
+
+# One dispatcher per endpoint and event loop, shared by every session of the worker process
+_dispatchers: dict[tuple[str, int], WhisperBatchDispatcher] = {}
+
+
+def get_batch_dispatcher(
+    url: str,
+    *,
+    max_batch_size: int = 8,
+    max_wait: float = 0.01,
+) -> WhisperBatchDispatcher:
+    """Return the dispatcher shared by all sessions of this process for `url`."""
+    loop = asyncio.get_running_loop()
+    key = (url, id(loop))
+    dispatcher = _dispatchers.get(key)
+    # A closed loop's id can be reused, its dispatcher is unusable on the new one
+    if dispatcher is None or dispatcher._loop is not loop:
+        dispatcher = WhisperBatchDispatcher(url, max_batch_size=max_batch_size, max_wait=max_wait)
+        _dispatchers[key] = dispatcher
+    return dispatcher
+
+
+async def close_batch_dispatchers() -> None:
+    """Close the dispatchers of the running event loop, e.g. when its job shuts down."""
+    loop = asyncio.get_running_loop()
+    for key, dispatcher in list(_dispatchers.items()):
+        if dispatcher._loop is loop:
+            del _dispatchers[key]
+            await dispatcher.aclose()
@@ -0,0 +1,58 @@
+import math
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """
+    One Whisper endpoint in an ordered list, from the fastest model to the largest
+
+    Utterances longer than `max_duration` skip the tier, and results whose
+    confidence is below `min_confidence` are decoded again by the next tier.
+    The last tier takes everything that reaches it.
+    """
+    name: str
+    url: str
+    max_duration: Optional[float] = None
+    min_confidence: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ModelTier":
+        return cls(
+            name=data["name"],
+            url=data["url"],
+            max_duration=data.get("max_duration"),
+            min_confidence=data.get("min_confidence"),
+        )
+
+
+@dataclass
+class RoutingStats:
+    """Where utterances were decoded and why they moved to a larger model."""
+    requests: dict[str, int] = field(default_factory=dict)  # decodes sent per tier
+    answered: dict[str, int] = field(default_factory=dict)  # results used per tier
+    skipped_by_length: int = 0
+    escalated_by_confidence: int = 0
+    escalated_by_failure: int = 0
+
+
+def transcript_confidence(result: Union[dict, list]) -> Optional[float]:
+    """
+    Confidence of a Whisper result between 0 and 1, None if the endpoint gave none
+
+    Uses an explicit "confidence" field when present, otherwise the average
+    token probability of the segments, exp(avg_logprob), weighted by their length.
+    """
+    if isinstance(result, list):
+        result = result[0] if result else {}
+    if result.get("confidence") is not None:
+        return float(result["confidence"])
+
+    segments = [s for s in result.get("segments") or [] if "avg_logprob" in s]
+    if not segments:
+        return None
+
+    weights = [max(s.get("end", 1.0) - s.get("start", 0.0), 1e-3) for s in segments]
+    logprob = sum(w * s["avg_logprob"] for w, s in zip(weights, segments)) / sum(weights)
+    return math.exp(logprob)
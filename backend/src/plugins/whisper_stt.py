@@ -1,18 +1,171 @@
 import asyncio
-import io
 import logging
-import wave
+import re
 import aiohttp
-from typing import Optional, AsyncIterator
+import numpy as np
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional, AsyncIterator, Union
+from livekit import rtc
 from livekit.agents import (
+    APIConnectOptions,
     stt,
     utils,
 )
-from livekit.agents.utils import AudioBuffer
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, NOT_GIVEN, NotGivenOr
+from livekit.agents.utils import AudioBuffer, is_given
+from livekit.agents.vad import VAD, VADEventType
+
+from .audio_codecs import UPLOAD_CODECS, UploadCodec, get_upload_codec, iter_encoded
+from .audio_utils import (
+    PcmAudio,
+    PcmRingBuffer,
+    PolyphaseResampler,
+    SilenceTrimmer,
+    find_split_points,
+    resample_audio,
+)
+from .whisper_batcher import WhisperBatchDispatcher, WhisperBatchError, get_batch_dispatcher
+from .transcript_gate import TranscriptGate
+from .whisper_routing import ModelTier, RoutingStats, transcript_confidence
+from .whisper_ws import WhisperWebSocketClient
 
 
 logger = logging.getLogger("whisper-endpoint-stt")
 
+# Whisper servers may report the detected language by name instead of code
+LANGUAGE_CODES = {"english": "en", "persian": "fa", "farsi": "fa"}
+
+_persian_script_pattern = re.compile(r"[\u0600-\u06FF]")
+_latin_script_pattern = re.compile(r"[A-Za-z]")
+
+
+@dataclass
+class WhisperSTTStats:
+    """Counters describing the audio sent to the Whisper endpoint"""
+    requests: int = 0
+    uploaded_seconds: float = 0.0
+    trimmed_seconds: float = 0.0
+    skipped_silent: int = 0  # buffers without any speech that were never uploaded
+    speculative_started: int = 0
+    speculative_used: int = 0  # final transcripts taken from a speculative decode
+    speculative_wasted: int = 0  # speculative decodes discarded because speech resumed
+    dropped_seconds: float = 0.0  # streaming audio that did not fit the utterance buffer
+    language_id_requests: int = 0
+    language_switches: int = 0  # identifications that changed the session language
+    split_utterances: int = 0  # long buffers transcribed as parallel pieces
+    split_pieces: int = 0
+    llm_turns_avoided: int = 0  # final transcripts dropped by the transcript gate
+    tts_turns_avoided: int = 0
+
+
+class UtteranceMarker(Enum):
+    """Markers interleaved with the audio frames of an utterance"""
+    SILENCE_STARTED = "silence_started"
+    SPEECH_RESUMED = "speech_resumed"
+
+
+_word_normalize_pattern = re.compile(r"[^\w']+")
+
+
+def _normalize_word(word: str) -> str:
+    return _word_normalize_pattern.sub("", word).lower()
+
+
+def merge_overlapping_words(left: list[str], right: list[str], max_skip: int = 2) -> list[str]:
+    """
+    Join two transcripts whose audio overlaps, dropping the repeated words
+    
+    The longest run of words ending `left` that also starts `right` is kept
+    once. Up to `max_skip` leading words of `right` may be ignored, since a
+    word cut in half at the boundary often decodes as a fragment.
+    
+    Args:
+        left: Words of the earlier transcript
+        right: Words of the later transcript
+        max_skip: Most leading words of `right` ignored while aligning
+        
+    Returns:
+        The merged list of words
+    """
+    left_norm = [_normalize_word(word) for word in left]
+    right_norm = [_normalize_word(word) for word in right]
+    
+    for overlap in range(min(len(left), len(right)), 0, -1):
+        for skip in range(min(max_skip, len(right) - overlap) + 1):
+            if left_norm[-overlap:] == right_norm[skip:skip + overlap]:
+                return left + right[skip + overlap:]
+    
+    return left + right
+
+
+class StablePrefixAgreement:
+    """
+    Commits the prefix of words that agrees across consecutive decodes
+    
+    Each decode of a growing window is a new hypothesis for the whole utterance.
+    Words are committed once two consecutive hypotheses agree on them, and the
+    remaining words are kept as the unstable tail of the latest hypothesis.
+    
+    Once the window starts sliding, hypotheses no longer begin at the start of
+    the utterance and are aligned to the committed words by their overlap.
+    """
+    
+    def __init__(self):
+        self._committed: list[str] = []
+        self._tail: list[str] = []
+    
+    @property
+    def committed_text(self) -> str:
+        """Text that will not change anymore"""
+        return " ".join(self._committed)
+    
+    @property
+    def text(self) -> str:
+        """Committed text followed by the unstable tail of the latest hypothesis"""
+        return " ".join(self._committed + self._tail)
+    
+    def update(self, hypothesis: str, *, sliding: bool = False) -> str:
+        """
+        Add a new hypothesis for the whole window
+        
+        Args:
+            hypothesis: Transcription of the current window
+            sliding: Whether the window no longer starts at the utterance start
+            
+        Returns:
+            The newly committed words, empty if nothing was committed
+        """
+        tail = self._new_words(hypothesis, sliding=sliding)
+        
+        agreed = 0
+        for previous, current in zip(self._tail, tail):
+            if _normalize_word(previous) != _normalize_word(current):
+                break
+            agreed += 1
+        
+        newly_committed = tail[:agreed]
+        self._committed.extend(newly_committed)
+        self._tail = tail[agreed:]
+        return " ".join(newly_committed)
+    
+    def commit_all(self) -> None:
+        """Commit the unstable tail, used when its audio is about to leave the window"""
+        self._committed.extend(self._tail)
+        self._tail = []
+    
+    def final_text(self, hypothesis: str, *, sliding: bool = False) -> str:
+        """Text of the utterance given the decode of its final window"""
+        if not sliding:
+            return hypothesis
+        return " ".join(self._committed + self._new_words(hypothesis, sliding=True))
+    
+    def _new_words(self, hypothesis: str, *, sliding: bool) -> list[str]:
+        words = hypothesis.split()
+        if not sliding:
+            return words[len(self._committed):]
+        return merge_overlapping_words(self._committed, words)[len(self._committed):]
+
 
 class WhisperEndpointSTT(stt.STT):
     """
@@ -27,10 +180,37 @@ class WhisperEndpointSTT(stt.STT):
         *,
         api_url: str = "http://192.168.101.58:8000",
         language: Optional[str] = "en",
-        detect_language: bool = True,
+        detect_language: bool = False,
         http_session: Optional[aiohttp.ClientSession] = None,
-        streaming_chunk_duration: float = 2.0,  # seconds per chunk for streaming
-        streaming_overlap: float = 0.5,  # seconds of overlap between chunks
+        vad: Optional[VAD] = None,
+        interim_results: bool = True,
+        streaming_chunk_duration: float = 1.0,  # seconds of new audio between window decodes
+        streaming_min_duration: float = 0.3,  # shortest utterance worth a final decode
+        streaming_buffer_duration: float = 30.0,  # most audio kept per utterance
+        streaming_drop_policy: str = "drop_oldest",
+        upload_codec: str = "wav",
+        upload_bitrate: int = 24000,
+        sample_rate: Optional[int] = 16000,
+        trim_silence: bool = True,
+        trim_guard: float = 0.15,
+        trim_threshold_db: float = -45.0,
+        speculative: bool = False,
+        speculative_delay: float = 0.1,
+        speculative_threshold: float = 0.4,
+        batch_url: Optional[str] = None,
+        batch_max_size: int = 8,
+        batch_max_wait: float = 0.01,
+        language_id_duration: float = 1.5,
+        language_id_candidates: tuple[str, ...] = ("en", "fa"),
+        ws_url: Optional[str] = None,
+        split_long_audio: bool = False,
+        split_max_duration: float = 10.0,
+        split_min_duration: float = 4.0,
+        split_overlap: float = 0.3,
+        split_max_parallel: int = 3,
+        gate_transcripts: bool = True,
+        gate_threshold: float = 0.5,
+        model_tiers: Optional[list[ModelTier]] = None,
     ):
         """
         Initialize the Whisper endpoint STT plugin
@@ -38,16 +218,54 @@ class WhisperEndpointSTT(stt.STT):
         Args:
             api_url: Base URL for the Whisper API endpoint
             language: Target language for transcription (e.g., 'fa', 'en')
-            detect_language: Whether to auto-detect language
+            detect_language: Identify the language from the start of the first
+                utterance and switch to it, emitting "language_detected"
             http_session: Optional HTTP session for requests
-            streaming_chunk_duration: Duration in seconds for each streaming chunk
-            streaming_overlap: Overlap duration in seconds between streaming chunks
+            vad: VAD used to segment utterances; enables the streaming mode when set
+            interim_results: Whether to decode the growing window while the user speaks
+            streaming_chunk_duration: Seconds of new audio between two window decodes
+            streaming_min_duration: Utterances shorter than this are not decoded
+            streaming_buffer_duration: Seconds of audio buffered per utterance;
+                longer utterances are decoded as a sliding window
+            streaming_drop_policy: What to drop once the buffer is full, either
+                'drop_oldest' (slide the window) or 'drop_newest' (cut the utterance)
+            upload_codec: Upload format, one of 'wav', 'flac' or 'opus'
+            upload_bitrate: Opus bitrate in bits per second
+            sample_rate: Audio is downmixed to mono and resampled to this rate
+                before upload, None uploads it as delivered by the room
+            trim_silence: Cut leading and trailing silence before upload
+            trim_guard: Seconds of silence kept around the speech when trimming
+            trim_threshold_db: Level in dBFS below which audio counts as silence
+            speculative: Start the final decode when silence begins instead of
+                waiting for the VAD to end the utterance (streaming mode only)
+            speculative_delay: Seconds of silence before the speculative decode starts
+            speculative_threshold: VAD probability below which a window is silence
+            batch_url: Batched Whisper endpoint; when set, utterances of all
+                sessions in this worker process are sent together
+            batch_max_size: Most utterances sent in one batched request
+            batch_max_wait: Longest an utterance waits for others to join its batch
+            language_id_duration: Seconds of speech sent to identify the language
+            language_id_candidates: Languages identification may switch to
+            ws_url: WebSocket endpoint; when set, streaming sessions send audio
+                while the user speaks and only commit it at the end of speech
+            split_long_audio: Cut audio longer than `split_max_duration` at quiet
+                points and transcribe the pieces concurrently
+            split_max_duration: Longest piece sent in one request, in seconds
+            split_min_duration: Shortest piece cut off a long buffer, in seconds
+            split_overlap: Seconds each piece extends into its neighbours, the
+                words decoded twice are removed when stitching
+            split_max_parallel: Most piece requests in flight per session
+            gate_transcripts: Drop final transcripts that are likely noise or
+                Whisper hallucinations before they start an LLM turn
+            gate_threshold: Score at which the gate drops a transcript
+            model_tiers: Endpoints tried in order, from the fastest model to
+                the largest; replaces `api_url` and bypasses `batch_url`
         """
-        # Initialize with streaming capabilities
+        # Streaming is only available when we can segment utterances ourselves
         super().__init__(
             capabilities=stt.STTCapabilities(
-                streaming=False, 
-                interim_results=False
+                streaming=vad is not None, 
+                interim_results=vad is not None and interim_results
             )
         )
         
@@ -56,15 +274,87 @@ class WhisperEndpointSTT(stt.STT):
         self._language = language
         self._detect_language = detect_language
         self._http_session = http_session
+        self._vad = vad
+        self._interim_results = interim_results
         self._streaming_chunk_duration = streaming_chunk_duration
-        self._streaming_overlap = streaming_overlap
-        
-        # Calculate frames per chunk based on typical 16kHz sample rate
-        # Assuming 50ms per frame (800 samples at 16kHz)
-        self._frames_per_chunk = int(streaming_chunk_duration * 20)  # 20 frames per second
-        self._overlap_frames = int(streaming_overlap * 20)
+        self._streaming_min_duration = streaming_min_duration
+        self._streaming_buffer_duration = streaming_buffer_duration
+        self._streaming_drop_policy = streaming_drop_policy
+        self._upload_codec = get_upload_codec(upload_codec)
+        self._upload_bitrate = upload_bitrate
+        self._sample_rate = sample_rate
+        self._trimmer = (
+            SilenceTrimmer(threshold_db=trim_threshold_db, guard=trim_guard)
+            if trim_silence
+            else None
+        )
+        # Measures the voiced seconds the gate's rate checks use, trimming or not
+        self._voice_meter = self._trimmer or SilenceTrimmer(threshold_db=trim_threshold_db)
+        self._speculative = speculative
+        self._speculative_delay = speculative_delay
+        self._speculative_threshold = speculative_threshold
+        self._batch_url = batch_url
+        self._batch_max_size = batch_max_size
+        self._batch_max_wait = batch_max_wait
+        self._language_id_duration = language_id_duration
+        self._language_id_candidates = language_id_candidates
+        self._language_identified = False
+        self._language_id_lock = asyncio.Lock()
+        self._ws_url = ws_url
+        self._split_long_audio = split_long_audio
+        self._split_max_duration = split_max_duration
+        self._split_min_duration = split_min_duration
+        self._split_overlap = split_overlap
+        # Shared by all utterances of the session, bounds its piece requests
+        self._split_semaphore = asyncio.Semaphore(split_max_parallel)
+        self._gate = TranscriptGate(threshold=gate_threshold) if gate_transcripts else None
+        self._model_tiers = list(model_tiers or [])
+        self._routing_stats = RoutingStats()
+        self._stats = WhisperSTTStats()
+        # Endpoints that rejected the compressed codec and only get WAV
+        self._endpoint_codecs: dict[str, UploadCodec] = {}
         
         logger.info(f"Initialized WhisperEndpointSTT with API URL: {self._api_url}")
+        if self._model_tiers:
+            logger.info(f"Routing across model tiers: {[tier.name for tier in self._model_tiers]}")
+
+    @property
+    def stats(self) -> WhisperSTTStats:
+        """Upload and trimming counters since the plugin was created"""
+        return self._stats
+
+    @property
+    def routing_stats(self) -> RoutingStats:
+        """Decodes per model tier and the reasons utterances escalated"""
+        return self._routing_stats
+
+    @property
+    def gate(self) -> Optional[TranscriptGate]:
+        """Transcript gate, its stats hold the drop reasons"""
+        return self._gate
+
+    @property
+    def language(self) -> Optional[str]:
+        """Language currently used for transcription"""
+        return self._language
+
+    def update_options(
+        self,
+        *,
+        language: NotGivenOr[Optional[str]] = NOT_GIVEN,
+        detect_language: NotGivenOr[bool] = NOT_GIVEN,
+    ) -> None:
+        """
+        Update the transcription language without recreating the plugin
+        
+        Streams already running pick the new language up with their next
+        request. Enabling `detect_language` identifies the language again.
+        """
+        if is_given(language):
+            self._language = language
+        if is_given(detect_language):
+            self._detect_language = detect_language
+            self._language_identified = False
 
     async def _recognize_impl(
         self, 
@@ -82,148 +372,734 @@ class WhisperEndpointSTT(stt.STT):
         Returns:
             SpeechEvent with transcription results
         """
+        identify = not language and self._needs_language_id()
+        
         try:
-            # Merge audio frames into a single buffer
-            merged_buffer = utils.merge_frames(buffer)
+            # Wrap the frames without merging or copying them
+            audio = PcmAudio.from_buffer(buffer)
+            
+            # Resample and trim off the event loop
+            audio = await asyncio.get_running_loop().run_in_executor(
+                None, self._prepare_audio, audio
+            )
+            if not audio.chunks:
+                return self._create_empty_speech_event()
             
-            # Convert to WAV format for the API
-            wav_data = await self._buffer_to_wav(merged_buffer)
+            # Identify the language on the first seconds before decoding all of it
+            if identify:
+                await self._identify_language(audio.head(self._language_id_duration))
+            language = self._resolve_language(language)
             
             # Send to Whisper endpoint
-            result = await self._transcribe_audio(wav_data)
+            result = await self._transcribe_split(audio, language=language)
             
             # Parse and return result
-            return await self._parse_transcription_result(result)
+            return await self._parse_transcription_result(
+                result,
+                language=language,
+                duration=audio.duration,
+                voiced_duration=self._voiced_duration(audio),
+            )
             
         except Exception as e:
             logger.error(f"Error in Whisper endpoint recognition: {e}")
             return self._create_empty_speech_event()
 
+    def stream(
+        self,
+        *,
+        language: NotGivenOr[str] = NOT_GIVEN,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> "WhisperRecognizeStream":
+        """Create a VAD-segmented recognition stream with interim results"""
+        if self._vad is None:
+            raise NotImplementedError(
+                "WhisperEndpointSTT needs a VAD to stream, pass vad= or use a StreamAdapter"
+            )
+        
+        # Without an override every request uses the current instance language
+        return WhisperRecognizeStream(
+            stt=self,
+            vad=self._vad,
+            language=language if is_given(language) and language else None,
+            conn_options=conn_options,
+        )
+
     async def _stream_recognize_impl(
         self,
-        buffer: AsyncIterator,
+        buffer: AsyncIterator[Union[rtc.AudioFrame, UtteranceMarker]],
         *,
         language: Optional[str] = None,
         conn_options = None,
+        websocket: Optional[WhisperWebSocketClient] = None,
     ) -> AsyncIterator[stt.SpeechEvent]:
         """
-        Stream recognition implementation - processes audio in chunks
+        Stream recognition for a single utterance - decodes a growing window
+        
+        Every `streaming_chunk_duration` seconds of new audio the whole utterance
+        so far is decoded again. Words that agree between two consecutive decodes
+        are committed and never retracted, so the interim text converges instead
+        of repeating. Once the input ends the full utterance is decoded one last
+        time and emitted as the final transcript.
+        
+        With speculation enabled, a SILENCE_STARTED marker starts that final
+        decode right away. It is used if the input ends without a
+        SPEECH_RESUMED marker, which hides the round-trip inside the VAD's
+        end-of-speech silence window.
+        
+        Audio is kept in a preallocated ring buffer of `streaming_buffer_duration`
+        seconds. With 'drop_oldest', longer utterances are decoded as a sliding
+        window whose transcripts are joined to the committed words by overlap.
+        
+        While the language still has to be identified, window and speculative
+        decodes wait until the first `language_id_duration` seconds were sent
+        for identification, so no decode runs in the wrong language.
+        
+        With a WebSocket the audio is sent as it arrives and decodes only ask
+        the server to decode what it already has, so neither window decodes nor
+        the final commit wait for an upload. Audio sent this way is not
+        trimmed. If the WebSocket fails the utterance continues over HTTP.
         
         Args:
-            buffer: Async iterator of audio frames
+            buffer: Async iterator of the audio frames of one utterance,
+                optionally interleaved with UtteranceMarker values
+            language: Optional language override for this utterance, None
+                uses the instance language at the time of each request
             conn_options: Connection options (unused)
+            websocket: Session WebSocket the audio is sent over while it arrives
             
         Yields:
             SpeechEvent objects with interim and final transcriptions
         """
-        audio_frames = []
-        frame_count = 0
+        ring: Optional[PcmRingBuffer] = None
+        resampler: Optional[PolyphaseResampler] = None
+        sample_rate = num_channels = 0
+        total_duration = 0.0
+        decoded_duration = 0.0
+        agreement = StablePrefixAgreement()
+        last_interim = ""
+        
+        frame_iter = buffer.__aiter__()
+        next_frame = asyncio.ensure_future(frame_iter.__anext__())
+        decode_task: Optional[asyncio.Task] = None
+        speculative_task: Optional[asyncio.Task] = None
+        language_id_task: Optional[asyncio.Task] = None
+        identify = language is None and self._needs_language_id()
+        upload = websocket
+        
+        def decode_window():
+            if upload is not None:
+                return self._decode_upload(upload, language=language)
+            return self._transcribe_pcm(self._ring_window(ring), language=language)
+        
+        def is_sliding() -> bool:
+            # The server keeps the whole utterance, only the local buffer slides
+            return (
+                upload is None
+                and ring.drop_policy == "drop_oldest"
+                and ring.dropped_samples > 0
+            )
         
         try:
-            async for audio_frame in buffer:
-                audio_frames.append(audio_frame)
-                frame_count += 1
+            while True:
+                waiters = {next_frame}
+                if decode_task is not None:
+                    waiters.add(decode_task)
+                if language_id_task is not None:
+                    waiters.add(language_id_task)
+                done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                
+                if language_id_task is not None and language_id_task in done:
+                    # Decodes use the identified language from now on, or keep
+                    # the current one if identification was inconclusive
+                    language_id_task = None
+                    identify = False
                 
-                # Process when we have enough frames for a chunk
-                if frame_count >= self._frames_per_chunk:
+                if decode_task is not None and decode_task in done:
+                    window_result = {}
                     try:
-                        # Merge frames into a buffer
-                        chunk_buffer = utils.merge_frames(audio_frames)
-                        
-                        # Convert to WAV and transcribe
-                        wav_data = await self._buffer_to_wav(chunk_buffer)
-                        result = await self._transcribe_audio(wav_data)
-                        
-                        # Parse result and yield as interim transcript
-                        event = await self._parse_transcription_result(result, is_interim=True)
-                        if self._has_meaningful_content(event):
-                            yield event
-                        
-                        # Keep overlap frames for next chunk
-                        if self._overlap_frames > 0 and len(audio_frames) > self._overlap_frames:
-                            audio_frames = audio_frames[-self._overlap_frames:]
-                            frame_count = len(audio_frames)
-                        else:
-                            audio_frames = []
-                            frame_count = 0
-                        
+                        window_result = decode_task.result()
+                        text = self._extract_text(window_result)
                     except Exception as e:
-                        logger.error(f"Error processing streaming chunk: {e}")
-                        # Clear frames and continue on error
-                        audio_frames = audio_frames[-10:] if len(audio_frames) > 10 else []
-                        frame_count = len(audio_frames)
-                        continue
-            
-            # Process any remaining frames as final transcript
-            if len(audio_frames) > 5:  # Minimum frames for meaningful audio
-                try:
-                    final_buffer = utils.merge_frames(audio_frames)
-                    wav_data = await self._buffer_to_wav(final_buffer)
-                    result = await self._transcribe_audio(wav_data)
+                        logger.error(f"Error processing streaming window: {e}")
+                        text = ""
+                    decode_task = None
                     
-                    event = await self._parse_transcription_result(result, is_interim=False)
-                    if self._has_meaningful_content(event):
-                        yield event
-                        
+                    if text:
+                        agreement.update(text, sliding=is_sliding())
+                        interim_text = agreement.text
+                        if interim_text and interim_text != last_interim and not self._gate_drops(
+                            interim_text,
+                            duration=decoded_duration,
+                            language=language,
+                            result=window_result,
+                            voiced_duration=self._voiced_duration(self._ring_window(ring)),
+                            is_interim=True,
+                        ):
+                            last_interim = interim_text
+                            yield self._create_speech_event(
+                                interim_text, language=language, is_interim=True
+                            )
+                
+                if next_frame not in done:
+                    continue
+                
+                try:
+                    audio_frame = next_frame.result()
+                except StopAsyncIteration:
+                    break
+                
+                next_frame = asyncio.ensure_future(frame_iter.__anext__())
+                
+                if audio_frame is UtteranceMarker.SILENCE_STARTED:
+                    if (
+                        self._speculative
+                        and speculative_task is None
+                        and ring is not None
+                        and not identify
+                    ):
+                        self._stats.speculative_started += 1
+                        speculative_task = asyncio.create_task(decode_window())
+                    continue
+                
+                if audio_frame is UtteranceMarker.SPEECH_RESUMED:
+                    if speculative_task is not None:
+                        speculative_task.cancel()
+                        speculative_task = None
+                        self._stats.speculative_wasted += 1
+                    continue
+                
+                if ring is None:
+                    sample_rate = self._sample_rate or audio_frame.sample_rate
+                    num_channels = 1 if self._sample_rate else audio_frame.num_channels
+                    ring = PcmRingBuffer(
+                        sample_rate,
+                        self._streaming_buffer_duration,
+                        num_channels=num_channels,
+                        drop_policy=self._streaming_drop_policy,
+                    )
+                    if self._sample_rate:
+                        resampler = PolyphaseResampler(
+                            audio_frame.sample_rate, self._sample_rate, audio_frame.num_channels
+                        )
+                    if upload is not None:
+                        upload = await self._start_upload(upload, sample_rate, num_channels)
+                
+                # Resample as frames arrive so decodes only have to upload
+                samples = np.frombuffer(audio_frame.data, dtype=np.int16)
+                pcm = resampler.push(samples) if resampler else samples
+                was_full = ring.full
+                ring.write(pcm)
+                if upload is not None:
+                    upload = await self._send_upload(upload, pcm, sample_rate * num_channels)
+                if ring.full and not was_full and ring.drop_policy == "drop_oldest":
+                    # The start of the utterance leaves the window, keep what it said
+                    agreement.commit_all()
+                total_duration += audio_frame.samples_per_channel / audio_frame.sample_rate
+                
+                if (
+                    identify
+                    and language_id_task is None
+                    and ring.duration >= self._language_id_duration
+                ):
+                    language_id_task = asyncio.create_task(self._identify_language(
+                        self._ring_window(ring).head(self._language_id_duration)
+                    ))
+                
+                # Only one window decode in flight; skipped windows are covered by the next one
+                if (
+                    self._interim_results
+                    and not identify
+                    and decode_task is None
+                    and total_duration - decoded_duration >= self._streaming_chunk_duration
+                    and not (ring.full and ring.drop_policy == "drop_newest" and decoded_duration)
+                ):
+                    decoded_duration = total_duration
+                    decode_task = asyncio.create_task(decode_window())
+            
+            # The final decode supersedes any window still in flight
+            if decode_task is not None:
+                decode_task.cancel()
+                decode_task = None
+            
+            if total_duration < self._streaming_min_duration:
+                if upload is not None:
+                    await self._cancel_upload(upload)
+                return
+            
+            if resampler is not None:
+                pcm = resampler.flush()
+                ring.write(pcm)
+                if upload is not None:
+                    upload = await self._send_upload(upload, pcm, sample_rate * num_channels)
+            
+            if identify:
+                # Short utterances end before enough audio for identification arrived
+                await (language_id_task or self._identify_language(self._ring_window(ring)))
+                language_id_task = None
+            
+            text = ""
+            result: dict = {}
+            if speculative_task is not None:
+                # Speech did not resume, so the speculative decode covers the utterance
+                try:
+                    result = await speculative_task
+                    text = self._extract_text(result)
+                except Exception as e:
+                    logger.error(f"Error in speculative decode: {e}")
+                speculative_task = None
+                if text:
+                    self._stats.speculative_used += 1
+                    if upload is not None:
+                        await self._cancel_upload(upload)
+                else:
+                    self._stats.speculative_wasted += 1
+            
+            if not text and upload is not None:
+                try:
+                    result = await self._decode_upload(upload, language=language, commit=True)
+                    text = self._extract_text(result)
+                except Exception as e:
+                    logger.warning(f"WebSocket commit failed, sending the utterance over HTTP: {e}")
+                    upload = None
+            
+            if not text and upload is None:
+                try:
+                    result = await self._transcribe_pcm(self._ring_window(ring), language=language)
+                    text = self._extract_text(result)
                 except Exception as e:
                     logger.error(f"Error processing final audio frames: {e}")
+            
+            if ring.dropped_samples:
+                dropped = ring.dropped_samples / (sample_rate * num_channels)
+                self._stats.dropped_seconds += dropped
+                logger.warning(
+                    f"Utterance exceeded the {self._streaming_buffer_duration}s buffer, "
+                    f"{dropped:.1f}s dropped ({ring.drop_policy})"
+                )
+            
+            if text:
+                text = agreement.final_text(text, sliding=is_sliding())
+            
+            # Fall back to the last interim hypothesis if the final decode failed
+            text = text or agreement.text
+            if text and self._gate_drops(
+                text,
+                duration=total_duration,
+                language=language,
+                result=result,
+                voiced_duration=self._voiced_duration(self._ring_window(ring)),
+            ):
+                return
+            
+            if text:
+                logger.info(f"Transcribed (final): {text}")
+                yield self._create_speech_event(text, language=language)
                     
         except Exception as e:
             logger.error(f"Error in stream recognition: {e}")
             yield self._create_empty_speech_event()
+        finally:
+            next_frame.cancel()
+            if decode_task is not None:
+                decode_task.cancel()
+            if speculative_task is not None:
+                speculative_task.cancel()
+            if language_id_task is not None:
+                language_id_task.cancel()
+
+    async def _start_upload(
+        self,
+        upload: WhisperWebSocketClient,
+        sample_rate: int,
+        num_channels: int,
+    ) -> Optional[WhisperWebSocketClient]:
+        """Begin an utterance on the WebSocket, None if the utterance has to use HTTP"""
+        try:
+            await upload.start(sample_rate=sample_rate, num_channels=num_channels)
+            return upload
+        except Exception as e:
+            logger.warning(f"WebSocket unavailable, sending the utterance over HTTP: {e}")
+            return None
+
+    async def _send_upload(
+        self,
+        upload: WhisperWebSocketClient,
+        pcm: np.ndarray,
+        samples_per_second: int,
+    ) -> Optional[WhisperWebSocketClient]:
+        """Send samples on the WebSocket, None once the utterance has to use HTTP"""
+        try:
+            await upload.send_audio(pcm)
+        except Exception as e:
+            logger.warning(f"WebSocket send failed, sending the utterance over HTTP: {e}")
+            return None
+        self._stats.uploaded_seconds += len(pcm) / samples_per_second
+        return upload
 
-    async def _buffer_to_wav(self, buffer: AudioBuffer) -> bytes:
+    async def _cancel_upload(self, upload: WhisperWebSocketClient) -> None:
+        try:
+            await upload.cancel()
+        except Exception as e:
+            logger.debug(f"Could not cancel the WebSocket utterance: {e}")
+
+    async def _decode_upload(
+        self,
+        upload: WhisperWebSocketClient,
+        *,
+        language: Optional[str] = None,
+        commit: bool = False,
+    ) -> dict:
+        """Decode the audio already sent over the WebSocket"""
+        self._stats.requests += 1
+        language = language or self._language
+        if commit:
+            return await upload.commit(language=language)
+        return await upload.decode(language=language)
+
+    def _ring_window(self, ring: PcmRingBuffer) -> PcmAudio:
+        """
+        Wrap the buffered audio for a decode running alongside new writes
+        
+        Views are only safe while writes cannot overwrite them, so a window is
+        copied once less than half the buffer is free under 'drop_oldest'.
+        """
+        window = ring.view()
+        if ring.drop_policy == "drop_oldest" and ring.remaining < ring.duration:
+            window = window.copy()
+        return PcmAudio.from_arrays([window], ring.sample_rate, ring.num_channels)
+
+    async def _transcribe_pcm(
+        self,
+        audio: PcmAudio,
+        *,
+        language: Optional[str] = None,
+    ) -> dict:
         """
-        Convert AudioBuffer to WAV format bytes
+        Trim and transcribe PCM audio
         
         Args:
-            buffer: AudioBuffer to convert
+            audio: Audio to transcribe
+            language: Optional language override
             
         Returns:
-            WAV format audio data as bytes
+            API response dictionary, empty if the audio held no speech
         """
-        io_buffer = io.BytesIO()
+        if self._trimmer is not None:
+            audio = self._trim(audio)
+            if not audio.chunks:
+                return {}
         
-        with wave.open(io_buffer, "wb") as wav_file:
-            wav_file.setnchannels(buffer.num_channels)
-            wav_file.setsampwidth(2)  # 16-bit
-            wav_file.setframerate(buffer.sample_rate)
-            wav_file.writeframes(buffer.data)
+        return await self._transcribe_split(audio, language=language)
+
+    def _gate_drops(
+        self,
+        text: str,
+        *,
+        duration: float,
+        language: Optional[str],
+        result: Union[dict, list],
+        voiced_duration: Optional[float] = None,
+        is_interim: bool = False,
+    ) -> bool:
+        """
+        Run a transcript through the gate, True if it must not reach the session
+        
+        Interim transcripts are gated too, a hallucinated one could otherwise
+        interrupt the agent before the final transcript is dropped.
+        """
+        if self._gate is None:
+            return False
+        
+        if isinstance(result, list):
+            result = result[0] if result else {}
+        findings = self._gate.check(
+            text,
+            duration=duration,
+            language=language or self._language,
+            segments=result.get("segments") if isinstance(result, dict) else None,
+            voiced_duration=voiced_duration,
+            interim=is_interim,
+        )
+        if findings is None:
+            return False
+        if is_interim:
+            logger.info(f"Dropped interim transcript '{text}' ({', '.join(findings)})")
+            return True
+        
+        # A dropped final transcript is one LLM and one TTS turn that never start
+        self._stats.llm_turns_avoided += 1
+        self._stats.tts_turns_avoided += 1
+        logger.info(f"Dropped transcript '{text}' ({', '.join(findings)})")
+        return True
+
+    def _voiced_duration(self, audio: PcmAudio) -> Optional[float]:
+        """Seconds of `audio` that hold speech for the gate, None when it is not measured"""
+        if self._gate is None or not audio.chunks:
+            return None
+        return self._voice_meter.voiced_duration(audio)
+
+    def _needs_language_id(self) -> bool:
+        """Whether the language still has to be identified"""
+        return self._detect_language and not self._language_identified
+
+    async def _identify_language(self, audio: PcmAudio) -> Optional[str]:
+        """
+        Identify the language of a short clip and switch to it
+        
+        The clip is decoded without a language so the endpoint detects it.
+        The first conclusive answer among `language_id_candidates` becomes the
+        instance language, and "language_detected" is emitted if it changed.
+        
+        Args:
+            audio: The first seconds of an utterance
+            
+        Returns:
+            The identified language, None if the clip was inconclusive
+        """
+        async with self._language_id_lock:
+            # Another utterance may have identified it while this one waited
+            if self._language_identified:
+                return self._language
+            
+            self._stats.language_id_requests += 1
+            # The fastest tier is enough to tell the language from a short clip
+            url = self._model_tiers[0].url if self._model_tiers else None
+            result = await self._transcribe_audio(audio, detect_language=True, url=url)
+            detected = self._detected_language(result)
+            if detected is None:
+                logger.debug("Language identification was inconclusive")
+                return None
+            
+            self._language_identified = True
+            if detected != self._language:
+                logger.info(f"Identified language '{detected}', switching from '{self._language}'")
+                self._language = detected
+                self._stats.language_switches += 1
+                self.emit("language_detected", detected)
+            return detected
+
+    def _detected_language(self, result: Union[dict, list]) -> Optional[str]:
+        """Language reported by the endpoint, or guessed from the script of the text"""
+        if isinstance(result, list):
+            result = result[0] if result else {}
+        
+        reported = str(result.get("language") or "").lower()
+        reported = LANGUAGE_CODES.get(reported, reported)
+        if reported in self._language_id_candidates:
+            return reported
+        
+        # Persian and English are told apart by their script alone
+        text = str(result.get("text") or "")
+        persian = len(_persian_script_pattern.findall(text))
+        latin = len(_latin_script_pattern.findall(text))
+        if not persian and not latin:
+            return None
+        guessed = "fa" if persian > latin else "en"
+        return guessed if guessed in self._language_id_candidates else None
+
+    def _prepare_audio(self, audio: PcmAudio) -> PcmAudio:
+        """Downmix, resample and trim a complete buffer before upload"""
+        # Whisper decodes 16 kHz mono, resample here instead of on the GPU server
+        if self._sample_rate:
+            audio = resample_audio(audio, self._sample_rate)
+        if self._trimmer is not None:
+            audio = self._trim(audio)
+        return audio
+
+    def _trim(self, audio: PcmAudio) -> PcmAudio:
+        """Trim silence and count the seconds that will not be uploaded"""
+        trimmed = self._trimmer.trim(audio)
+        self._stats.trimmed_seconds += audio.duration - trimmed.duration
+        if not trimmed.chunks:
+            self._stats.skipped_silent += 1
+            logger.debug(f"Skipping {audio.duration:.2f}s of audio without speech")
+        return trimmed
+
+    async def _transcribe_split(
+        self,
+        audio: PcmAudio,
+        *,
+        language: Optional[str] = None,
+    ) -> dict:
+        """
+        Transcribe audio, as concurrent pieces if it is long enough to split
         
-        return io_buffer.getvalue()
+        Pieces are cut at quiet points, extended by `split_overlap` on both
+        sides and decoded with at most `split_max_parallel` requests in flight.
+        Their texts are joined in order with the words decoded twice at each
+        boundary removed, so the latency is close to that of the longest piece.
+        
+        Args:
+            audio: Prepared PCM audio
+            language: Optional language override
+            
+        Returns:
+            API response dictionary; for split audio the stitched text together
+            with the segments of all pieces
+        """
+        if not self._split_long_audio or audio.duration <= self._split_max_duration:
+            return await self._transcribe_routed(audio, language=language)
+        
+        samples = audio.as_array()
+        channels = audio.num_channels
+        mono = samples.reshape(-1, channels).mean(axis=1) if channels > 1 else samples
+        cuts = find_split_points(
+            mono,
+            audio.sample_rate,
+            max_piece=self._split_max_duration,
+            min_piece=self._split_min_duration,
+        )
+        if not cuts:
+            return await self._transcribe_routed(audio, language=language)
+        
+        overlap = int(self._split_overlap * audio.sample_rate)
+        bounds = zip([0] + cuts, cuts + [len(mono)])
+        pieces = [
+            PcmAudio.from_arrays(
+                [samples[max(0, start - overlap) * channels:(end + overlap) * channels]],
+                audio.sample_rate,
+                channels,
+            )
+            for start, end in bounds
+        ]
+        self._stats.split_utterances += 1
+        self._stats.split_pieces += len(pieces)
+        
+        async def transcribe_piece(piece: PcmAudio) -> dict:
+            async with self._split_semaphore:
+                return await self._transcribe_routed(piece, language=language)
+        
+        results = await asyncio.gather(*(transcribe_piece(piece) for piece in pieces))
+        
+        results = [
+            (result[0] if result else {}) if isinstance(result, list) else result
+            for result in results
+        ]
+        words: list[str] = []
+        segments: list = []
+        for result in results:
+            words = merge_overlapping_words(words, self._extract_text(result).split())
+            segments.extend(result.get("segments") or [])
+        
+        return {**results[0], "text": " ".join(words), "segments": segments}
+
+    async def _transcribe_routed(
+        self,
+        audio: PcmAudio,
+        *,
+        language: Optional[str] = None,
+    ) -> dict:
+        """
+        Transcribe audio on the first model tier that suits it
+        
+        Tiers whose `max_duration` is shorter than the audio are skipped. A
+        failed request, or a result below the tier's `min_confidence`, is
+        decoded again by the next tier; the last tier's answer is always used.
+        Without tiers the audio goes to `api_url` as before.
+        
+        Args:
+            audio: Prepared PCM audio
+            language: Optional language override
+            
+        Returns:
+            API response dictionary of the tier that answered
+        """
+        if not self._model_tiers:
+            return await self._transcribe_audio(audio, language=language)
+        
+        stats = self._routing_stats
+        last = len(self._model_tiers) - 1
+        result: Union[dict, list] = {}
+        for index, tier in enumerate(self._model_tiers):
+            if index < last and tier.max_duration is not None and audio.duration > tier.max_duration:
+                stats.skipped_by_length += 1
+                continue
+            
+            stats.requests[tier.name] = stats.requests.get(tier.name, 0) + 1
+            result = await self._transcribe_audio(audio, language=language, url=tier.url)
+            if index == last:
+                break
+            if not result:
+                stats.escalated_by_failure += 1
+                logger.warning(f"Model tier '{tier.name}' failed, escalating")
+                continue
+            if tier.min_confidence is not None:
+                confidence = transcript_confidence(result)
+                if confidence is not None and confidence < tier.min_confidence:
+                    stats.escalated_by_confidence += 1
+                    logger.debug(
+                        f"Model tier '{tier.name}' confidence {confidence:.2f} "
+                        f"below {tier.min_confidence:.2f}, escalating"
+                    )
+                    continue
+            break
+        
+        if result:
+            stats.answered[tier.name] = stats.answered.get(tier.name, 0) + 1
+        return result
 
     async def _transcribe_audio(
         self, 
-        audio_data: bytes
+        audio: PcmAudio,
+        *,
+        language: Optional[str] = None,
+        detect_language: bool = False,
+        url: Optional[str] = None,
     ) -> dict:
         """
         Send audio to Whisper endpoint for transcription
         
+        The body is streamed as a chunked upload instead of being assembled
+        in memory first. If the endpoint answers 415 to a compressed codec it
+        is remembered as WAV-only and the request is sent again as WAV.
+        
         Args:
-            audio_data: WAV format audio data
+            audio: PCM audio to upload
+            language: Optional language override
+            detect_language: Send no language so the endpoint detects it
+            url: Endpoint of a model tier, defaults to `api_url`; tier
+                requests are never batched
             
         Returns:
             API response dictionary
         """
+        self._stats.requests += 1
+        self._stats.uploaded_seconds += audio.duration
+        request_language = None if detect_language else language or self._language
+        
+        if self._batch_url and url is None:
+            try:
+                return await self._batch_dispatcher().transcribe(
+                    audio,
+                    codec=self._endpoint_codecs.get(self._batch_url, self._upload_codec),
+                    bitrate=self._upload_bitrate,
+                    language=request_language,
+                )
+            except WhisperBatchError as e:
+                logger.warning(f"Batched transcription failed, sending on its own: {e}")
+        
         session = self._http_session or aiohttp.ClientSession()
         
         try:
+            # Use the single file transcription endpoint
+            # url = f"{self._api_url}/transcribe_single/"
+            
+            url = url or self._api_url
+            codec = self._endpoint_codecs.get(url, self._upload_codec)
+            
             # Prepare multipart form data
             data = aiohttp.FormData()
             data.add_field(
                 'file', 
-                audio_data, 
-                filename='audio.wav', 
-                content_type='audio/wav'
+                iter_encoded(audio, codec, bitrate=self._upload_bitrate), 
+                filename=codec.filename, 
+                content_type=codec.content_type
             )
             
-            # Add language parameter from instance
-            data.add_field('language', self._language)
-            
-            # Use the single file transcription endpoint
-            # url = f"{self._api_url}/transcribe_single/"
-            
-            url = self._api_url
+            # Add language parameter, falling back to the instance language
+            if request_language:
+                data.add_field('language', request_language)
             
             async with session.post(
                 url,
@@ -234,10 +1110,17 @@ class WhisperEndpointSTT(stt.STT):
                 if response.status == 200:
                     result = await response.json()
                     return result
-                else:
-                    error_text = await response.text()
+                
+                error_text = await response.text()
+                if response.status != 415 or codec.container is None:
                     logger.error(f"Whisper endpoint error {response.status}: {error_text}")
                     return {}
+            
+            logger.warning(f"Whisper endpoint {url} does not accept {codec.name}, falling back to wav")
+            self._endpoint_codecs[url] = UPLOAD_CODECS["wav"]
+            return await self._transcribe_audio(
+                audio, language=language, detect_language=detect_language, url=url
+            )
                     
         except asyncio.TimeoutError:
             logger.error("Timeout while calling Whisper endpoint")
@@ -249,10 +1132,22 @@ class WhisperEndpointSTT(stt.STT):
             if not self._http_session:
                 await session.close()
 
+    def _batch_dispatcher(self) -> WhisperBatchDispatcher:
+        """Return the worker-wide dispatcher for the batch endpoint"""
+        return get_batch_dispatcher(
+            self._batch_url,
+            max_batch_size=self._batch_max_size,
+            max_wait=self._batch_max_wait,
+        )
+
     async def _parse_transcription_result(
         self, 
         result: dict, 
-        is_interim: bool = False
+        is_interim: bool = False,
+        *,
+        language: Optional[str] = None,
+        duration: Optional[float] = None,
+        voiced_duration: Optional[float] = None,
     ) -> stt.SpeechEvent:
         """
         Parse transcription result from Whisper endpoint
@@ -260,53 +1155,77 @@ class WhisperEndpointSTT(stt.STT):
         Args:
             result: API response dictionary
             is_interim: Whether this is an interim result
+            language: Language to report, defaults to the instance language
+            duration: Seconds of audio decoded; transcripts are only gated
+                when it is known
+            voiced_duration: Seconds of that audio holding speech, if measured
             
         Returns:
             SpeechEvent with parsed transcription
         """
         try:
-            # Handle different response formats
-            if isinstance(result, list) and len(result) > 0:
-                # Array format response
-                transcription = result[0]
-            elif isinstance(result, dict):
-                # Direct dictionary format
-                transcription = result
-            else:
-                return self._create_empty_speech_event()
-            
-            # Extract text from transcription
-            text = ""
-            if "text" in transcription:
-                text = transcription["text"].strip()
+            text = self._extract_text(result)
             
             if not text:
                 return self._create_empty_speech_event()
             
-            # Determine event type
-            event_type = (
-                stt.SpeechEventType.INTERIM_TRANSCRIPT 
-                if is_interim 
-                else stt.SpeechEventType.FINAL_TRANSCRIPT
-            )
-            
-            # Create speech data with instance language
-            speech_data = stt.SpeechData(
-                text=text,
-                language=self._language
-            )
+            if duration is not None and self._gate_drops(
+                text,
+                duration=duration,
+                language=language,
+                result=result,
+                voiced_duration=voiced_duration,
+                is_interim=is_interim,
+            ):
+                return self._create_empty_speech_event()
             
             logger.info(f"Transcribed ({'interim' if is_interim else 'final'}): {text}")
             
-            return stt.SpeechEvent(
-                type=event_type,
-                alternatives=[speech_data],
-            )
+            return self._create_speech_event(text, language=language, is_interim=is_interim)
             
         except Exception as e:
             logger.error(f"Error parsing transcription result: {e}")
             return self._create_empty_speech_event()
 
+    def _extract_text(self, result: dict) -> str:
+        """Extract the stripped text from a list or dictionary shaped response"""
+        # Handle different response formats
+        if isinstance(result, list) and len(result) > 0:
+            # Array format response
+            transcription = result[0]
+        elif isinstance(result, dict):
+            # Direct dictionary format
+            transcription = result
+        else:
+            return ""
+        
+        return (transcription.get("text") or "").strip()
+
+    def _create_speech_event(
+        self,
+        text: str,
+        *,
+        language: Optional[str] = None,
+        is_interim: bool = False,
+    ) -> stt.SpeechEvent:
+        """Create an interim or final speech event for the given text"""
+        event_type = (
+            stt.SpeechEventType.INTERIM_TRANSCRIPT 
+            if is_interim 
+            else stt.SpeechEventType.FINAL_TRANSCRIPT
+        )
+        
+        return stt.SpeechEvent(
+            type=event_type,
+            alternatives=[stt.SpeechData(text=text, language=language or self._language)],
+        )
+
+    def _resolve_language(self, language: NotGivenOr[Optional[str]]) -> Optional[str]:
+        """Return the requested language or the instance language"""
+        if is_given(language) and language:
+            return language
+        return self._language
+
     def _create_empty_speech_event(self) -> stt.SpeechEvent:
         """Create an empty speech event for error cases"""
         return stt.SpeechEvent(
@@ -327,3 +1246,127 @@ class WhisperEndpointSTT(stt.STT):
         if self._http_session and not self._http_session.closed:
             await self._http_session.close()
             logger.info("Closed HTTP session")
+
+
+class WhisperRecognizeStream(stt.RecognizeStream):
+    """
+    Recognition stream that segments utterances with a VAD
+    
+    Audio of each utterance is forwarded to `_stream_recognize_impl` while the
+    user is still speaking, so interim transcripts are available before the
+    VAD reports the end of speech.
+    """
+    
+    def __init__(
+        self,
+        *,
+        stt: WhisperEndpointSTT,
+        vad: VAD,
+        language: Optional[str],
+        conn_options: APIConnectOptions,
+    ) -> None:
+        super().__init__(stt=stt, conn_options=conn_options)
+        self._whisper_stt = stt
+        self._vad = vad
+        self._language = language
+
+    async def _run(self) -> None:
+        vad_stream = self._vad.stream()
+        utterance_tasks: list[asyncio.Task] = []
+        # One connection for the whole session, opened with the first utterance
+        websocket = (
+            WhisperWebSocketClient(
+                self._whisper_stt._ws_url, http_session=self._whisper_stt._http_session
+            )
+            if self._whisper_stt._ws_url
+            else None
+        )
+
+        async def _forward_input() -> None:
+            """Forward input frames to the VAD"""
+            async for frame in self._input_ch:
+                if isinstance(frame, self._FlushSentinel):
+                    vad_stream.flush()
+                    continue
+                vad_stream.push_frame(frame)
+            
+            vad_stream.end_input()
+
+        async def _recognize_utterance(
+            frames: utils.aio.Chan[Union[rtc.AudioFrame, UtteranceMarker]],
+            previous: Optional[asyncio.Task],
+        ) -> None:
+            """Forward the events of one utterance, after those of the previous one"""
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            
+            async for event in self._whisper_stt._stream_recognize_impl(
+                frames, language=self._language, websocket=websocket
+            ):
+                if self._whisper_stt._has_meaningful_content(event):
+                    self._event_ch.send_nowait(event)
+
+        async def _segment() -> None:
+            """Split the VAD events into utterances"""
+            frames: Optional[utils.aio.Chan[Union[rtc.AudioFrame, UtteranceMarker]]] = None
+            silence_duration = 0.0
+            in_silence = False
+            
+            async for event in vad_stream:
+                if event.type == VADEventType.START_OF_SPEECH:
+                    self._event_ch.send_nowait(
+                        stt.SpeechEvent(type=stt.SpeechEventType.START_OF_SPEECH)
+                    )
+                    frames = utils.aio.Chan[Union[rtc.AudioFrame, UtteranceMarker]]()
+                    silence_duration = 0.0
+                    in_silence = False
+                    previous = utterance_tasks[-1] if utterance_tasks else None
+                    utterance_tasks.append(
+                        asyncio.create_task(_recognize_utterance(frames, previous))
+                    )
+                    for frame in event.frames:
+                        frames.send_nowait(frame)
+                
+                elif event.type == VADEventType.INFERENCE_DONE and frames is not None:
+                    for frame in event.frames:
+                        frames.send_nowait(frame)
+                    
+                    # Tell the recognizer when a silence that may end the utterance begins
+                    if event.probability < self._whisper_stt._speculative_threshold:
+                        silence_duration += sum(
+                            frame.samples_per_channel / frame.sample_rate for frame in event.frames
+                        )
+                        if not in_silence and silence_duration >= self._whisper_stt._speculative_delay:
+                            in_silence = True
+                            frames.send_nowait(UtteranceMarker.SILENCE_STARTED)
+                    else:
+                        silence_duration = 0.0
+                        if in_silence:
+                            in_silence = False
+                            frames.send_nowait(UtteranceMarker.SPEECH_RESUMED)
+                
+                elif event.type == VADEventType.END_OF_SPEECH and frames is not None:
+                    self._event_ch.send_nowait(
+                        stt.SpeechEvent(type=stt.SpeechEventType.END_OF_SPEECH)
+                    )
+                    frames.close()
+                    frames = None
+            
+            if frames is not None:
+                frames.close()
+            
+            # Let pending utterances deliver their final transcripts
+            if utterance_tasks:
+                await asyncio.gather(*utterance_tasks, return_exceptions=True)
+
+        tasks = [
+            asyncio.create_task(_forward_input(), name="forward_input"),
+            asyncio.create_task(_segment(), name="segment"),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await utils.aio.cancel_and_wait(*tasks, *utterance_tasks)
+            await vad_stream.aclose()
+            if websocket is not None:
+                await websocket.aclose()
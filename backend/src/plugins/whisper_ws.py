@@ -0,0 +1,155 @@
+import asyncio
+import itertools
+import json
+import logging
+from typing import Optional, Union
+
+import aiohttp
+import numpy as np
+
+
+logger = logging.getLogger("whisper-websocket")
+
+
+class WhisperWebSocketError(Exception):
+    """Raised to every pending request when the WebSocket fails or closes."""
+
+
+class WhisperWebSocketClient:
+    """
+    Persistent WebSocket to a Whisper server that receives audio while the user speaks
+
+    One connection is kept per session and reused by its utterances, which are
+    sent one after the other:
+
+        {"type": "start", "sample_rate": 16000, "num_channels": 1}
+        <binary int16 PCM frames>
+        {"type": "decode", "id": 1, "language": "fa"}    decode what was sent so far
+        <more binary frames>
+        {"type": "commit", "id": 2, "language": "fa"}    final decode, ends the utterance
+
+    Every decode and commit is answered with {"type": "result", "id": ..., ...}
+    holding the same fields as the HTTP endpoint's JSON, or with
+    {"type": "error", "id": ..., "message": ...}. {"type": "cancel"} drops the
+    utterance without decoding it, and so does the next "start".
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        http_session: Optional[aiohttp.ClientSession] = None,
+        timeout: float = 30.0,
+        heartbeat: float = 20.0,
+    ):
+        self._url = url
+        self._http_session = http_session
+        self._owns_session = http_session is None
+        self._timeout = timeout
+        self._heartbeat = heartbeat
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    async def start(self, *, sample_rate: int, num_channels: int) -> None:
+        """Begin a new utterance, connecting first if needed."""
+        await self._connect()
+        await self._send_json({
+            "type": "start",
+            "sample_rate": sample_rate,
+            "num_channels": num_channels,
+        })
+
+    async def send_audio(self, samples: Union[np.ndarray, memoryview, bytes]) -> None:
+        """Send interleaved int16 samples of the current utterance."""
+        if isinstance(samples, np.ndarray):
+            samples = memoryview(samples).cast("B")
+        if not len(samples):
+            return
+        if not self.connected:
+            raise WhisperWebSocketError("WebSocket is not connected")
+        await self._ws.send_bytes(samples)
+
+    async def decode(self, *, language: Optional[str] = None) -> dict:
+        """Decode the audio sent so far without ending the utterance."""
+        return await self._request("decode", language)
+
+    async def commit(self, *, language: Optional[str] = None) -> dict:
+        """Decode the whole utterance and end it."""
+        return await self._request("commit", language)
+
+    async def cancel(self) -> None:
+        """End the utterance without decoding it."""
+        if self.connected:
+            await self._send_json({"type": "cancel"})
+
+    async def _request(self, kind: str, language: Optional[str]) -> dict:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send_json({"type": kind, "id": request_id, "language": language})
+            return await asyncio.wait_for(future, self._timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _send_json(self, message: dict) -> None:
+        if not self.connected:
+            raise WhisperWebSocketError("WebSocket is not connected")
+        await self._ws.send_str(json.dumps(message))
+
+    async def _connect(self) -> None:
+        async with self._connect_lock:
+            if self.connected:
+                return
+            if self._http_session is None or self._http_session.closed:
+                self._http_session = aiohttp.ClientSession()
+            try:
+                self._ws = await self._http_session.ws_connect(
+                    self._url,
+                    heartbeat=self._heartbeat,
+                    timeout=aiohttp.ClientWSTimeout(ws_close=self._timeout),
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise WhisperWebSocketError(f"Could not connect to {self._url}: {e}") from e
+            self._reader_task = asyncio.create_task(self._read(self._ws))
+            logger.info(f"Connected to Whisper WebSocket {self._url}")
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse) -> None:
+        """Resolve pending requests with the results as they arrive"""
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                try:
+                    message = json.loads(msg.data)
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring non-JSON message: {msg.data[:100]}")
+                    continue
+
+                future = self._pending.get(message.get("id"))
+                if future is None or future.done():
+                    continue
+                if message.get("type") == "error":
+                    future.set_exception(WhisperWebSocketError(message.get("message", "decode failed")))
+                else:
+                    future.set_result(message)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(WhisperWebSocketError("WebSocket closed"))
+            logger.info(f"Whisper WebSocket {self._url} closed")
+
+    async def aclose(self) -> None:
+        if self._ws is not None and not self._ws.closed:
+            await self._ws.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+        if self._owns_session and self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
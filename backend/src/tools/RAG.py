@@ -3,8 +3,10 @@ from typing import List
 import aiohttp
 import asyncio
 import logging
+import os
 
-RAG_API_URL = "https://ml.demisco.ai/api/chat/" 
+# RAG_API_URL in the environment overrides it, read per call since .env is loaded after this import
+RAG_API_URL = "https://ml.demisco.ai/api/chat/"
 
 logger = logging.getLogger("RAG")
 
@@ -30,7 +32,7 @@ async def search_and_respond(query: str, knowledge_base_ids:  List[str] = ["3393
     try:
         # Call the RAG API to get the full prompt
         async with aiohttp.ClientSession() as session:
-            async with session.post(RAG_API_URL, json=payload, timeout=10) as response:
+            async with session.post(os.getenv("RAG_API_URL", RAG_API_URL), json=payload, timeout=10) as response:
                 if response.status != 200:
                     error_detail = await response.text()
                     logger.error(f"[RAG] API error {response.status}: {error_detail}")